@@ -0,0 +1,283 @@
+"""Cohort-wide counters kept up to date as marks are saved.
+
+Triggers on the ``selections`` and ``students`` tables maintain small
+aggregate tables (grade counts per section, tick counts per criterion, the
+students behind each criterion, each student's total, a histogram of totals
+and per-marker mark sums), so the dashboard reads a few hundred rows however
+large the cohort is, and every writer keeps them current: the app, the
+pre-check and reset alike.
+
+Only marked students are counted (``students.marked_at``): marking a student
+adds everything saved for them, and later saves are counted as they happen.
+Pre-check flags on a student nobody has finished count for nothing, and a
+section nobody saved counts at its top grade (see ``grade_distribution``).
+Per-marker sums leave out the pre-check's writes.
+
+The triggers grade a mask by looking it up in ``grade_bands``, which holds the
+compiled rubric: for a lab the key is the number of missing criteria, for the
+presentation it is 0, 1 or 2 for excellent, medium or bad (see
+``rubric_bits.weight``). ``install`` refreshes these tables and rebuilds the
+counters whenever the rubric changes.
+
+``section_times`` and ``marker_throughput`` summarize the active marking time
+kept by ``store.record_time``.
+"""
+
+import statistics
+
+import store
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS analytics_meta (name TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS rubric_bits (
+    section TEXT NOT NULL, bit INTEGER NOT NULL, weight INTEGER NOT NULL,
+    PRIMARY KEY (section, bit)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS grade_bands (
+    section TEXT NOT NULL, key INTEGER NOT NULL, grade TEXT NOT NULL, mark REAL NOT NULL,
+    PRIMARY KEY (section, key)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS grade_counts (
+    section TEXT NOT NULL, grade TEXT NOT NULL, students INTEGER NOT NULL,
+    PRIMARY KEY (section, grade)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS criterion_counts (
+    section TEXT NOT NULL, bit INTEGER NOT NULL, students INTEGER NOT NULL,
+    PRIMARY KEY (section, bit)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS criterion_students (
+    section TEXT NOT NULL, bit INTEGER NOT NULL, student_id TEXT NOT NULL,
+    PRIMARY KEY (section, bit, student_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS student_totals (student_id TEXT PRIMARY KEY, total REAL NOT NULL) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS total_counts (total REAL PRIMARY KEY, students INTEGER NOT NULL) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS marker_counts (
+    marker TEXT NOT NULL, section TEXT NOT NULL, sections INTEGER NOT NULL, mark_sum REAL NOT NULL,
+    PRIMARY KEY (marker, section)
+) WITHOUT ROWID;
+"""
+
+# Grade band key of a selections row, see the module docstring
+_KEY = (
+    "(SELECT COALESCE(CASE WHEN {r}.section = 'presentation' THEN MAX(weight) ELSE SUM(weight) END, 0) "
+    "FROM rubric_bits WHERE section = {r}.section AND ({r}.mask >> bit) & 1)"
+)
+_GRADE = "(SELECT grade FROM grade_bands WHERE section = {r}.section AND key = " + _KEY + ")"
+_MARK = "(SELECT mark FROM grade_bands WHERE section = {r}.section AND key = " + _KEY + ")"
+# Mark of a section nobody has saved (nothing selected)
+_DEFAULT = "(SELECT mark FROM grade_bands WHERE section = {r}.section AND key = 0)"
+
+_MARKED = "EXISTS (SELECT 1 FROM students WHERE student_id = {r}.student_id AND marked_at IS NOT NULL)"
+_SYSTEM = ", ".join(f"'{marker}'" for marker in store.SYSTEM_MARKERS)
+
+_REMOVE = """
+    UPDATE grade_counts SET students = students - 1 WHERE section = OLD.section AND grade = {grade};
+    UPDATE criterion_counts SET students = students - 1 WHERE section = OLD.section AND (OLD.mask >> bit) & 1;
+    DELETE FROM criterion_students WHERE section = OLD.section AND student_id = OLD.student_id;
+    UPDATE marker_counts SET sections = sections - 1, mark_sum = mark_sum - {mark}
+        WHERE marker = OLD.marker AND section = OLD.section;
+    UPDATE student_totals SET total = ROUND(total - {mark} + {default}, 2) WHERE student_id = OLD.student_id;
+""".format(grade=_GRADE, mark=_MARK, default=_DEFAULT).replace("{r}", "OLD")
+
+_ADD = """
+    INSERT INTO grade_counts VALUES (NEW.section, {grade}, 1)
+        ON CONFLICT DO UPDATE SET students = students + 1;
+    INSERT INTO criterion_counts SELECT NEW.section, bit, 1 FROM rubric_bits
+        WHERE section = NEW.section AND (NEW.mask >> bit) & 1
+        ON CONFLICT DO UPDATE SET students = students + 1;
+    INSERT INTO criterion_students SELECT NEW.section, bit, NEW.student_id FROM rubric_bits
+        WHERE section = NEW.section AND (NEW.mask >> bit) & 1;
+    INSERT INTO marker_counts SELECT NEW.marker, NEW.section, 1, {mark} WHERE NEW.marker NOT IN ({system})
+        ON CONFLICT DO UPDATE SET sections = sections + 1, mark_sum = mark_sum + excluded.mark_sum;
+    UPDATE student_totals SET total = ROUND(total - {default} + {mark}, 2) WHERE student_id = NEW.student_id;
+""".format(grade=_GRADE, mark=_MARK, default=_DEFAULT, system=_SYSTEM).replace("{r}", "NEW")
+
+
+def _add_marked(student):
+    # What _ADD does for one row, set-wise for every saved row of the marked
+    # students matching ``student`` (a column or NEW.student_id), plus their totals
+    grade, mark, default = (expr.replace("{r}", "s") for expr in (_GRADE, _MARK, _DEFAULT))
+    rows = f"FROM selections s JOIN students st USING (student_id) WHERE st.marked_at IS NOT NULL AND st.student_id = {student}"
+    bits = rows.replace(" WHERE ", " JOIN rubric_bits b ON b.section = s.section AND (s.mask >> b.bit) & 1 WHERE ", 1)
+    return [
+        f"INSERT INTO grade_counts SELECT s.section, {grade} AS grade, COUNT(*) {rows} GROUP BY s.section, grade "
+        "ON CONFLICT DO UPDATE SET students = students + excluded.students",
+        f"INSERT INTO criterion_students SELECT s.section, b.bit, s.student_id {bits}",
+        f"INSERT INTO criterion_counts SELECT s.section, b.bit, COUNT(*) {bits} GROUP BY s.section, b.bit "
+        "ON CONFLICT DO UPDATE SET students = students + excluded.students",
+        f"INSERT INTO marker_counts SELECT s.marker, s.section, COUNT(*), SUM({mark}) {rows} "
+        f"AND s.marker NOT IN ({_SYSTEM}) GROUP BY s.marker, s.section "
+        "ON CONFLICT DO UPDATE SET sections = sections + excluded.sections, mark_sum = mark_sum + excluded.mark_sum",
+        "INSERT INTO student_totals SELECT st.student_id, "
+        "ROUND((SELECT CAST(value AS REAL) FROM analytics_meta WHERE name = 'default_total') "
+        f"+ COALESCE(SUM({mark} - {default}), 0), 2) FROM students st LEFT JOIN selections s USING (student_id) "
+        f"WHERE st.marked_at IS NOT NULL AND st.student_id = {student} GROUP BY st.student_id",
+    ]
+
+
+# Undoes _add_marked for a student whose mark is withdrawn
+_REMOVE_STUDENT = """
+    UPDATE grade_counts SET students = students - 1
+        WHERE (section, grade) IN (SELECT s.section, {grade} FROM selections s WHERE s.student_id = OLD.student_id);
+    UPDATE criterion_counts SET students = students - 1 WHERE (section, bit) IN (
+        SELECT s.section, b.bit FROM selections s JOIN rubric_bits b ON b.section = s.section AND (s.mask >> b.bit) & 1
+        WHERE s.student_id = OLD.student_id);
+    DELETE FROM criterion_students WHERE student_id = OLD.student_id;
+    UPDATE marker_counts SET sections = sections - 1, mark_sum = mark_sum - (
+        SELECT {mark} FROM selections s WHERE s.student_id = OLD.student_id AND s.section = marker_counts.section)
+        WHERE (marker, section) IN (SELECT marker, section FROM selections WHERE student_id = OLD.student_id);
+    DELETE FROM student_totals WHERE student_id = OLD.student_id;
+""".format(grade=_GRADE, mark=_MARK).replace("{r}", "s")
+
+TRIGGERS = f"""
+CREATE TRIGGER IF NOT EXISTS selections_counted_insert AFTER INSERT ON selections
+WHEN {_MARKED.replace("{r}", "NEW")} BEGIN
+{_ADD}
+END;
+CREATE TRIGGER IF NOT EXISTS selections_counted_update AFTER UPDATE OF mask, marker ON selections
+WHEN {_MARKED.replace("{r}", "NEW")} BEGIN
+{_REMOVE}
+{_ADD}
+END;
+CREATE TRIGGER IF NOT EXISTS selections_counted_delete AFTER DELETE ON selections
+WHEN {_MARKED.replace("{r}", "OLD")} BEGIN
+{_REMOVE}
+END;
+
+CREATE TRIGGER IF NOT EXISTS students_counted_marked AFTER UPDATE OF marked_at ON students
+WHEN OLD.marked_at IS NULL AND NEW.marked_at IS NOT NULL BEGIN
+{";".join(_add_marked("NEW.student_id"))};
+END;
+CREATE TRIGGER IF NOT EXISTS students_counted_unmarked AFTER UPDATE OF marked_at ON students
+WHEN OLD.marked_at IS NOT NULL AND NEW.marked_at IS NULL BEGIN
+{_REMOVE_STUDENT}
+END;
+
+CREATE TRIGGER IF NOT EXISTS student_totals_insert AFTER INSERT ON student_totals BEGIN
+    INSERT INTO total_counts VALUES (NEW.total, 1) ON CONFLICT DO UPDATE SET students = students + 1;
+END;
+CREATE TRIGGER IF NOT EXISTS student_totals_update AFTER UPDATE OF total ON student_totals BEGIN
+    UPDATE total_counts SET students = students - 1 WHERE total = OLD.total;
+    INSERT INTO total_counts VALUES (NEW.total, 1) ON CONFLICT DO UPDATE SET students = students + 1;
+    DELETE FROM total_counts WHERE students = 0;
+END;
+CREATE TRIGGER IF NOT EXISTS student_totals_delete AFTER DELETE ON student_totals BEGIN
+    UPDATE total_counts SET students = students - 1 WHERE total = OLD.total;
+    DELETE FROM total_counts WHERE students = 0;
+END;
+"""
+
+_COUNTERS = ("grade_counts", "criterion_counts", "criterion_students", "student_totals", "total_counts",
+             "marker_counts")
+
+
+def _bands(rubric):
+    bits, bands = [], []
+    for i, key in enumerate(rubric.presentation_keys):
+        bits.append((store.PRESENTATION, i, 2 if key.startswith("bad_") else 1 if key.startswith("medium_") else 0))
+    for code, grade in enumerate(("Excellent", "Medium", "Bad")):
+        bands.append((store.PRESENTATION, code, grade, rubric.presentation_marks.get(grade, 0)))
+    for lab in rubric.labs:
+        bits += [(lab, i, 1) for i in range(len(rubric.criterion_ids[lab]))]
+        for count, (grade, mark) in enumerate(zip(rubric.grade_tables[lab], rubric.mark_tables[lab])):
+            bands.append((lab, count, grade, mark))
+    return bits, bands
+
+
+def install(conn, rubric):
+    """Create the counters and triggers, rebuilding the counters if the
+    rubric differs from the one they were built with."""
+    conn.executescript(SCHEMA + TRIGGERS)
+    row = conn.execute("SELECT value FROM analytics_meta WHERE name = 'rubric'").fetchone()
+    if row is not None and row[0] == rubric.digest:
+        return False
+    bits, bands = _bands(rubric)
+    default_total = sum(mark for section, key, _, mark in bands if key == 0)
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        for table in ("rubric_bits", "grade_bands") + _COUNTERS:
+            conn.execute(f"DELETE FROM {table}")
+        conn.executemany("INSERT INTO rubric_bits VALUES (?, ?, ?)", bits)
+        conn.executemany("INSERT INTO grade_bands VALUES (?, ?, ?, ?)", bands)
+        conn.executemany("INSERT OR REPLACE INTO analytics_meta VALUES (?, ?)",
+                         [("rubric", rubric.digest), ("default_total", repr(default_total))])
+        _rebuild(conn)
+    return True
+
+
+def _rebuild(conn):
+    for statement in _add_marked("st.student_id"):
+        conn.execute(statement)
+
+
+def grade_distribution(conn):
+    """``(section, grade, students)`` over the marked students; a section with
+    nothing saved has the grade of nothing selected."""
+    return conn.execute(
+        "SELECT section, grade, SUM(students) FROM ("
+        "SELECT section, grade, students FROM grade_counts "
+        "UNION ALL SELECT b.section, b.grade, "
+        "(SELECT COALESCE(SUM(students), 0) FROM total_counts) "
+        "- (SELECT COALESCE(SUM(students), 0) FROM grade_counts c WHERE c.section = b.section) "
+        "FROM grade_bands b WHERE b.key = 0"
+        ") GROUP BY section, grade HAVING SUM(students) > 0"
+    ).fetchall()
+
+
+def top_criteria(conn, section, limit=5):
+    return conn.execute(
+        "SELECT bit, students FROM criterion_counts WHERE section = ? AND students > 0 "
+        "ORDER BY students DESC, bit LIMIT ?", (section, limit)
+    ).fetchall()
+
+
+def criterion_students(conn, section, bit):
+    """Students who have a criterion ticked, straight from its index."""
+    return [row[0] for row in conn.execute(
+        "SELECT student_id FROM criterion_students WHERE section = ? AND bit = ? ORDER BY student_id", (section, bit)
+    )]
+
+
+def total_histogram(conn):
+    return conn.execute("SELECT total, students FROM total_counts ORDER BY total").fetchall()
+
+
+def marker_means(conn):
+    """``(marker, sections marked, mean lab mark)`` for every marker.
+
+    Sections pre-filled by the pre-check are not a tutor's marking and are
+    left out.
+    """
+    return conn.execute(
+        "SELECT marker, SUM(sections), SUM(mark_sum) / SUM(sections) FROM marker_counts "
+        f"WHERE marker NOT IN ('', {','.join('?' * len(store.SYSTEM_MARKERS))}) AND section != ? "
+        "AND sections > 0 GROUP BY marker ORDER BY marker",
+        (*store.SYSTEM_MARKERS, store.PRESENTATION)
+    ).fetchall()
+
+
+def section_times(conn, window=200):
+    """``{section: (median seconds, submissions, total seconds)}`` of active
+    marking time, the median over each section's ``window`` most recently
+    marked submissions."""
+    recent, totals = {}, {}
+    for section, seconds, n in conn.execute(
+        "SELECT section, seconds, ROW_NUMBER() OVER (PARTITION BY section ORDER BY last_at DESC) "
+        "FROM marking_time"
+    ):
+        totals[section] = totals.get(section, 0.0) + seconds
+        if n <= window:
+            recent.setdefault(section, []).append(seconds)
+    return {
+        section: (statistics.median(recent[section]), len(recent[section]), totals[section])
+        for section in recent
+    }
+
+
+def marker_throughput(conn):
+    """``(marker, students, active seconds)`` for every marker with timed work."""
+    return conn.execute(
+        "SELECT marker, COUNT(DISTINCT student_id), SUM(seconds) FROM marking_time "
+        "WHERE marker != '' GROUP BY marker ORDER BY marker"
+    ).fetchall()
@@ -0,0 +1,135 @@
+"""Grade a whole cohort from a file of per-student selections.
+
+Input is CSV or JSONL. CSV files have a ``student_id`` column, a
+``presentation`` column and one column per lab ("Lab 1" or "Lab1"); each cell
+lists the selected presentation keys or missing criterion IDs separated by
+";". The full criterion text is also accepted in place of an ID. JSONL lines
+look like::
+
+    {"student_id": "123", "presentation": ["medium_font"],
+     "labs": {"Lab 2": ["instance_type"]}}
+
+The gradebook has the same columns as the UI's CSV export plus
+``student_id`` and ``Feedback``. Rows are read, graded and written in chunks,
+so memory use does not grow with the size of the cohort.
+
+    python batch_grade.py selections.csv -o gradebook.csv
+"""
+
+import argparse
+import csv
+import json
+import sys
+from datetime import datetime
+from itertools import islice
+
+from grading import RUBRIC, grade_submission, lab_mask, presentation_mask
+from feedback import feedback_document
+from exports import csv_columns, csv_row, lab_column
+
+# Criterion IDs, and the criterion text they stand for, for each lab
+_LAB_CRITERIA = {
+    lab: {**{text: criterion_id for criterion_id, text in spec["bad_criteria"].items()},
+          **{criterion_id: criterion_id for criterion_id in spec["bad_criteria"]}}
+    for lab, spec in RUBRIC.lab_criteria.items()
+}
+
+
+def _split(cell, separator):
+    if not cell:
+        return []
+    return [item.strip() for item in cell.split(separator) if item.strip()]
+
+
+def read_csv(f, separator=";"):
+    for line_no, row in enumerate(csv.DictReader(f), start=2):
+        labs = {}
+        for lab in RUBRIC.labs:
+            cell = row.get(lab)
+            if cell is None:
+                cell = row.get(lab_column(lab))
+            labs[lab] = _split(cell, separator)
+        yield line_no, row.get("student_id", ""), _split(row.get("presentation"), separator), labs
+
+
+def read_jsonl(f):
+    for line_no, line in enumerate(f, start=1):
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        yield line_no, str(record.get("student_id", "")), record.get("presentation", []), record.get("labs", {})
+
+
+def check_selection(presentation, labs):
+    """Validate a selection, returning ``labs`` with criteria resolved to IDs."""
+    for key in presentation:
+        if key not in RUBRIC.presentation_options:
+            raise ValueError(f"unknown presentation key {key!r}")
+    if len(set(presentation)) != len(presentation):
+        raise ValueError("duplicate presentation key")
+    resolved = {}
+    for lab, missing in labs.items():
+        if lab not in _LAB_CRITERIA:
+            raise ValueError(f"unknown lab {lab!r}")
+        for criterion in missing:
+            if criterion not in _LAB_CRITERIA[lab]:
+                raise ValueError(f"unknown criterion for {lab}: {criterion!r}")
+        resolved[lab] = [_LAB_CRITERIA[lab][criterion] for criterion in missing]
+        if len(set(resolved[lab])) != len(missing):
+            raise ValueError(f"duplicate criterion for {lab}")
+    return resolved
+
+
+def grade_rows(rows, evaluation_date):
+    for line_no, student_id, presentation, labs in rows:
+        try:
+            labs = check_selection(presentation, labs)
+        except ValueError as exc:
+            raise ValueError(f"line {line_no}: {exc}") from None
+        result = grade_submission(presentation, labs)
+        lab_masks = {lab: lab_mask(lab, missing) for lab, missing in labs.items()}
+        feedback = feedback_document(result, presentation_mask(presentation), lab_masks, evaluation_date)
+        yield [student_id] + csv_row(result, evaluation_date) + [feedback]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Grade a cohort from a CSV/JSONL file of selections.")
+    parser.add_argument("input", help="CSV or JSONL file of per-student selections")
+    parser.add_argument("-o", "--output", default="-", help="gradebook CSV to write (default: stdout)")
+    parser.add_argument("--format", choices=["csv", "jsonl"], help="input format (default: from the file extension)")
+    parser.add_argument("--separator", default=";", help="separator between items in a CSV cell (default: ;)")
+    parser.add_argument("--chunk-size", type=int, default=5000, help="rows graded per write (default: 5000)")
+    args = parser.parse_args(argv)
+
+    input_format = args.format
+    if input_format is None:
+        input_format = "jsonl" if args.input.endswith((".jsonl", ".ndjson")) else "csv"
+    evaluation_date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+    with open(args.input, newline="", encoding="utf-8") as src:
+        rows = read_jsonl(src) if input_format == "jsonl" else read_csv(src, args.separator)
+        out = sys.stdout if args.output == "-" else open(args.output, "w", newline="", encoding="utf-8")
+        try:
+            writer = csv.writer(out)
+            writer.writerow(["student_id"] + csv_columns() + ["Feedback"])
+            graded = grade_rows(rows, evaluation_date)
+            count = 0
+            while True:
+                chunk = list(islice(graded, args.chunk_size))
+                if not chunk:
+                    break
+                writer.writerows(chunk)
+                count += len(chunk)
+        except ValueError as exc:
+            print(f"batch_grade: {exc}", file=sys.stderr)
+            return 1
+        finally:
+            if out is not sys.stdout:
+                out.close()
+
+    print(f"Graded {count} submissions", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+"""Compare round-trips and server time for marking students in each mode.
+
+Drives the app headlessly with Streamlit's AppTest over a throwaway roster,
+ticking the same criteria for every student (a seeded random share of each
+lab's criteria), once with a rerun per checkbox click and once in batched
+mode with one form submit per lab.
+
+    python benchmarks/marking_pass.py [--students 5] [--tick-rate 0.25]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import store  # noqa: E402
+from rubric import lab_criteria  # noqa: E402
+
+
+def ticks_per_student(students, tick_rate, seed=0):
+    rng = random.Random(seed)
+    return [
+        {lab: [c for c in spec["bad_criteria"] if rng.random() < tick_rate] for lab, spec in lab_criteria.items()}
+        for _ in range(students)
+    ]
+
+
+def checkbox(at, key):
+    # After a fragment rerun the test's element tree only holds that
+    # fragment, while a browser keeps the whole page; refetch the page
+    # without counting it as a round-trip
+    try:
+        return at.checkbox(key=key)
+    except KeyError:
+        at.run()
+        return at.checkbox(key=key)
+
+
+def mark(script, ticks, batched):
+    """Mark one student per entry of ``ticks``; returns ``(round_trips, seconds)``."""
+    round_trips, elapsed = 0, 0.0
+
+    def run(at):
+        nonlocal round_trips, elapsed
+        start = time.perf_counter()
+        at.run()
+        elapsed += time.perf_counter() - start
+        round_trips += 1
+        assert not at.exception, at.exception
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # A fresh database, so the app's per-process resources are rebuilt
+        st.cache_resource.clear()
+        os.environ["MARKING_DB"] = os.path.join(tmp, "marking.db")
+        store.load_roster(store.connect(os.environ["MARKING_DB"]), [(str(i), "") for i in range(len(ticks))])
+        at = AppTest.from_file(script, default_timeout=60)
+        at.session_state["marker_name"] = "benchmark"
+        at.session_state["batched_mode"] = batched
+        at.run()
+        for student_ticks in ticks:
+            for lab, criteria in student_ticks.items():
+                for criterion_id in criteria:
+                    checkbox(at, f"{lab}_{criterion_id}").check()
+                    if not batched:
+                        run(at)
+                if batched:
+                    form = f"{lab.replace(' ', '').lower()}_form"
+                    next(b for b in at.button if b.label == "Save & Next Lab" and b.form_id == form).click()
+                    run(at)
+            if not batched and student_ticks is not ticks[-1]:
+                at.run()
+                next(b for b in at.button if b.label == "Next ➡️").click()
+                run(at)
+    return round_trips, elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--script", default=str(ROOT / "marking_tool.py"))
+    parser.add_argument("--students", type=int, default=5)
+    parser.add_argument("--tick-rate", type=float, default=0.25, help="share of criteria ticked per lab")
+    args = parser.parse_args(argv)
+
+    ticks = ticks_per_student(args.students, args.tick_rate)
+    print(f"{sum(len(c) for t in ticks for c in t.values()) / args.students:.1f} criteria ticked per student")
+    for batched in (False, True):
+        round_trips, elapsed = mark(args.script, ticks, batched)
+        print(f"{'batched' if batched else 'per click'}: {round_trips / args.students:.1f} round-trips and "
+              f"{elapsed / args.students * 1000:.0f} ms server time per student")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""Measure how long a criterion click in each lab tab takes to rerun.
+
+Drives the app headlessly with Streamlit's AppTest, toggling the first
+criterion of every lab and timing the rerun it triggers.
+
+    python benchmarks/rerun_latency.py [--script marking_tool.py] [--repeat 20]
+"""
+
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+from streamlit.testing.v1 import AppTest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from rubric import lab_criteria  # noqa: E402
+
+
+def click_latencies(script, lab_name, repeat):
+    at = AppTest.from_file(script, default_timeout=30)
+    at.run()
+    key = next(box.key for box in at.checkbox if box.key.startswith(f"{lab_name}_"))
+    timings = []
+    for i in range(repeat):
+        at.checkbox(key=key).set_value(i % 2 == 0)
+        start = time.perf_counter()
+        at.run()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--script", default=str(ROOT / "marking_tool.py"))
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    medians = []
+    for lab_name in lab_criteria:
+        timings = click_latencies(args.script, lab_name, args.repeat)
+        median = statistics.median(timings) * 1000
+        medians.append(median)
+        print(f"{lab_name}: median {median:.1f} ms, max {max(timings) * 1000:.1f} ms")
+    print(f"All labs: median {statistics.median(medians):.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
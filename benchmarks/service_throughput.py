@@ -0,0 +1,98 @@
+"""Measure grading throughput of the local HTTP service.
+
+Starts ``grading_service.py`` on a free port and drives it from several
+client processes over keep-alive connections, first with one submission per
+request and then through the batch endpoint. Submissions tick a seeded random
+share of every lab's criteria.
+
+    python benchmarks/service_throughput.py [--workers 4] [--clients 8] [--batch 1000]
+"""
+
+import argparse
+import http.client
+import json
+import random
+import statistics
+import subprocess
+import sys
+import time
+from multiprocessing import Pool
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from rubric import lab_criteria, presentation_options  # noqa: E402
+
+
+def submissions(count, tick_rate, seed):
+    rng = random.Random(seed)
+    return [
+        {
+            "student_id": f"s{seed}-{i}",
+            "presentation": [key for key in presentation_options if key.startswith("medium_") and rng.random() < 0.1],
+            "labs": {lab: [c for c in spec["bad_criteria"] if rng.random() < tick_rate]
+                     for lab, spec in lab_criteria.items()},
+        }
+        for i in range(count)
+    ]
+
+
+def client(job):
+    """Send ``requests`` bodies to ``path``; returns ``(gradings, latencies)``."""
+    port, path, batch, requests, tick_rate, seed = job
+    conn = http.client.HTTPConnection("127.0.0.1", port)
+    items = submissions(batch, tick_rate, seed)
+    body = json.dumps({"submissions": items} if path == "/grade/batch" else items[0]).encode()
+    headers = {"Content-Type": "application/json"}
+    latencies = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        conn.request("POST", path, body, headers)
+        response = conn.getresponse()
+        data = response.read()
+        latencies.append(time.perf_counter() - start)
+        assert response.status == 200, data[:200]
+    conn.close()
+    return batch * requests, latencies
+
+
+def run(pool, port, path, clients, batch, requests, tick_rate):
+    start = time.perf_counter()
+    results = pool.map(client, [(port, path, batch, requests, tick_rate, seed) for seed in range(clients)])
+    elapsed = time.perf_counter() - start
+    latencies = sorted(latency for _, batch_latencies in results for latency in batch_latencies)
+    gradings = sum(count for count, _ in results)
+    print(f"{path}: {gradings} gradings in {elapsed:.2f} s ({gradings / elapsed:.0f}/s), "
+          f"p50 {statistics.median(latencies) * 1000:.2f} ms, "
+          f"p95 {latencies[int(len(latencies) * 0.95)] * 1000:.2f} ms per request")
+    return gradings / elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=4, help="service worker processes")
+    parser.add_argument("--clients", type=int, default=8, help="concurrent client processes")
+    parser.add_argument("--batch", type=int, default=1000, help="submissions per batch request")
+    parser.add_argument("--requests", type=int, default=500, help="single requests per client")
+    parser.add_argument("--batches", type=int, default=5, help="batch requests per client")
+    parser.add_argument("--tick-rate", type=float, default=0.25, help="share of criteria ticked per lab")
+    args = parser.parse_args(argv)
+
+    service = subprocess.Popen(
+        [sys.executable, str(ROOT / "grading_service.py"), "--port", "0", "--workers", str(args.workers)],
+        stderr=subprocess.PIPE, text=True,
+    )
+    try:
+        # "Grading on http://127.0.0.1:PORT with N worker(s)"
+        port = int(service.stderr.readline().split(":")[2].split()[0])
+        with Pool(args.clients) as pool:
+            run(pool, port, "/grade", args.clients, 1, args.requests, args.tick_rate)
+            run(pool, port, "/grade/batch", args.clients, args.batch, args.batches, args.tick_rate)
+    finally:
+        service.terminate()
+        service.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Measure the app's import time and time to first paint.
+
+Every sample is a fresh Python process, so nothing is warm. It times
+importing the modules the script imports at the top, then the first headless
+run of the script with Streamlit's AppTest, and a rerun; first paint is the
+imports plus the first run. It also lists which heavy data libraries were
+loaded by then.
+
+    python benchmarks/startup.py [--script marking_tool.py] [--repeat 5]
+"""
+
+import argparse
+import ast
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+HEAVY = ("pandas", "numpy", "pyarrow")
+
+SAMPLE = """
+import importlib, json, sys, time
+script, modules = sys.argv[1], sys.argv[2:]
+start = time.perf_counter()
+for module in modules:
+    importlib.import_module(module)
+imported = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file(script, default_timeout=120)
+start_run = time.perf_counter()
+at.run()
+first_run = time.perf_counter() - start_run
+assert not at.exception, at.exception
+start_run = time.perf_counter()
+at.run()
+rerun = time.perf_counter() - start_run
+print(json.dumps({"imports": imported - start, "first_run": first_run, "rerun": rerun,
+                  "heavy": [m for m in %r if m in sys.modules]}))
+""" % (HEAVY,)
+
+
+def top_level_imports(script):
+    """Modules the script imports outside any function."""
+    modules = []
+    for node in ast.parse(Path(script).read_text()).body:
+        if isinstance(node, ast.Import):
+            modules += [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.level == 0:
+            modules.append(node.module)
+    return modules
+
+
+def sample(script, modules):
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, MARKING_DB=os.path.join(tmp, "marking.db"))
+        out = subprocess.run(
+            [sys.executable, "-c", SAMPLE, script, *modules], cwd=Path(script).parent, env=env,
+            capture_output=True, text=True, check=True,
+        ).stdout
+    return json.loads(out.splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--script", default=str(ROOT / "marking_tool.py"))
+    parser.add_argument("--repeat", type=int, default=5, help="fresh processes to sample")
+    args = parser.parse_args(argv)
+
+    modules = top_level_imports(args.script)
+    samples = [sample(args.script, modules) for _ in range(args.repeat)]
+
+    def median_ms(key):
+        return statistics.median(s[key] for s in samples) * 1000
+
+    print(f"imports: {median_ms('imports'):.0f} ms ({len(modules)} modules)")
+    print(f"first run: {median_ms('first_run'):.0f} ms")
+    print(f"first paint: {statistics.median(s['imports'] + s['first_run'] for s in samples) * 1000:.0f} ms")
+    print(f"rerun: {median_ms('rerun'):.0f} ms")
+    print(f"heavy libraries loaded: {', '.join(samples[0]['heavy']) or 'none'}")
+
+
+if __name__ == "__main__":
+    main()
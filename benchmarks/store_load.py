@@ -0,0 +1,119 @@
+"""Load test for the shared marking store.
+
+Simulates several markers working the same cohort through one connection
+pool, the way concurrent Streamlit sessions do:
+
+1. every marker claims students from the shared roster and saves sections
+   for them; no student may end up claimed by two markers;
+2. all markers then hammer the same section of one student with
+   read-modify-write saves; with optimistic versioning the final version must
+   equal the number of successful saves (no lost updates).
+
+    python benchmarks/store_load.py [--markers 16] [--students 600] [--pool 8]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import store  # noqa: E402
+from rubric import lab_criteria  # noqa: E402
+
+SECTIONS = (store.PRESENTATION, *lab_criteria)
+
+
+def mark_students(pool, marker, student_ids, saves_per_student, claimed, latencies):
+    rng = random.Random(marker)
+    for student_id in student_ids:
+        if marker in claimed.get(student_id, ()):
+            continue
+        with pool.connection() as conn:
+            if store.claim_student(conn, student_id, marker) != marker:
+                continue
+            claimed.setdefault(student_id, set()).add(marker)
+            versions = {section: version for section, (_, version) in store.load_student(conn, student_id).items()}
+        for _ in range(saves_per_student):
+            section = rng.choice(SECTIONS)
+            start = time.perf_counter()
+            with pool.connection() as conn:
+                versions[section] = store.save_section(
+                    conn, student_id, section, rng.getrandbits(20), versions.get(section, 0), marker
+                )
+            latencies.append(time.perf_counter() - start)
+
+
+def contend(pool, marker, student_id, attempts, outcome, lock):
+    rng = random.Random(marker)
+    for _ in range(attempts):
+        with pool.connection() as conn:
+            mask, version = store.load_student(conn, student_id).get("Lab 1", (0, 0))
+            try:
+                store.save_section(conn, student_id, "Lab 1", mask ^ (1 << rng.randrange(5)), version, marker)
+                result = "saved"
+            except store.ConflictError:
+                result = "conflicts"
+        with lock:
+            outcome[result] += 1
+
+
+def run_threads(target, args_list):
+    threads = [threading.Thread(target=target, args=args) for args in args_list]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--markers", type=int, default=16)
+    parser.add_argument("--students", type=int, default=600)
+    parser.add_argument("--pool", type=int, default=8)
+    parser.add_argument("--saves", type=int, default=10, help="saves per claimed student")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pool = store.ConnectionPool(os.path.join(tmp, "load.db"), size=args.pool)
+        student_ids = [f"s{i:05d}" for i in range(args.students)]
+        with pool.connection() as conn:
+            store.load_roster(conn, [(student_id, "") for student_id in student_ids])
+
+        claimed, latencies = {}, []
+        start = time.perf_counter()
+        run_threads(mark_students, [
+            (pool, f"marker{m}", student_ids[m::args.markers] + student_ids, args.saves, claimed, latencies)
+            for m in range(args.markers)
+        ])
+        elapsed = time.perf_counter() - start
+        double = [student_id for student_id, markers in claimed.items() if len(markers) > 1]
+        latencies.sort()
+        print(f"marking: {len(latencies)} saves by {args.markers} markers in {elapsed:.2f} s "
+              f"({len(latencies) / elapsed:.0f} saves/s), "
+              f"p50 {statistics.median(latencies) * 1000:.2f} ms, "
+              f"p95 {latencies[int(len(latencies) * 0.95)] * 1000:.2f} ms")
+        print(f"claims: {len(claimed)} students claimed, {len(double)} claimed twice")
+
+        outcome, lock = {"saved": 0, "conflicts": 0}, threading.Lock()
+        with pool.connection() as conn:
+            _, start_version = store.load_student(conn, student_ids[0]).get("Lab 1", (0, 0))
+        run_threads(contend, [(pool, f"marker{m}", student_ids[0], 50, outcome, lock) for m in range(args.markers)])
+        with pool.connection() as conn:
+            _, version = store.load_student(conn, student_ids[0])["Lab 1"]
+        print(f"contention: {outcome['saved']} saves, {outcome['conflicts']} conflicts, "
+              f"version {start_version} -> {version}")
+
+        ok = not double and len(claimed) == args.students and version - start_version == outcome["saved"]
+        print("OK" if ok else "FAILED")
+        return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,342 @@
+"""Benchmark suite for the marking app; writes its results as JSON.
+
+App benchmarks drive the script headlessly with Streamlit's AppTest. They use
+a throwaway database holding a marked synthetic cohort, with the cohort
+panel open:
+
+- the rerun after a criterion click in each lab tab (its section and the
+  summary), and a full-script rerun;
+- the time spent in each section (every ``st.fragment``: presentation, the
+  labs, summary and feedback, cohort analytics, cohort export) during those
+  reruns;
+- the cost of building each download (the student's CSV and JSON, and the
+  cohort export);
+- the peak and retained Python memory of one more session once the shared
+  caches are warm (tracemalloc), and the process's peak RSS.
+
+Microbenchmarks grade synthetic cohorts of 1k, 10k and 100k students: one at
+a time with ``grade_submission``, vectorized with ``cohort.grade_cohort``,
+and writing everyone's feedback document and CSV row.
+
+    python benchmarks/suite.py --output results.json
+    python benchmarks/suite.py --compare base.json results.json
+"""
+
+import argparse
+import csv
+import functools
+import io
+import json
+import os
+import platform
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import store  # noqa: E402
+from exports import csv_columns, csv_row  # noqa: E402
+from feedback import feedback_document  # noqa: E402
+from grading import grade_submission, lab_mask, presentation_mask  # noqa: E402
+from rubric import lab_criteria, presentation_options  # noqa: E402
+
+SIZES = (1000, 10000, 100000)
+EVALUATION_DATE = "2024-01-01 00:00:00"
+
+
+def selections(students, tick_rate, seed=0):
+    """``(presentation, {lab: missing})`` for synthetic students."""
+    rng = random.Random(seed)
+    keys = list(presentation_options)
+    return [
+        (
+            [key for key in keys if rng.random() < tick_rate],
+            {lab: [c for c in spec["bad_criteria"] if rng.random() < tick_rate]
+             for lab, spec in lab_criteria.items()},
+        )
+        for _ in range(students)
+    ]
+
+
+def summarize(timings):
+    timings = sorted(timings)
+    return {
+        "median_ms": statistics.median(timings) * 1000,
+        "p95_ms": timings[min(len(timings) - 1, int(len(timings) * 0.95))] * 1000,
+        "samples": len(timings),
+    }
+
+
+class Probes:
+    """Times every fragment and download of the script while installed."""
+
+    def __init__(self):
+        self.sections = {}
+        self.downloads = {}
+        self.build_downloads = False
+        self._fragment = st.fragment
+        self._download_button = st.download_button
+
+    def fragment(self, func=None, **kwargs):
+        if func is None:
+            return lambda func: self.fragment(func, **kwargs)
+        name = kwargs.get("key") or func.__name__
+
+        @functools.wraps(func)
+        def timed(*args, **kw):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kw)
+            finally:
+                self.sections.setdefault(name, []).append(time.perf_counter() - start)
+
+        return self._fragment(timed, **kwargs)
+
+    def download_button(self, label, data, *args, **kwargs):
+        # Payloads are built lazily on click; build one here when asked to
+        if self.build_downloads and callable(data):
+            start = time.perf_counter()
+            payload = data()
+            self.downloads.setdefault(label, []).append(time.perf_counter() - start)
+            if hasattr(payload, "close"):
+                payload.close()
+        return self._download_button(label, data, *args, **kwargs)
+
+    def __enter__(self):
+        st.fragment, st.download_button = self.fragment, self.download_button
+        return self
+
+    def __exit__(self, *exc):
+        st.fragment, st.download_button = self._fragment, self._download_button
+
+
+def seed_database(path, students, tick_rate):
+    # A cohort that is already marked, so the analytics and exports have work
+    conn = store.connect(path)
+    store.load_roster(conn, [(str(i), f"Student {i}") for i in range(students)])
+    with conn:
+        conn.execute("BEGIN")
+        for i, (presentation, labs) in enumerate(selections(students, tick_rate, seed=1)):
+            store.save_section(conn, str(i), store.PRESENTATION, presentation_mask(presentation), 0, "benchmark")
+            for lab, missing in labs.items():
+                store.save_section(conn, str(i), lab, lab_mask(lab, missing), 0, "benchmark")
+            store.mark_student(conn, str(i), "benchmark")
+    conn.close()
+
+
+def new_session(script):
+    at = AppTest.from_file(script, default_timeout=120)
+    at.session_state["marker_name"] = "benchmark"
+    at.session_state["cohort_panel"] = True
+    at.run()
+    assert not at.exception, at.exception
+    return at
+
+
+def checkbox(at, key):
+    # After a fragment rerun the test's element tree only holds that
+    # fragment, while a browser keeps the whole page; refetch the page
+    try:
+        return at.checkbox(key=key)
+    except KeyError:
+        at.run()
+        return at.checkbox(key=key)
+
+
+def click_reruns(at, repeat):
+    timings = {}
+    for lab_name in lab_criteria:
+        key = f"{lab_name}_{next(iter(lab_criteria[lab_name]['bad_criteria']))}"
+        timings[lab_name] = []
+        for i in range(repeat):
+            checkbox(at, key).set_value(i % 2 == 0)
+            start = time.perf_counter()
+            at.run()
+            timings[lab_name].append(time.perf_counter() - start)
+            assert not at.exception, at.exception
+    return timings
+
+
+def app_benchmarks(script, students, repeat, tick_rate):
+    with tempfile.TemporaryDirectory() as tmp:
+        # A fresh database, so the app's per-process resources are rebuilt
+        st.cache_resource.clear()
+        st.cache_data.clear()
+        os.environ["MARKING_DB"] = os.path.join(tmp, "marking.db")
+        seed_database(os.environ["MARKING_DB"], students, tick_rate)
+
+        with Probes() as probes:
+            at = new_session(script)
+            # Only reruns are timed, not the first run's cold caches
+            probes.sections.clear()
+            clicks = click_reruns(at, repeat)
+            full = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                at.run()
+                full.append(time.perf_counter() - start)
+            sections = {name: summarize(timings) for name, timings in sorted(probes.sections.items())}
+            probes.build_downloads = True
+            for _ in range(repeat):
+                # Repeated downloads are cache hits; time building them
+                st.cache_data.clear()
+                at.run()
+                assert not at.exception, at.exception
+            downloads = {label: summarize(timings) for label, timings in sorted(probes.downloads.items())}
+
+        tracemalloc.start()
+        at = new_session(script)
+        click_reruns(at, 2)
+        retained, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    all_clicks = [t for timings in clicks.values() for t in timings]
+    return {
+        "cohort_students": students,
+        "click_rerun": {"all_labs": summarize(all_clicks),
+                        **{lab: summarize(timings) for lab, timings in clicks.items()}},
+        "full_rerun": summarize(full),
+        "sections": sections,
+        "downloads": downloads,
+        "session_memory": {"peak_mb": peak / 2 ** 20, "retained_mb": retained / 2 ** 20},
+        "process_max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def best_of(repeat, fn):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def micro_benchmarks(size, repeat, tick_rate):
+    import cohort
+
+    students = selections(size, tick_rate)
+    results = [grade_submission(presentation, labs) for presentation, labs in students]
+    masks = [(presentation_mask(presentation), {lab: lab_mask(lab, missing) for lab, missing in labs.items()})
+             for presentation, labs in students]
+
+    def grade_each():
+        for presentation, labs in students:
+            grade_submission(presentation, labs)
+
+    frame = cohort.encode_cohort([p for p, _ in students], {lab: [labs[lab] for _, labs in students]
+                                                            for lab in lab_criteria})
+
+    def feedback_each():
+        for result, (pres_mask, lab_masks) in zip(results, masks):
+            feedback_document(result, pres_mask, lab_masks, EVALUATION_DATE)
+
+    def csv_export():
+        writer = csv.writer(io.StringIO(), lineterminator="\n")
+        writer.writerow(csv_columns())
+        writer.writerows(csv_row(result, EVALUATION_DATE) for result in results)
+
+    timings = {
+        "grade_submission": best_of(repeat, grade_each),
+        "grade_cohort": best_of(repeat, lambda: cohort.grade_cohort(frame)),
+        "feedback_document": best_of(repeat, feedback_each),
+        "csv_export": best_of(repeat, csv_export),
+    }
+    return {name: {"total_ms": seconds * 1000, "per_student_us": seconds / size * 1e6}
+            for name, seconds in timings.items()}
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT,
+                                    capture_output=True, text=True, check=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        commit, dirty = None, None
+    return {
+        "commit": commit,
+        "dirty": dirty,
+        "python": platform.python_version(),
+        "streamlit": st.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "started": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+
+def flatten(results, prefix=""):
+    flat = {}
+    for name, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[f"{prefix}{name}"] = value
+    return flat
+
+
+def compare(base_path, new_path):
+    """Print every timing and memory figure of two result files side by side."""
+    with open(base_path, encoding="utf-8") as f:
+        base = json.load(f)
+    with open(new_path, encoding="utf-8") as f:
+        new = json.load(f)
+    print(f"base {base['environment']['commit']}  new {new['environment']['commit']}")
+    base_flat, new_flat = flatten(base["results"]), flatten(new["results"])
+    for name, value in new_flat.items():
+        if not name.endswith(("_ms", "_us", "_mb")) or name not in base_flat:
+            continue
+        old = base_flat[name]
+        change = f"{(value / old - 1) * 100:+.0f}%" if old else "n/a"
+        print(f"{name:<60} {old:>12.3f} {value:>12.3f} {change:>7}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--script", default=str(ROOT / "marking_tool.py"))
+    parser.add_argument("--output", "-o", help="file to write the JSON results to (default: stdout)")
+    parser.add_argument("--repeat", type=int, default=10, help="reruns per lab, and runs per microbenchmark")
+    parser.add_argument("--cohort", type=int, default=500, help="students in the app's marked cohort")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(SIZES),
+                        help=f"cohort sizes for the microbenchmarks (default: {' '.join(map(str, SIZES))})")
+    parser.add_argument("--tick-rate", type=float, default=0.25, help="share of criteria ticked per section")
+    parser.add_argument("--skip-app", action="store_true", help="run the microbenchmarks only")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "NEW"), help="compare two result files and exit")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return 0
+
+    results = {}
+    if not args.skip_app:
+        print("app ...", file=sys.stderr, flush=True)
+        results["app"] = app_benchmarks(args.script, args.cohort, args.repeat, args.tick_rate)
+    results["micro"] = {}
+    for size in args.sizes:
+        print(f"{size} students ...", file=sys.stderr, flush=True)
+        # Fewer runs of the largest cohorts, which are slow and steady
+        results["micro"][str(size)] = micro_benchmarks(size, max(1, args.repeat * 1000 // size), args.tick_rate)
+
+    payload = json.dumps({"environment": environment(), "results": results}, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(payload + "\n")
+    else:
+        print(payload)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,178 @@
+"""Vectorized grading of whole cohorts.
+
+Selections are packed into one integer bitmask per lab (see
+``grading.lab_mask``), so a cohort is a DataFrame with a ``Presentation_Mask``
+column and one ``<Lab>_Mask`` column per lab, e.g. ``Lab1_Mask``. Grades come
+from a popcount, a ``searchsorted`` against the lab cut-offs and a gather from
+a mark matrix, without any per-row Python.
+"""
+
+import numpy as np
+import pandas as pd
+
+import store
+from grading import RUBRIC, LAB_GRADES, Rubric, lab_mask, presentation_mask
+from exports import lab_column
+
+PRESENTATION_GRADES = ("Excellent", "Medium", "Bad")
+
+_POPCOUNT8 = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def popcount(masks):
+    masks = np.asarray(masks, dtype=np.uint64)
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(masks).astype(np.int64)
+    counts = np.zeros(masks.shape, dtype=np.int64)
+    while masks.any():
+        counts += _POPCOUNT8[(masks & np.uint64(0xFF)).astype(np.intp)]
+        masks = masks >> np.uint64(8)
+    return counts
+
+
+def mask_column(lab):
+    return f"{lab_column(lab)}_Mask"
+
+
+def encode_cohort(presentation, labs, rubric=RUBRIC):
+    """Build a mask frame from lists of selections.
+
+    ``presentation`` is a sequence of presentation key lists and ``labs`` maps
+    lab names to sequences of missing criterion ID lists, one entry per student.
+    Labs that are not listed have nothing missing.
+    """
+    frame = {"Presentation_Mask": [presentation_mask(sel, rubric) for sel in presentation]}
+    for lab in rubric.labs:
+        if lab in labs:
+            frame[mask_column(lab)] = [lab_mask(lab, missing, rubric) for missing in labs[lab]]
+        else:
+            frame[mask_column(lab)] = 0
+    return pd.DataFrame(frame)
+
+
+def masks_from_store(conn, rubric=RUBRIC):
+    """Build a mask frame, indexed by student id, from the saved selections.
+
+    Every marked student gets a row, in roster order; sections nobody has
+    saved are 0. Students not marked yet, including those with only
+    pre-check flags, are left out.
+    """
+    columns = {store.PRESENTATION: "Presentation_Mask"}
+    columns.update({lab: mask_column(lab) for lab in rubric.labs})
+    student_ids = store.marked_students(conn)
+    saved = pd.DataFrame(store.marked_selections(conn), columns=["student_id", "section", "mask"])
+    saved = saved[saved["section"].isin(list(columns))]
+    frame = saved.pivot(index="student_id", columns="section", values="mask").rename(columns=columns)
+    frame = frame.reindex(index=pd.Index(student_ids, name="student_id"), columns=list(columns.values()))
+    return frame.fillna(0).astype(np.uint64)
+
+
+def _lab_edges(lab, rubric):
+    spec = rubric.lab_criteria[lab]
+    # searchsorted(side="left") maps 0 -> Excellent, 1..good_max -> Good,
+    # up to bad_threshold - 1 -> Average and anything above -> Bad
+    return np.array([0, spec["good_max"], spec["bad_threshold"] - 1])
+
+
+def grade_lab_masks(lab, masks, rubric=RUBRIC):
+    """Return ``(grade_codes, marks)`` arrays for a column of lab masks.
+
+    Grade codes index into ``grading.LAB_GRADES``.
+    """
+    codes = np.searchsorted(_lab_edges(lab, rubric), popcount(masks), side="left")
+    marks = np.array([rubric.lab_marks[lab].get(grade, 0) for grade in LAB_GRADES], dtype=float)
+    return codes, marks[codes]
+
+
+def grade_presentation_masks(masks, rubric=RUBRIC):
+    masks = np.asarray(masks, dtype=np.uint64)
+    bad_bits = np.uint64(presentation_mask([k for k in rubric.presentation_keys if k.startswith("bad_")], rubric))
+    medium_bits = np.uint64(presentation_mask([k for k in rubric.presentation_keys if k.startswith("medium_")], rubric))
+    # Excellent (code 0) covers no selection and "excellent" on its own
+    codes = np.where((masks & bad_bits) != 0, 2, np.where((masks & medium_bits) != 0, 1, 0))
+    marks = np.array([rubric.presentation_marks.get(grade, 0) for grade in PRESENTATION_GRADES], dtype=float)
+    return codes, marks[codes]
+
+
+def grade_cohort(masks, rubric=RUBRIC):
+    """Grade a mask frame, returning the export columns for every row."""
+    codes, marks = grade_presentation_masks(masks["Presentation_Mask"].to_numpy(), rubric)
+    out = {
+        "Presentation_Grade": pd.Categorical.from_codes(codes, PRESENTATION_GRADES),
+        "Presentation_Mark": marks,
+    }
+    total = marks.copy()
+    for lab in rubric.labs:
+        codes, marks = grade_lab_masks(lab, masks[mask_column(lab)].to_numpy(), rubric)
+        out[f"{lab_column(lab)}_Grade"] = pd.Categorical.from_codes(codes, LAB_GRADES)
+        out[f"{lab_column(lab)}_Mark"] = marks
+        total += marks
+    out["Total_Marks"] = total
+    return pd.DataFrame(out, index=masks.index)
+
+
+def changed_sections(old, new):
+    """Labs whose grading differs between two rubrics, and whether the
+    presentation marks changed."""
+    labs = []
+    for lab in new.labs:
+        if lab not in old.lab_criteria:
+            # nothing has been marked against a lab the old rubric lacked
+            continue
+        old_spec, new_spec = old.lab_criteria[lab], new.lab_criteria[lab]
+        if (old_spec["good_max"], old_spec["bad_threshold"]) != (new_spec["good_max"], new_spec["bad_threshold"]) \
+                or old.lab_marks[lab] != new.lab_marks[lab]:
+            labs.append(lab)
+    return labs, old.presentation_marks != new.presentation_marks
+
+
+def what_if(rubric, changes):
+    """A copy of ``rubric`` with some cut-offs or marks changed.
+
+    ``changes`` maps a lab to any of ``good_max``, ``bad_threshold`` and
+    ``marks`` (a grade -> mark dict), and ``"Presentation"`` to a grade ->
+    mark dict.
+    """
+    lab_criteria = {lab: dict(spec) for lab, spec in rubric.lab_criteria.items()}
+    lab_marks = {lab: dict(marks) for lab, marks in rubric.lab_marks.items()}
+    presentation_marks = dict(rubric.presentation_marks)
+    for section, change in changes.items():
+        if section == "Presentation":
+            presentation_marks.update(change)
+            continue
+        for field in ("good_max", "bad_threshold"):
+            if field in change:
+                lab_criteria[section][field] = change[field]
+        lab_marks[section].update(change.get("marks", {}))
+    return Rubric(rubric.presentation_options, presentation_marks, lab_criteria, lab_marks)
+
+
+def regrade(masks, old, new, graded=None):
+    """Regrade a mask frame under a new rubric, touching only what changed.
+
+    ``graded`` is ``grade_cohort(masks, old)`` if already at hand. Returns
+    ``(regraded, moved)``: the full graded frame under ``new`` and, for the
+    students whose total moved, their old and new totals and the difference.
+    """
+    if graded is None:
+        graded = grade_cohort(masks, old)
+    labs, presentation_changed = changed_sections(old, new)
+    regraded = graded.copy()
+    if presentation_changed:
+        _, marks = grade_presentation_masks(masks["Presentation_Mask"].to_numpy(), new)
+        regraded["Presentation_Mark"] = marks
+    for lab in labs:
+        codes, marks = grade_lab_masks(lab, masks[mask_column(lab)].to_numpy(), new)
+        regraded[f"{lab_column(lab)}_Grade"] = pd.Categorical.from_codes(codes, LAB_GRADES)
+        regraded[f"{lab_column(lab)}_Mark"] = marks
+    mark_columns = ["Presentation_Mark"] if presentation_changed else []
+    mark_columns += [f"{lab_column(lab)}_Mark" for lab in labs]
+    # Adjust the totals by the changed columns rather than summing them all again
+    regraded["Total_Marks"] = graded["Total_Marks"] + (regraded[mark_columns] - graded[mark_columns]).sum(axis=1)
+    delta = (regraded["Total_Marks"] - graded["Total_Marks"]).round(6)
+    moved = pd.DataFrame({
+        "Old_Total": graded["Total_Marks"],
+        "New_Total": regraded["Total_Marks"],
+        "Change": delta,
+    })[delta != 0]
+    return regraded, moved
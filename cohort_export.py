@@ -0,0 +1,198 @@
+"""Export every marked student from the results store.
+
+Students are read from the store a chunk at a time in roster order, graded
+with the vectorized grader and written straight out, so memory use stays the
+same for 50 or 50,000 students. The table has the UI's CSV export columns
+plus ``student_id`` and the criteria masks; the feedback archive holds one
+Markdown file per student, rendered in a process pool and written to a ZIP
+as each chunk comes back.
+
+    python cohort_export.py --db marking_results.db --format csv -o cohort.csv
+    python cohort_export.py --db marking_results.db --format zip > feedback.zip
+"""
+
+import argparse
+import io
+import os
+import re
+import sys
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import pandas as pd
+
+import store
+from cohort import grade_cohort, mask_column
+from exports import csv_columns
+from feedback import feedback_document
+from grading import RUBRIC, grade_submission, mask_criteria, mask_presentation
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pq = None
+
+CHUNK_SIZE = 2000
+FORMATS = ("csv", "parquet", "zip")
+
+
+def _date(timestamp):
+    return datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def iter_marked(conn, chunk_size=CHUNK_SIZE):
+    """Yield chunks of ``(student_id, last_saved, {section: mask})`` for the
+    students a marker has finished, including those with nothing ticked."""
+    position = -1
+    while True:
+        students = conn.execute(
+            "SELECT student_id, position, marked_at FROM students WHERE position > ? AND marked_at IS NOT NULL "
+            "ORDER BY position LIMIT ?", (position, chunk_size)
+        ).fetchall()
+        if not students:
+            return
+        position = students[-1][1]
+        student_ids = [student_id for student_id, _, _ in students]
+        saved = {student_id: ({}, [marked_at]) for student_id, _, marked_at in students}
+        rows = conn.execute(
+            f"SELECT student_id, section, mask, updated_at FROM selections "
+            f"WHERE student_id IN ({','.join('?' * len(student_ids))})", student_ids
+        )
+        for student_id, section, mask, updated_at in rows:
+            masks, last_saved = saved[student_id]
+            masks[section] = mask
+            last_saved[0] = max(last_saved[0], updated_at)
+        yield [(student_id, saved[student_id][1][0], saved[student_id][0]) for student_id in student_ids]
+
+
+def mask_columns(rubric=RUBRIC):
+    return ["Presentation_Mask"] + [mask_column(lab) for lab in rubric.labs]
+
+
+def chunk_frame(chunk, rubric=RUBRIC):
+    """The export table for one chunk from ``iter_marked``."""
+    masks = pd.DataFrame(
+        [[masks.get(store.PRESENTATION, 0)] + [masks.get(lab, 0) for lab in rubric.labs] for _, _, masks in chunk],
+        columns=mask_columns(rubric), dtype="uint64"
+    )
+    graded = grade_cohort(masks, rubric)
+    graded["Evaluation_Date"] = [_date(last_saved) for _, last_saved, _ in chunk]
+    for column in ("Presentation_Grade",) + tuple(c for c in graded.columns if c.endswith("_Grade")):
+        graded[column] = graded[column].astype(str)
+    frame = pd.concat([graded[csv_columns(rubric)], masks], axis=1)
+    frame.insert(0, "student_id", [student_id for student_id, _, _ in chunk])
+    return frame
+
+
+def write_csv(conn, out, rubric=RUBRIC):
+    """Write the cohort table as CSV to a text stream."""
+    out.write(",".join(["student_id"] + csv_columns(rubric) + mask_columns(rubric)) + "\n")
+    for chunk in iter_marked(conn):
+        chunk_frame(chunk, rubric).to_csv(out, header=False, index=False, lineterminator="\n")
+
+
+def write_parquet(conn, out, rubric=RUBRIC):
+    """Write the cohort table as Parquet, one row group per chunk."""
+    if pq is None:
+        raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow)")
+    writer = None
+    try:
+        for chunk in iter_marked(conn):
+            table = pa.Table.from_pandas(chunk_frame(chunk, rubric), preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(out, table.schema)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+# The rubric a feedback worker grades against, set when the worker starts
+_worker_rubric = RUBRIC
+
+
+def _init_worker(rubric):
+    global _worker_rubric
+    _worker_rubric = rubric
+
+
+def _render_feedback(chunk):
+    # Runs in a worker process, with the export's rubric sent there once
+    rubric = _worker_rubric
+    files = []
+    for student_id, last_saved, masks in chunk:
+        presentation_mask = masks.get(store.PRESENTATION, 0)
+        lab_masks = {lab: masks.get(lab, 0) for lab in rubric.labs}
+        result = grade_submission(
+            mask_presentation(presentation_mask, rubric),
+            {lab: mask_criteria(lab, mask, rubric) for lab, mask in lab_masks.items()},
+            rubric,
+        )
+        text = feedback_document(result, presentation_mask, lab_masks, _date(last_saved), rubric)
+        files.append((f"{re.sub(r'[^A-Za-z0-9._-]', '_', student_id)}_feedback.md", text))
+    return files
+
+
+def _ordered_map(executor, fn, items, window):
+    # Like executor.map, but only keeps ``window`` chunks in flight
+    pending = deque()
+    for item in items:
+        pending.append(executor.submit(fn, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def write_feedback_zip(conn, out, workers=None, rubric=RUBRIC):
+    """Write a ZIP of per-student feedback files to a binary stream.
+
+    The stream does not need to be seekable, so the archive can be sent as it
+    is built.
+    """
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(rubric,)) as executor, \
+            zipfile.ZipFile(out, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for files in _ordered_map(executor, _render_feedback, iter_marked(conn, CHUNK_SIZE // 4), 2 * workers):
+            for name, text in files:
+                archive.writestr(name, text)
+
+
+def write(conn, export_format, out, rubric=RUBRIC):
+    """Write an export in ``export_format`` to the binary stream ``out``."""
+    if export_format == "csv":
+        text = io.TextIOWrapper(out, encoding="utf-8", newline="")
+        write_csv(conn, text, rubric)
+        text.flush()
+        text.detach()
+    elif export_format == "parquet":
+        write_parquet(conn, out, rubric)
+    else:
+        write_feedback_zip(conn, out, rubric=rubric)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export every marked student from the results store.")
+    parser.add_argument("--db", default="marking_results.db", help="marking database")
+    parser.add_argument("--format", choices=FORMATS, default="csv", help="csv or parquet table, or zip of feedback")
+    parser.add_argument("-o", "--output", default="-", help="file to write (default: stdout)")
+    args = parser.parse_args(argv)
+
+    conn = store.connect(args.db)
+    out = sys.stdout.buffer if args.output == "-" else open(args.output, "wb")
+    try:
+        write(conn, args.format, out)
+    except RuntimeError as exc:
+        print(f"cohort_export: {exc}", file=sys.stderr)
+        return 1
+    finally:
+        if out is not sys.stdout.buffer:
+            out.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
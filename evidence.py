@@ -0,0 +1,251 @@
+"""Suggest missing lab criteria from the text of each submission.
+
+Each submission's text is extracted once in a worker process and kept on
+disk next to the submissions, keyed by content hash (``.evidence/<sha>.v2.txt``),
+together with an inverted index of its tokens (``.evidence/<sha>.json``).
+Rules in ``evidence_rules.json`` (or ``MARKING_EVIDENCE_RULES``) name the
+evidence each criterion needs, as token phrases or regular expressions over
+whole words; a criterion whose evidence is not found is suggested as missing.
+Suggestions only read the small index, never the PDF, so they are cheap
+enough to compute whenever a student is opened.
+
+Text comes from PyMuPDF, or where it is not installed from the literal
+strings of the PDF's text operators, which misses hex strings and fonts with
+custom encodings. Rules look at the whole document. A text of fewer than
+``MIN_TOKENS`` words (a scan without a text layer, or an extraction that
+failed) gets no suggestions, since every criterion would look missing.
+
+    python evidence.py submissions/
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+import precheck
+from grading import RUBRIC
+
+RULES_PATH = os.environ.get(
+    "MARKING_EVIDENCE_RULES", os.path.join(os.path.dirname(os.path.abspath(__file__)), "evidence_rules.json")
+)
+CACHE_DIR = ".evidence"
+# Bump when tokenizing changes; indexes are then rebuilt from the cached text
+INDEX_VERSION = 1
+# Bump when extraction changes; the text, and everything built on it, is
+# then extracted again
+TEXT_VERSION = 2
+MIN_TOKENS = 50
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+_WORD_PUNCTUATION = "\"'`.,;:!?()[]{}<>"
+_STREAM = re.compile(rb"(?<!end)stream\r?\n")
+_TEXT_OP = re.compile(rb"\(((?:\\.|[^\\)])*)\)\s*(?:Tj|'|\")|\[((?:\\.|[^\]\\])*)\]\s*TJ|\bET\b", re.DOTALL)
+_TJ_PART = re.compile(rb"\(((?:\\.|[^\\)])*)\)|(-?\d+(?:\.\d+)?)")
+_ESCAPE = re.compile(rb"\\([0-7]{1,3}|.)", re.DOTALL)
+_ESCAPES = {b"n": b"\n", b"r": b"\r", b"t": b"\t", b"b": b"\b", b"f": b"\f"}
+
+
+def _unescape(literal):
+    def replace(match):
+        char = match.group(1)
+        if char[:1].isdigit():
+            return bytes([int(char, 8) & 0xFF])
+        return _ESCAPES.get(char, char)
+    return _ESCAPE.sub(replace, literal)
+
+
+def _content_text(content):
+    parts = []
+    for match in _TEXT_OP.finditer(content):
+        if match.group(1) is not None:
+            parts.append(_unescape(match.group(1)) + b" ")
+        elif match.group(2) is not None:
+            for piece, offset in _TJ_PART.findall(match.group(2)):
+                if piece:
+                    parts.append(_unescape(piece))
+                elif float(offset) < -200:
+                    # a wide negative offset between glyphs is a word gap
+                    parts.append(b" ")
+            parts.append(b" ")
+        else:
+            parts.append(b"\n")
+    return b"".join(parts).decode("latin-1")
+
+
+def raw_text(data):
+    """Text shown by the uncompressed and Flate-compressed content streams."""
+    chunks = []
+    for match in _STREAM.finditer(data):
+        end = data.find(b"endstream", match.end())
+        stream = data[match.end():end]
+        try:
+            stream = zlib.decompressobj().decompress(stream)
+        except zlib.error:
+            pass
+        if b"BT" in stream:
+            chunks.append(_content_text(stream))
+    return "\n".join(chunks)
+
+
+def extract_text(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    if not precheck.is_pdf(data):
+        return ""
+    # Only the workers extracting text need PyMuPDF
+    try:
+        import pymupdf
+    except ImportError:
+        return raw_text(data)
+    try:
+        with pymupdf.open(stream=data, filetype="pdf") as document:
+            return "\n".join(page.get_text() for page in document)
+    except Exception:
+        return raw_text(data)
+
+
+def text_path(cache_dir, sha256):
+    return os.path.join(cache_dir, f"{sha256}.v{TEXT_VERSION}.txt")
+
+
+def build_index(text):
+    """Token positions and the set of whole words in ``text``."""
+    text = text.lower()
+    tokens = {}
+    for position, token in enumerate(_TOKEN.findall(text)):
+        tokens.setdefault(token, []).append(position)
+    words = sorted({word.strip(_WORD_PUNCTUATION) for word in text.split()} - {""})
+    return {"version": INDEX_VERSION, "text_version": TEXT_VERSION, "tokens": tokens, "words": words}
+
+
+def _index_file(path, cache_dir, sha256):
+    # Runs in a worker process
+    cached = text_path(cache_dir, sha256)
+    if os.path.exists(cached):
+        with open(cached, encoding="utf-8") as f:
+            text = f.read()
+    else:
+        text = extract_text(path)
+        with open(f"{cached}.tmp", "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(f"{cached}.tmp", cached)
+    index_path = os.path.join(cache_dir, f"{sha256}.json")
+    with open(f"{index_path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(build_index(text), f)
+    os.replace(f"{index_path}.tmp", index_path)
+
+
+def load_index(folder, sha256):
+    try:
+        with open(os.path.join(folder, CACHE_DIR, f"{sha256}.json"), encoding="utf-8") as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if index.get("version") != INDEX_VERSION or index.get("text_version") != TEXT_VERSION:
+        return None
+    return index
+
+
+def index_folder(folder, results=None, workers=None):
+    """Extract and index every submission not indexed yet.
+
+    ``results`` are ``precheck.scan`` results for the folder (scanned here if
+    not given). Returns the number of files that were indexed.
+    """
+    if results is None:
+        results, _ = precheck.scan(folder, workers=workers)
+    cache_dir = os.path.join(folder, CACHE_DIR)
+    os.makedirs(cache_dir, exist_ok=True)
+    todo = {}
+    for result in results:
+        if result["is_pdf"] and load_index(folder, result["sha256"]) is None:
+            todo.setdefault(result["sha256"], os.path.join(folder, result["file"]))
+    if todo:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(_index_file, todo.values(), [cache_dir] * len(todo), todo.keys(), chunksize=4))
+    return len(todo)
+
+
+def student_index(folder, student_id):
+    """The index of a student's submission, or ``None`` if it is not indexed."""
+    cache = precheck.load_cache(os.path.join(folder, precheck.CACHE_NAME))
+    for name, known in sorted(cache["files"].items()):
+        if precheck.student_id_for(name) == student_id:
+            index = load_index(folder, known["sha256"])
+            if index is not None:
+                return index
+    return None
+
+
+def load_rules(path=RULES_PATH, rubric=RUBRIC):
+    """Compile a rules file into ``{lab: [(bit, phrases, patterns)]}``."""
+    with open(path, encoding="utf-8") as f:
+        spec = json.load(f)
+    rules = {}
+    for lab, criteria in spec.items():
+        if lab not in rubric.criterion_bits:
+            raise ValueError(f"evidence rules name unknown lab {lab!r}")
+        for criterion_id, rule in criteria.items():
+            if criterion_id not in rubric.criterion_bits[lab]:
+                raise ValueError(f"evidence rules name unknown criterion {lab}: {criterion_id!r}")
+            phrases = [_TOKEN.findall(phrase.lower()) for phrase in rule.get("phrases", [])]
+            patterns = [re.compile(pattern) for pattern in rule.get("patterns", [])]
+            rules.setdefault(lab, []).append((rubric.criterion_bits[lab][criterion_id], phrases, patterns))
+    return rules
+
+
+def _has_phrase(tokens, phrase):
+    if not phrase or phrase[0] not in tokens:
+        return False
+    following = [set(tokens.get(token, ())) for token in phrase[1:]]
+    return any(
+        all(start + offset in positions for offset, positions in enumerate(following, start=1))
+        for start in tokens[phrase[0]]
+    )
+
+
+def suggested_masks(index, rules):
+    """Masks of the criteria whose evidence is missing from ``index``."""
+    if sum(len(positions) for positions in index["tokens"].values()) < MIN_TOKENS:
+        return {}
+    masks = {}
+    for lab, lab_rules in rules.items():
+        mask = 0
+        for bit, phrases, patterns in lab_rules:
+            found = any(_has_phrase(index["tokens"], phrase) for phrase in phrases)
+            if not found and patterns:
+                found = any(pattern.search(word) for pattern in patterns for word in index["words"])
+            if not found:
+                mask |= 1 << bit
+        if mask:
+            masks[lab] = mask
+    return masks
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Index submission text and suggest missing criteria.")
+    parser.add_argument("folder", help="folder of submitted files")
+    parser.add_argument("--rules", default=RULES_PATH, help="evidence rules file")
+    parser.add_argument("--workers", type=int, help="worker processes (default: one per CPU)")
+    args = parser.parse_args(argv)
+
+    results, _ = precheck.scan(args.folder, workers=args.workers)
+    indexed = index_folder(args.folder, results, args.workers)
+    rules = load_rules(args.rules)
+    for result in results:
+        index = load_index(args.folder, result["sha256"]) if result["is_pdf"] else None
+        if index is None:
+            continue
+        masks = suggested_masks(index, rules)
+        missing = sum(bin(mask).count("1") for mask in masks.values())
+        print(f"{result['file']}\t{result['student_id'] or '?'}\t{missing}")
+    print(f"Indexed {indexed} of {len(results)} files", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
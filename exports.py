@@ -0,0 +1,25 @@
+"""Column layout of the marking results export."""
+
+from grading import RUBRIC
+
+
+def lab_column(lab):
+    # "Lab 1" -> "Lab1"
+    return lab.replace(" ", "")
+
+
+def csv_columns(rubric=RUBRIC):
+    columns = ["Presentation_Grade", "Presentation_Mark"]
+    for lab in rubric.labs:
+        columns += [f"{lab_column(lab)}_Grade", f"{lab_column(lab)}_Mark"]
+    columns += ["Total_Marks", "Evaluation_Date"]
+    return columns
+
+
+def csv_row(result, evaluation_date):
+    """Values for ``csv_columns`` from a result of ``grade_submission``."""
+    row = [result["presentation_grade"], result["presentation_mark"]]
+    for lab, grade in result["lab_grades"].items():
+        row += [grade, result["lab_marks"][lab]]
+    row += [result["total_marks"], evaluation_date]
+    return row
@@ -0,0 +1,63 @@
+"""Feedback text for graded submissions, shared by the UI and batch tools.
+
+Sections are memoized on (lab, grade, criteria bitmask), so rebuilding the
+detailed feedback for an unchanged lab is a cache hit.
+"""
+
+from functools import lru_cache
+
+from grading import RUBRIC
+
+
+def _join_reasons(phrases):
+    if len(phrases) == 1:
+        return phrases[0]
+    if len(phrases) == 2:
+        return f"{phrases[0]} and {phrases[1]}"
+    return ", ".join(phrases[:-1]) + f", and {phrases[-1]}"
+
+
+def _selected(phrases, mask):
+    return [phrase for i, phrase in enumerate(phrases) if mask >> i & 1]
+
+
+@lru_cache(maxsize=1024)
+def presentation_feedback(grade, mask, rubric=RUBRIC):
+    """Feedback for the presentation keys packed in ``mask``."""
+    if not mask:
+        return f"The presentation is {grade.lower()}."
+    reasons = _join_reasons(_selected(rubric.presentation_phrases, mask))
+    return f"The presentation is {grade.lower()} because {reasons}"
+
+
+@lru_cache(maxsize=8192)
+def lab_feedback(lab, grade, mask, rubric=RUBRIC):
+    """Feedback for a lab whose missing criteria are packed in ``mask``."""
+    if not mask:
+        return f"The description is {grade.lower()}."
+    reasons = _join_reasons(_selected(rubric.criterion_phrases[lab], mask))
+    return f"The description is {grade.lower()} because {reasons}."
+
+
+def presentation_summary(result, presentation_mask, rubric=RUBRIC):
+    text = presentation_feedback(result["presentation_grade"], presentation_mask, rubric)
+    return f"{text} ({result['presentation_mark']} marks)"
+
+
+def lab_summaries(result, lab_masks, rubric=RUBRIC):
+    """One "<lab>: <feedback> (<mark> marks)" line per lab."""
+    return [
+        f"{lab}: {lab_feedback(lab, grade, lab_masks.get(lab, 0), rubric)} ({result['lab_marks'][lab]} marks)"
+        for lab, grade in result["lab_grades"].items()
+    ]
+
+
+def feedback_document(result, presentation_mask, lab_masks, evaluation_date, rubric=RUBRIC):
+    """Build the "Detailed Feedback" text for a result of ``grade_submission``."""
+    text = f"**Evaluation Date:** {evaluation_date}\n\n"
+    text += f"**TOTAL MARKS: {result['total_marks']}/{result['max_total']}**\n\n"
+    text += "**PRESENTATION EVALUATION:**\n"
+    text += presentation_summary(result, presentation_mask, rubric) + "\n\n"
+    text += "**DESCRIPTION EVALUATION:**\n"
+    text += "".join(f"\n{line}\n" for line in lab_summaries(result, lab_masks, rubric))
+    return text
@@ -0,0 +1,225 @@
+"""Merge marks into a gradebook CSV downloaded from the LMS.
+
+The gradebook is read once, every cell as text so columns we do not touch
+are written back exactly as they came, and matched to our results with one
+hash join on the student ID. Student IDs that appear more than once in the
+gradebook are reported and left alone, as are students we marked who are
+not in the gradebook and gradebook rows nobody has marked. The file is
+written back with the encoding, delimiter, quoting and line endings it was
+read with, so the LMS accepts it as an upload.
+
+Our columns are the export columns (``Total_Marks``, ``Lab6_Mark``, ...) and
+``Feedback``. Columns with the same name in the gradebook are filled in;
+``--map`` names any others.
+
+    python gradebook.py gradebook.csv --map "Total_Marks=Labs 6-9 [Total Pts: 18.5 Score] |1234" \\
+        --map "Feedback=Feedback to Learner" -o gradebook_upload.csv
+"""
+
+import argparse
+import codecs
+import csv
+import io
+import sys
+
+import numpy as np
+import pandas as pd
+
+import store
+from cohort_export import chunk_frame, iter_marked
+from feedback import lab_feedback, presentation_feedback
+from exports import lab_column
+from grading import RUBRIC
+
+# Student ID columns of common LMS gradebook downloads, tried in order
+ID_COLUMNS = ("Student ID", "SIS User ID", "ID number", "Username", "student_id")
+NAME_COLUMNS = (("First Name", "Last Name"), ("Student",), ("Full name",))
+
+
+def normalize_ids(ids):
+    return ids.astype(str).str.strip().str.casefold()
+
+
+def read_gradebook(data):
+    """Read gradebook bytes into a frame of strings and the file layout."""
+    if data[:2] in (codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE):
+        encoding = "utf-16"
+    elif data.startswith(codecs.BOM_UTF8):
+        encoding = "utf-8-sig"
+    else:
+        encoding = "utf-8"
+    try:
+        text = data.decode(encoding)
+    except UnicodeDecodeError:
+        encoding = "cp1252"
+        text = data.decode(encoding)
+    header = text.partition("\n")[0]
+    layout = {
+        "encoding": encoding,
+        "delimiter": "\t" if header.count("\t") > header.count(",") else ",",
+        "quoting": csv.QUOTE_ALL if header.startswith('"') else csv.QUOTE_MINIMAL,
+        "lineterminator": "\r\n" if header.endswith("\r") else "\n",
+    }
+    frame = pd.read_csv(io.StringIO(text), sep=layout["delimiter"], dtype=str, keep_default_na=False)
+    return frame, layout
+
+
+def gradebook_bytes(frame, layout):
+    """The gradebook in the layout it was read with."""
+    text = frame.to_csv(index=False, sep=layout["delimiter"], quoting=layout["quoting"],
+                        lineterminator=layout["lineterminator"])
+    return text.encode(layout["encoding"])
+
+
+def find_id_column(frame):
+    columns = {column.strip().casefold(): column for column in frame.columns}
+    for candidate in ID_COLUMNS:
+        if candidate.casefold() in columns:
+            return columns[candidate.casefold()]
+    raise ValueError(f"no student ID column found; expected one of {', '.join(ID_COLUMNS)}")
+
+
+def roster_rows(frame, id_column):
+    """``(student_id, name)`` pairs for ``store.load_roster``."""
+    for name_columns in NAME_COLUMNS:
+        if all(column in frame.columns for column in name_columns):
+            names = frame[list(name_columns)].apply(lambda row: " ".join(filter(None, row)).strip(), axis=1)
+            break
+    else:
+        names = pd.Series("", index=frame.index)
+    ids = frame[id_column].str.strip()
+    keep = (ids != "") & ~ids.duplicated()
+    return list(zip(ids[keep], names[keep]))
+
+
+def _cell(value):
+    if isinstance(value, float):
+        return f"{round(value, 2):g}"
+    return str(value)
+
+
+def _section_lines(frame, label, column, sentence):
+    # A section's grade, mark and sentence all follow from its mask, so each
+    # distinct mask is written once and mapped onto the rows
+    sections = frame[[f"{column}_Mask", f"{column}_Grade", f"{column}_Mark"]].drop_duplicates(f"{column}_Mask")
+    lines = {
+        mask: f"{label}: {sentence(grade, int(mask))} ({mark:g} marks)"
+        for mask, grade, mark in zip(*(sections[c].tolist() for c in sections.columns))
+    }
+    return [lines[mask] for mask in frame[f"{column}_Mask"].tolist()]
+
+
+def feedback_texts(frame, rubric=RUBRIC):
+    """Plain-text feedback for every row of a ``cohort_export.chunk_frame``."""
+    sections = [[f"Total: {_cell(total)}/{rubric.max_total:g}" for total in frame["Total_Marks"].tolist()]]
+    sections.append(_section_lines(frame, "Presentation", "Presentation",
+                                   lambda grade, mask: presentation_feedback(grade, mask, rubric)))
+    for lab in rubric.labs:
+        sections.append(_section_lines(frame, lab, lab_column(lab),
+                                       lambda grade, mask, lab=lab: lab_feedback(lab, grade, mask, rubric)))
+    return ["\n".join(lines) for lines in zip(*sections)]
+
+
+def marked_results(conn, rubric=RUBRIC):
+    """Our export columns and feedback for every marked student, indexed by
+    normalized student ID."""
+    frames = []
+    for chunk in iter_marked(conn):
+        frame = chunk_frame(chunk, rubric)
+        frame["Feedback"] = feedback_texts(frame, rubric)
+        frames.append(frame)
+    if not frames:
+        return pd.DataFrame(columns=["Total_Marks", "Feedback"], index=pd.Index([], name="key"))
+    results = pd.concat(frames, ignore_index=True)
+    results.index = pd.Index(normalize_ids(results["student_id"]), name="key")
+    return results
+
+
+def default_columns(gradebook, results):
+    """Map our columns onto gradebook columns with the same name."""
+    return {column: column for column in results.columns if column in gradebook.columns and column != "student_id"}
+
+
+def merge(gradebook, id_column, results, columns):
+    """Fill gradebook columns from ``results``.
+
+    ``columns`` maps our column names to gradebook column names. Returns the
+    merged gradebook and a report of what could not be matched.
+    """
+    for source, target in columns.items():
+        if source not in results.columns:
+            raise ValueError(f"no column {source!r} in the results; expected one of {', '.join(results.columns)}")
+        if target not in gradebook.columns:
+            raise ValueError(f"no column {target!r} in the gradebook")
+    keys = normalize_ids(gradebook[id_column])
+    present = keys != ""
+    duplicated = present & keys.duplicated(keep=False)
+    known = keys.isin(results.index)
+    matched = known & ~duplicated
+
+    merged = gradebook.copy()
+    joined = pd.DataFrame({"key": keys[matched]}).join(results[list(columns)], on="key")
+    for source, target in columns.items():
+        values = merged[target].to_numpy(dtype=object, copy=True)
+        values[matched.to_numpy()] = np.array([_cell(value) for value in joined[source].tolist()], dtype=object)
+        merged[target] = values
+
+    report = {
+        "matched": int(matched.sum()),
+        "duplicated": sorted(set(gradebook.loc[duplicated, id_column])),
+        "not_marked": list(gradebook.loc[present & ~known, id_column]),
+        "not_in_gradebook": list(results.loc[~results.index.isin(keys), "student_id"]),
+    }
+    return merged, report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Merge marks into an LMS gradebook CSV.")
+    parser.add_argument("gradebook", help="gradebook CSV downloaded from the LMS")
+    parser.add_argument("--db", default="marking_results.db", help="marking database")
+    parser.add_argument("--id-column", help="gradebook column holding student IDs (default: detected)")
+    parser.add_argument("--map", action="append", default=[], metavar="OURS=GRADEBOOK",
+                        help="fill a gradebook column, e.g. 'Total_Marks=Labs 6-9 [Total Pts: 18.5]' (repeatable)")
+    parser.add_argument("--load-roster", action="store_true", help="add the gradebook's students to the roster")
+    parser.add_argument("-o", "--output", help="merged gradebook to write (default: only report)")
+    args = parser.parse_args(argv)
+
+    with open(args.gradebook, "rb") as f:
+        gradebook, layout = read_gradebook(f.read())
+    conn = store.connect(args.db)
+    try:
+        id_column = args.id_column or find_id_column(gradebook)
+        if id_column not in gradebook.columns:
+            raise ValueError(f"no column {id_column!r} in the gradebook")
+        if args.load_roster:
+            rows = roster_rows(gradebook, id_column)
+            store.load_roster(conn, rows)
+            print(f"Loaded {len(rows)} students into the roster", file=sys.stderr)
+        results = marked_results(conn)
+        columns = default_columns(gradebook, results)
+        for text in args.map:
+            source, _, target = text.partition("=")
+            if not target:
+                raise ValueError(f"cannot parse {text!r}; expected e.g. 'Total_Marks=Final Grade'")
+            columns[source.strip()] = target.strip()
+        if not columns:
+            raise ValueError("no gradebook columns to fill; name them with --map")
+        merged, report = merge(gradebook, id_column, results, columns)
+    except ValueError as exc:
+        print(f"gradebook: {exc}", file=sys.stderr)
+        return 1
+
+    if args.output:
+        with open(args.output, "wb") as f:
+            f.write(gradebook_bytes(merged, layout))
+    for problem, label in (("duplicated", "Duplicated in gradebook"), ("not_marked", "Not marked"),
+                           ("not_in_gradebook", "Marked but not in gradebook")):
+        for student_id in report[problem]:
+            print(f"{label}\t{student_id}")
+    print(f"Filled {', '.join(columns.values())} for {report['matched']} of {len(gradebook)} rows",
+          file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,154 @@
+"""Grading engine for the marking tool.
+
+The rubric tables are compiled once into count -> grade -> mark lookup tables,
+so grading a submission is a handful of tuple lookups. Nothing here imports
+Streamlit.
+"""
+
+import hashlib
+import json
+
+from rubric import RUBRIC_PATH, TABLES, load_rubric, presentation_options, presentation_marks, lab_criteria, lab_marks
+
+LAB_GRADES = ("Excellent", "Good", "Average", "Bad")
+
+
+def _lab_grade_for_count(missing_count, good_max, bad_threshold):
+    if missing_count == 0:
+        return "Excellent"
+    if missing_count >= bad_threshold:
+        return "Bad"
+    if missing_count <= good_max:
+        return "Good"
+    return "Average"
+
+
+class Rubric:
+    """Lookup tables compiled from the rubric definitions."""
+
+    def __init__(self, presentation_options, presentation_marks, lab_criteria, lab_marks):
+        self.presentation_options = presentation_options
+        self.presentation_marks = presentation_marks
+        self.lab_criteria = lab_criteria
+        self.lab_marks = lab_marks
+        # identifies the rubric contents, e.g. for keying cached exports
+        tables = [presentation_options, presentation_marks, lab_criteria, lab_marks]
+        self.digest = hashlib.sha1(json.dumps(tables).encode()).hexdigest()[:12]
+        self.labs = tuple(lab_criteria)
+        self.presentation_keys = tuple(presentation_options)
+        self.criterion_ids = {lab: tuple(spec["bad_criteria"]) for lab, spec in lab_criteria.items()}
+        # bit positions for packing selections into integer masks
+        self.presentation_bits = {key: i for i, key in enumerate(self.presentation_keys)}
+        self.criterion_bits = {
+            lab: {criterion_id: i for i, criterion_id in enumerate(ids)}
+            for lab, ids in self.criterion_ids.items()
+        }
+        # lower-cased phrases used when writing feedback sentences
+        self.presentation_phrases = tuple(text.lower() for text in presentation_options.values())
+        self.criterion_phrases = {
+            lab: tuple(text.lower() for text in spec["bad_criteria"].values())
+            for lab, spec in lab_criteria.items()
+        }
+
+        # grade_tables[lab][n] is the grade for n missing criteria
+        self.grade_tables = {}
+        self.mark_tables = {}
+        for lab, spec in lab_criteria.items():
+            grades = tuple(
+                _lab_grade_for_count(count, spec["good_max"], spec["bad_threshold"])
+                for count in range(len(spec["bad_criteria"]) + 1)
+            )
+            self.grade_tables[lab] = grades
+            self.mark_tables[lab] = tuple(lab_marks[lab].get(grade, 0) for grade in grades)
+
+        self.max_total = max(presentation_marks.values())
+        for lab in self.labs:
+            self.max_total += max(lab_marks[lab].values())
+
+
+def compile_rubric(path=RUBRIC_PATH):
+    """Load a rubric file and compile its lookup tables."""
+    tables = load_rubric(path)
+    return Rubric(*(tables[name] for name in TABLES))
+
+
+RUBRIC = Rubric(presentation_options, presentation_marks, lab_criteria, lab_marks)
+
+
+def presentation_grade(selection):
+    if not selection:
+        return "Excellent"
+    if any(key.startswith("bad_") for key in selection):
+        return "Bad"
+    if len(selection) == 1 and selection[0] == "excellent":
+        return "Excellent"
+    if any(key.startswith("medium_") for key in selection):
+        return "Medium"
+    return "No Valid Selection"
+
+
+def grade_presentation(selection, rubric=RUBRIC):
+    """Return ``(grade, mark)`` for a list of selected presentation keys."""
+    grade = presentation_grade(list(selection))
+    return grade, rubric.presentation_marks.get(grade, 0)
+
+
+def grade_lab(lab, missing, rubric=RUBRIC):
+    """Return ``(grade, mark)`` for a lab given its missing criterion IDs."""
+    count = len(missing)
+    grades = rubric.grade_tables[lab]
+    if count >= len(grades):
+        count = len(grades) - 1
+    return grades[count], rubric.mark_tables[lab][count]
+
+
+def lab_mask(lab, missing, rubric=RUBRIC):
+    """Pack a lab's missing criterion IDs into an integer bitmask."""
+    bits = rubric.criterion_bits[lab]
+    mask = 0
+    for criterion_id in missing:
+        mask |= 1 << bits[criterion_id]
+    return mask
+
+
+def mask_criteria(lab, mask, rubric=RUBRIC):
+    """Missing criterion IDs encoded in ``mask``, in rubric order."""
+    return [criterion_id for i, criterion_id in enumerate(rubric.criterion_ids[lab]) if mask >> i & 1]
+
+
+def presentation_mask(selection, rubric=RUBRIC):
+    """Pack selected presentation keys into an integer bitmask."""
+    mask = 0
+    for key in selection:
+        mask |= 1 << rubric.presentation_bits[key]
+    return mask
+
+
+def mask_presentation(mask, rubric=RUBRIC):
+    """Presentation keys encoded in ``mask``, in rubric order."""
+    return [key for i, key in enumerate(rubric.presentation_keys) if mask >> i & 1]
+
+
+def grade_submission(presentation_selection, lab_missing, rubric=RUBRIC):
+    """Grade a whole submission.
+
+    ``lab_missing`` maps lab names to their missing criterion IDs; labs that
+    are not listed have nothing missing.
+    """
+    pres_grade, pres_mark = grade_presentation(presentation_selection, rubric)
+    lab_grades = {}
+    lab_awarded = {}
+    total_marks = pres_mark
+    for lab in rubric.labs:
+        grade, mark = grade_lab(lab, lab_missing.get(lab, ()), rubric)
+        lab_grades[lab] = grade
+        lab_awarded[lab] = mark
+        total_marks += mark
+    return {
+        "presentation_grade": pres_grade,
+        "presentation_mark": pres_mark,
+        "lab_grades": lab_grades,
+        "lab_marks": lab_awarded,
+        "total_marks": total_marks,
+        "max_total": rubric.max_total,
+    }
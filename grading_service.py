@@ -0,0 +1,216 @@
+"""Local HTTP service around the grading engine.
+
+Lets other tools (autograders, LMS sync scripts) grade selections without
+driving the UI. Submissions look like the JSONL lines of ``batch_grade.py``::
+
+    {"student_id": "123", "presentation": ["medium_font"],
+     "labs": {"Lab 2": ["instance_type"]}}
+
+``POST /grade`` grades one submission and ``POST /grade/batch`` grades
+``{"submissions": [...]}`` in one request; each result has the grade, mark
+and feedback sentence per section, the total and the detailed feedback text.
+``GET /rubric`` describes the rubric being graded against.
+
+The listening socket is opened once and shared by several forked worker
+processes, each with its own thread per connection. The rubric is compiled
+before the fork, so every worker starts with it loaded and keeps its own
+feedback caches.
+
+    python grading_service.py --port 8765 --workers 4
+    curl -s localhost:8765/grade -d '{"labs": {"Lab 2": ["instance_type"]}}'
+"""
+
+import argparse
+import json
+import os
+import signal
+import socket
+import sys
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from batch_grade import check_selection
+from feedback import feedback_document, lab_feedback, presentation_feedback
+from grading import RUBRIC, grade_submission, lab_mask, presentation_mask
+
+MAX_BODY = 64 * 1024 * 1024
+
+
+def _selection(submission):
+    # The shapes check_selection expects, so bad JSON is a 400 and not a crash
+    if not isinstance(submission, dict):
+        raise ValueError("expected a JSON object")
+    presentation = submission.get("presentation", [])
+    labs = submission.get("labs", {})
+    if not isinstance(presentation, list):
+        raise ValueError("presentation must be a list of keys")
+    if not isinstance(labs, dict) or not all(isinstance(missing, list) for missing in labs.values()):
+        raise ValueError("labs must map lab names to lists of criteria")
+    try:
+        return presentation, check_selection(presentation, labs)
+    except TypeError:
+        raise ValueError("presentation keys and criteria must be strings") from None
+
+
+def grade(submission, evaluation_date):
+    """The JSON result for one submission."""
+    presentation, labs = _selection(submission)
+    result = grade_submission(presentation, labs)
+    pres_mask = presentation_mask(presentation)
+    lab_masks = {lab: lab_mask(lab, missing) for lab, missing in labs.items()}
+    return {
+        "student_id": str(submission.get("student_id", "")),
+        "total_marks": result["total_marks"],
+        "max_total": result["max_total"],
+        "presentation": {
+            "grade": result["presentation_grade"],
+            "mark": result["presentation_mark"],
+            "feedback": presentation_feedback(result["presentation_grade"], pres_mask),
+        },
+        "labs": {
+            lab: {
+                "grade": lab_grade,
+                "mark": result["lab_marks"][lab],
+                "feedback": lab_feedback(lab, lab_grade, lab_masks.get(lab, 0)),
+            }
+            for lab, lab_grade in result["lab_grades"].items()
+        },
+        "feedback": feedback_document(result, pres_mask, lab_masks, evaluation_date),
+    }
+
+
+def grade_batch(body, evaluation_date):
+    if not isinstance(body, dict) or not isinstance(body.get("submissions"), list):
+        raise ValueError('expected {"submissions": [...]}')
+    results = []
+    for i, submission in enumerate(body["submissions"]):
+        try:
+            results.append(grade(submission, evaluation_date))
+        except ValueError as exc:
+            raise ValueError(f"submission {i}: {exc}") from None
+    return {"results": results}
+
+
+def rubric_info(rubric=RUBRIC):
+    return {
+        "digest": rubric.digest,
+        "max_total": rubric.max_total,
+        "presentation": rubric.presentation_options,
+        "labs": {lab: spec["bad_criteria"] for lab, spec in rubric.lab_criteria.items()},
+    }
+
+
+class GradingHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; without this each
+    # keep-alive response waits out the client's delayed ACK
+    disable_nagle_algorithm = True
+    access_log = False
+
+    def do_GET(self):
+        if self.path == "/rubric":
+            self._send(200, rubric_info())
+        else:
+            self._send(404, {"error": f"no such resource {self.path!r}"})
+
+    def do_POST(self):
+        routes = {"/grade": grade, "/grade/batch": grade_batch}
+        if self.path not in routes:
+            self._send(404, {"error": f"no such endpoint {self.path!r}"})
+            return
+        if "Content-Length" not in self.headers:
+            self.close_connection = True
+            self._send(411, {"error": "Content-Length required"})
+            return
+        length = self.headers["Content-Length"].strip()
+        # int() would also take signs, underscores and non-ASCII digits
+        if not (length.isascii() and length.isdigit()):
+            self.close_connection = True
+            self._send(400, {"error": f"invalid Content-Length {length!r}"})
+            return
+        length = int(length)
+        if length > MAX_BODY:
+            self.close_connection = True
+            self._send(413, {"error": f"request body over {MAX_BODY} bytes"})
+            return
+        try:
+            body = json.loads(self.rfile.read(length))
+            payload = routes[self.path](body, datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+        except ValueError as exc:
+            self._send(400, {"error": str(exc)})
+            return
+        self._send(200, payload)
+
+    def _send(self, status, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        # One stderr line per request would cost more than the grading
+        if self.access_log:
+            super().log_message(format, *args)
+
+
+def _serve_socket(sock):
+    server = ThreadingHTTPServer(sock.getsockname()[:2], GradingHandler, bind_and_activate=False)
+    server.socket.close()
+    server.socket = sock
+    server.daemon_threads = True
+    server.serve_forever()
+
+
+def serve(host, port, workers):
+    """Serve on ``host:port`` with ``workers`` forked processes until interrupted."""
+    sock = socket.create_server((host, port), backlog=1024)
+    host, port = sock.getsockname()[:2]
+    if not hasattr(os, "fork"):
+        workers = 1
+    print(f"Grading on http://{host}:{port} with {workers} worker(s)", file=sys.stderr, flush=True)
+    if workers == 1:
+        _serve_socket(sock)
+        return
+
+    children = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                _serve_socket(sock)
+            finally:
+                os._exit(0)
+        children.append(pid)
+    # Stop the workers however the parent is stopped
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        while children:
+            pid, _ = os.wait()
+            children.remove(pid)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+                os.waitpid(pid, 0)
+            except (ProcessLookupError, ChildProcessError):
+                pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the grading engine over local HTTP.")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8765, help="port to listen on; 0 picks a free one")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="worker processes (default: one per CPU)")
+    parser.add_argument("--access-log", action="store_true", help="log every request to stderr")
+    args = parser.parse_args(argv)
+    GradingHandler.access_log = args.access_log
+    serve(args.host, args.port, max(args.workers, 1))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
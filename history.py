@@ -0,0 +1,189 @@
+"""Undo, redo and history queries over the marking event log.
+
+Every write to the store appends an event with the bits it flipped and the
+mask it left behind (see the triggers in ``store.py``), so each event is also a
+snapshot of its section: a student's state as of any time is the latest
+event per section up to then, found through the ``(student_id, seq)`` index
+without replaying anything. Compaction drops the events a cut-off makes
+redundant and keeps the last one per section, which later events build on;
+undo and redo stop at the cut-off. The app compacts events older than
+``KEEP_DAYS`` when it starts, once ``COMPACT_AFTER`` of them have built up.
+
+Undo reverts a student's latest change that is not undone yet (a reset is
+one change); redo re-applies the latest undo until a new edit is made.
+
+    python history.py log --student 12345 > 12345.jsonl
+    python history.py as-of 12345 "2026-10-01 17:00"
+    python history.py compact --before 2026-09-01 --vacuum
+"""
+
+import argparse
+import json
+import sys
+import time
+from datetime import datetime
+
+import store
+from grading import RUBRIC
+
+KEEP_DAYS = 30
+COMPACT_AFTER = 100_000
+
+# Neither reaches back past the last compaction, whose cut-off may have
+# dropped the events an undo or redo there would depend on
+_LATEST_UNDOABLE = (
+    "SELECT change FROM events e WHERE student_id = ? AND kind != 'undo' "
+    "AND at >= (SELECT compacted_before FROM event_counter) "
+    "AND NOT EXISTS (SELECT 1 FROM events u WHERE u.undoes = e.change) ORDER BY seq DESC LIMIT 1"
+)
+_LATEST_REDOABLE = (
+    "SELECT change FROM events e WHERE student_id = ? AND kind = 'undo' AND seq > COALESCE("
+    "(SELECT seq FROM events WHERE student_id = e.student_id AND kind = 'edit' ORDER BY seq DESC LIMIT 1), 0) "
+    "AND at >= (SELECT compacted_before FROM event_counter) "
+    "AND NOT EXISTS (SELECT 1 FROM events r WHERE r.undoes = e.change) ORDER BY seq DESC LIMIT 1"
+)
+
+
+def _step(conn, student_id, marker, query, kind):
+    # Flip every bit the found change flipped, as one new change
+    row = conn.execute(query, (student_id,)).fetchone()
+    if row is None:
+        return []
+    with store.change(conn, marker, kind, undoes=row[0]):
+        if conn.execute(query, (student_id,)).fetchone() != row:
+            # someone else undid or redid it first
+            return []
+        saved = store.load_student(conn, student_id)
+        events = conn.execute(
+            "SELECT section, flips FROM events WHERE student_id = ? AND change = ? ORDER BY seq", (student_id, row[0])
+        ).fetchall()
+        for section, flips in events:
+            mask, version = saved.get(section, (0, 0))
+            saved[section] = (mask ^ flips, store.save_section(conn, student_id, section, mask ^ flips, version, marker))
+    return [section for section, _ in events]
+
+
+def undo(conn, student_id, marker=""):
+    """Revert the student's latest change; returns the sections it touched."""
+    return _step(conn, student_id, marker, _LATEST_UNDOABLE, "undo")
+
+
+def redo(conn, student_id, marker=""):
+    """Re-apply the student's latest undo; returns the sections it touched."""
+    return _step(conn, student_id, marker, _LATEST_REDOABLE, "redo")
+
+
+def can_undo(conn, student_id):
+    return conn.execute(_LATEST_UNDOABLE, (student_id,)).fetchone() is not None
+
+
+def can_redo(conn, student_id):
+    return conn.execute(_LATEST_REDOABLE, (student_id,)).fetchone() is not None
+
+
+def state_as_of(conn, student_id, at):
+    """``{section: mask}`` for a student as it stood at time ``at``."""
+    rows = conn.execute(
+        "SELECT section, mask, MAX(seq) FROM events WHERE student_id = ? AND at <= ? GROUP BY section",
+        (student_id, at)
+    )
+    return {section: mask for section, mask, _ in rows if mask}
+
+
+def recent_events(conn, student_id, limit=50):
+    """The student's latest events, newest first, as
+    ``(seq, section, flips, mask, marker, at, kind)``."""
+    return conn.execute(
+        "SELECT seq, section, flips, mask, marker, at, kind FROM events WHERE student_id = ? "
+        "ORDER BY seq DESC LIMIT ?", (student_id, limit)
+    ).fetchall()
+
+
+def criterion_name(section, bit, rubric=RUBRIC):
+    if section == store.PRESENTATION:
+        keys = rubric.presentation_keys
+    else:
+        keys = rubric.criterion_ids.get(section, ())
+    return keys[bit] if bit < len(keys) else f"bit{bit}"
+
+
+def toggles(flips, mask):
+    """``(bit, on)`` for every bit an event flipped."""
+    bit = 0
+    while flips >> bit:
+        if flips >> bit & 1:
+            yield bit, bool(mask >> bit & 1)
+        bit += 1
+
+
+def compact(conn, before):
+    """Drop events before ``before`` that a later event of the same section
+    supersedes; returns the number removed."""
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        cursor = conn.execute(
+            "DELETE FROM events WHERE at < ? AND seq NOT IN "
+            "(SELECT MAX(seq) FROM events WHERE at < ? GROUP BY student_id, section)", (before, before)
+        )
+        conn.execute("UPDATE event_counter SET compacted_before = MAX(compacted_before, ?)", (before,))
+    return cursor.rowcount
+
+
+def compact_if_due(conn, keep_days=KEEP_DAYS, min_events=COMPACT_AFTER, now=None):
+    """Compact events older than ``keep_days`` if at least ``min_events`` of
+    them are not compacted yet; returns the number removed."""
+    before = (time.time() if now is None else now) - keep_days * 24 * 60 * 60
+    due = conn.execute(
+        "SELECT COUNT(*) FROM events WHERE at < ? AND at >= (SELECT compacted_before FROM event_counter)", (before,)
+    ).fetchone()[0]
+    if due < min_events:
+        return 0
+    return compact(conn, before)
+
+
+def _timestamp(text):
+    return datetime.fromisoformat(text).timestamp()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Query and compact the marking event log.")
+    parser.add_argument("--db", default="marking_results.db", help="marking database")
+    commands = parser.add_subparsers(dest="command", required=True)
+    log = commands.add_parser("log", help="write criterion toggles as JSON lines")
+    log.add_argument("--student", help="only this student")
+    log.add_argument("--since", type=_timestamp, default=0, help="only events from this time (ISO format)")
+    as_of = commands.add_parser("as-of", help="show a student's selections at a time")
+    as_of.add_argument("student")
+    as_of.add_argument("time", type=_timestamp, help="ISO format, e.g. '2026-10-01 17:00'")
+    compaction = commands.add_parser("compact", help="drop superseded events before a time")
+    compaction.add_argument("--before", type=_timestamp, required=True, help="ISO format cut-off")
+    compaction.add_argument("--vacuum", action="store_true", help="give the freed space back to the disk")
+    args = parser.parse_args(argv)
+
+    conn = store.connect(args.db)
+    if args.command == "log":
+        query = "SELECT seq, student_id, section, flips, mask, marker, at, kind FROM events WHERE at >= ?"
+        params = [args.since]
+        if args.student:
+            query += " AND student_id = ?"
+            params.append(args.student)
+        for seq, student_id, section, flips, mask, marker, at, kind in conn.execute(query + " ORDER BY seq", params):
+            for bit, on in toggles(flips, mask):
+                print(json.dumps({
+                    "seq": seq, "at": datetime.fromtimestamp(at).isoformat(timespec="seconds"),
+                    "student_id": student_id, "section": section, "criterion": criterion_name(section, bit),
+                    "on": on, "marker": marker, "kind": kind,
+                }))
+    elif args.command == "as-of":
+        for section, mask in state_as_of(conn, args.student, args.time).items():
+            print(f"{section}\t{','.join(criterion_name(section, bit) for bit, _ in toggles(mask, mask))}")
+    else:
+        removed = compact(conn, args.before)
+        if args.vacuum:
+            conn.execute("VACUUM")
+        print(f"Removed {removed} superseded events", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
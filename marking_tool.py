@@ -1,7 +1,17 @@
 import streamlit as st
-import pandas as pd
 from datetime import datetime
 import json
+import csv
+import io
+import os
+import tempfile
+import time
+
+import profiling
+from rubric import RUBRIC_PATH, load_rubric
+
+# Times this rerun's sections when MARKING_PROFILE is set
+profiling.start_run()
 
 # Page configuration
 st.set_page_config(
@@ -13,659 +23,1175 @@ st.set_page_config(
 st.title("📋 Student Submission Marking Tool")
 st.markdown("---")
 
+
+@st.cache_resource(max_entries=4, show_spinner=False)
+def check_rubric_file(path, mtime_ns, size):
+    load_rubric(path)
+
+
+# The modules below compile the rubric when they are imported, so a broken
+# file is reported here rather than failing the import
+try:
+    rubric_stat = os.stat(RUBRIC_PATH)
+    check_rubric_file(RUBRIC_PATH, rubric_stat.st_mtime_ns, rubric_stat.st_size)
+except (OSError, ValueError) as exc:
+    st.error(f"The rubric file {RUBRIC_PATH} could not be loaded: {exc}")
+    st.stop()
+
+import store  # noqa: E402
+import precheck  # noqa: E402
+import evidence  # noqa: E402
+import analytics  # noqa: E402
+import history  # noqa: E402
+import similarity  # noqa: E402
+import pages  # noqa: E402
+from grading import compile_rubric, grade_presentation, grade_lab, lab_mask, mask_criteria, presentation_mask  # noqa: E402
+from feedback import presentation_feedback, lab_feedback, presentation_summary, lab_summaries, feedback_document  # noqa: E402
+from exports import lab_column, csv_columns, csv_row  # noqa: E402
+
 # Initialize session state
 if 'results' not in st.session_state:
     st.session_state.results = {}
+if 'lab_results' not in st.session_state:
+    st.session_state.lab_results = {}
+
+
+def lab_fragment_key(lab_name):
+    return lab_name.replace(" ", "").lower()
+
+
+def rerun_with_summary(fragment_key):
+    # A criterion click only needs its own section and the summary redrawn
+    st.rerun([fragment_key, "summary"])
+
+
+@st.cache_resource
+def get_pool(path):
+    # One pool per server process, shared by every marker's session
+    return store.ConnectionPool(path)
+
+
+pool = get_pool(os.environ.get("MARKING_DB", "marking_results.db"))
+
+
+@st.cache_resource(max_entries=4, show_spinner=False)
+def get_rubric(path, mtime_ns, size):
+    # Compiled once and shared by every session; editing the file changes
+    # the key, so the next run picks up the new rubric
+    return compile_rubric(path)
+
+
+try:
+    rubric = get_rubric(RUBRIC_PATH, rubric_stat.st_mtime_ns, rubric_stat.st_size)
+except ValueError as exc:
+    st.error(f"The rubric file {RUBRIC_PATH} could not be loaded: {exc}")
+    st.stop()
+presentation_options = rubric.presentation_options
+lab_criteria = rubric.lab_criteria
+
+
+def lab_runs(labs, value):
+    # Consecutive labs with the same value(lab), labelled e.g. "Labs 1-7"
+    runs = []
+    for lab in labs:
+        if runs and value(runs[-1][-1]) == value(lab):
+            runs[-1].append(lab)
+        else:
+            runs.append([lab])
+    for run in runs:
+        first, last = run[0], run[-1]
+        if len(run) == 1:
+            label = first
+        elif first.startswith("Lab ") and last.startswith("Lab "):
+            label = f"Labs {first[4:]}-{last[4:]}"
+        else:
+            label = f"{first} to {last}"
+        yield label, run
+
+
+def count_ranges(grades):
+    # "Excellent (0 missing) → Good (1-4) → ..." from a count -> grade table
+    ranges = []
+    for count, grade in enumerate(grades):
+        if ranges and ranges[-1][0] == grade:
+            ranges[-1][2] = count
+        else:
+            ranges.append([grade, count, count])
+    parts = [f"{grade} ({first}{'' if first == last else f'-{last}'})" for grade, first, last in ranges]
+    parts[0] = parts[0][:-1] + " missing)"
+    return " → ".join(parts)
+
+
+@st.cache_resource(max_entries=4, show_spinner=False)
+def rubric_markdown(rubric_digest, _rubric):
+    """Marking Scheme and Instructions text, built once per rubric."""
+    def mark_list(marks):
+        return "\n\n".join(f"• **{grade}:** {mark:g}" for grade, mark in marks.items())
+
+    def mark_chain(marks):
+        return " → ".join(f"{grade} ({mark:g})" for grade, mark in marks.items())
+
+    mark_runs = list(lab_runs(_rubric.labs, lambda lab: _rubric.lab_marks[lab]))
+    if len(mark_runs) == 1:
+        lab_marks = mark_list(_rubric.lab_marks[_rubric.labs[0]])
+    else:
+        lab_marks = "\n\n".join(f"**{label}**\n\n{mark_list(_rubric.lab_marks[run[0]])}" for label, run in mark_runs)
+
+    totals = [f"{max(_rubric.presentation_marks.values()):g}"]
+    for _, run in mark_runs:
+        best = max(_rubric.lab_marks[run[0]].values())
+        totals.append(f"{len(run)}×{best:g}" if len(run) > 1 else f"{best:g}")
+    scheme = [f"- **Presentation**: {mark_chain(_rubric.presentation_marks)}"]
+    scheme += [f"- **{label}**: {mark_chain(_rubric.lab_marks[run[0]])}" for label, run in mark_runs]
+    scheme.append(f"- **Total**: {round(_rubric.max_total, 2):g} marks ({' + '.join(totals)})")
+    logic = ["- **Presentation**: Excellent (no issues) → Medium (some issues) → Bad (major issues)"]
+    logic += [
+        f"- **{label}**: {count_ranges(_rubric.grade_tables[run[0]])}"
+        for label, run in lab_runs(_rubric.labs, lambda lab: _rubric.grade_tables[lab])
+    ]
+
+    instructions = "\n".join([
+        "**How to use this marking tool:**",
+        "",
+        "1. **Presentation Evaluation**: Select all applicable presentation issues using checkboxes",
+        "2. **Description Evaluation**: For each lab:",
+        "   - Check if descriptions are excellent (sufficient and clear)",
+        "   - Mark any missing/insufficient criteria using checkboxes",
+        "3. **Review Summary**: Check the generated grades, marks, and total score",
+        "4. **Copy Feedback**: Use the copy buttons to get specific feedback text",
+        "5. **Export**: Download results as CSV/JSON if needed",
+        "6. **Batched marking** (sidebar): tick a lab's criteria with Tab and Space, then press",
+        "   Ctrl+Enter to save the lab and open the next one (Ctrl+Shift+Enter for the next student)",
+        "",
+        "**Marking Scheme:**",
+        *scheme,
+        "",
+        "**Grading Logic:**",
+        *logic,
+    ])
+    return {"presentation_marks": mark_list(_rubric.presentation_marks), "lab_marks": lab_marks,
+            "instructions": instructions}
+
+
+scheme_text = rubric_markdown(rubric.digest, rubric)
+
+
+@st.cache_resource(max_entries=4, show_spinner=False)
+def install_analytics(rubric_digest, _rubric):
+    # Once per rubric per process; the counters are rebuilt if the rubric changed
+    with pool.connection() as conn:
+        analytics.install(conn, _rubric)
+
+
+install_analytics(rubric.digest, rubric)
+
+
+@st.cache_resource(show_spinner=False)
+def compact_history():
+    # Once per process, so the undo history does not grow without bound
+    with pool.connection() as conn:
+        return history.compact_if_due(conn)
+
+
+compact_history()
+
+
+@st.cache_resource(max_entries=4, show_spinner=False)
+def get_evidence_rules(path, mtime_ns, size, rubric_digest, _rubric):
+    return evidence.load_rules(path, _rubric)
+
+
+def submissions_dir():
+    return (st.session_state.get("submissions_dir") or os.environ.get("MARKING_SUBMISSIONS", "")).strip()
+
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def load_similarity_flags(path, mtime_ns):
+    return similarity.load_flags(path)
+
+
+def similar_submissions(student_id):
+    # Flagged by the pre-check's background pass; re-read when it rewrites them
+    folder = submissions_dir()
+    if not folder:
+        return []
+    path = similarity.flags_path(folder)
+    try:
+        mtime_ns = os.stat(path).st_mtime_ns
+    except OSError:
+        return []
+    return load_similarity_flags(path, mtime_ns).get(student_id, [])
+
+
+@st.cache_resource(show_spinner=False)
+def get_page_cache(folder):
+    # One render pool and image cache per folder, shared by every session
+    return pages.PageCache(folder)
+
+
+@st.cache_data(max_entries=1024, show_spinner=False)
+def find_submission_pdf(folder, student_id, mtime_ns):
+    submission = pages.student_file(folder, student_id)
+    if submission is not None and not submission[2] and pages.AVAILABLE:
+        path, sha256, _ = submission
+        try:
+            submission = (path, sha256, pages.page_count(path))
+        except Exception:
+            return None
+    return submission
+
+
+def submission_pdf(student_id):
+    # (path, sha256, pages) from the pre-check cache; looked up again when it is rewritten
+    folder = submissions_dir()
+    if not folder or student_id is None:
+        return None
+    try:
+        mtime_ns = os.stat(os.path.join(folder, precheck.CACHE_NAME)).st_mtime_ns
+    except OSError:
+        return None
+    return find_submission_pdf(folder, student_id, mtime_ns)
+
+
+def prefetch_pages(student_ids):
+    # Render in the background so flipping pages and moving on find them ready
+    if not pages.AVAILABLE:
+        return
+    for student_id in student_ids:
+        submission = submission_pdf(student_id)
+        if submission is not None:
+            get_page_cache(submissions_dir()).prefetch(*submission)
+
+
+def evidence_suggestions(student_id):
+    # Served from the submission's text index; the PDF itself is never read here
+    folder = submissions_dir()
+    if not folder or not os.path.exists(evidence.RULES_PATH):
+        return {}
+    index = evidence.student_index(folder, student_id)
+    if index is None:
+        return {}
+    rules_stat = os.stat(evidence.RULES_PATH)
+    try:
+        rules = get_evidence_rules(evidence.RULES_PATH, rules_stat.st_mtime_ns, rules_stat.st_size,
+                                   rubric.digest, rubric)
+    except ValueError as exc:
+        st.session_state.notice = f"Evidence rules could not be loaded: {exc}"
+        return {}
+    return evidence.suggested_masks(index, rules)
+
+
+def section_widget_keys(section):
+    if section == store.PRESENTATION:
+        return [f"pres_{key}" for key in presentation_options]
+    return [f"{section}_{criterion_id}" for criterion_id in lab_criteria[section]["bad_criteria"]]
+
+
+def section_mask(section):
+    mask = 0
+    for bit, key in enumerate(section_widget_keys(section)):
+        if st.session_state.get(key):
+            mask |= 1 << bit
+    return mask
+
+
+def load_section_state(section, mask, version):
+    for bit, key in enumerate(section_widget_keys(section)):
+        st.session_state[key] = bool(mask >> bit & 1)
+    st.session_state.section_versions[section] = version
+
+
+def charge_time(section):
+    # The time since the marker's last interaction with the student went
+    # into ``section``
+    student_id = st.session_state.get("current_student")
+    if student_id is None or read_only():
+        return
+    now = time.time()
+    with pool.connection() as conn:
+        store.record_time(conn, student_id, section, st.session_state.marker_name.strip(),
+                          now - st.session_state.get("active_at", now), now)
+    st.session_state.active_at = now
+
+
+def open_lab():
+    return st.session_state.get("timed_lab", next(iter(lab_criteria)))
+
+
+def on_lab_tab_change():
+    # Time spent reading a lab is its own even if nothing was ticked
+    charge_time(open_lab())
+    st.session_state.timed_lab = st.session_state.lab_tab
+
+
+def finish_student():
+    # Only an explicit Done (or batched Save & Next Student) marks a student,
+    # ticked or not, so a student with nothing missing is exported at full
+    # marks; moving to another student alone never does
+    student_id = st.session_state.get("current_student")
+    if student_id is None or read_only():
+        return
+    charge_time(open_lab())
+    marker = st.session_state.marker_name.strip()
+    with pool.connection() as conn:
+        # Pre-ticks the marker has seen and left as they are become theirs
+        for section in st.session_state.get("suggested_sections", ()):
+            try:
+                st.session_state.section_versions[section] = store.save_section(
+                    conn, student_id, section, section_mask(section), 0, marker
+                )
+            except store.ConflictError:
+                pass
+        st.session_state.suggested_sections = set()
+        store.mark_student(conn, student_id, marker)
+
+
+def open_student(student_id):
+    marker = st.session_state.marker_name.strip()
+    previous = st.session_state.get("current_student")
+    if previous != student_id:
+        charge_time(open_lab())
+    with pool.connection() as conn:
+        if previous is not None and previous != student_id:
+            store.release_student(conn, previous, marker)
+        holder = store.claim_student(conn, student_id, marker)
+        saved = store.load_student(conn, student_id)
+        marked = store.marked_at(conn, student_id) is not None
+    # Pre-tick criteria the submission text shows no evidence for, in labs
+    # of a student nobody has finished; they are only saved when the marker
+    # marks the student as done
+    st.session_state.suggested_sections = set()
+    if holder == marker and not marked:
+        for lab, mask in evidence_suggestions(student_id).items():
+            if lab not in saved:
+                saved[lab] = (mask, 0)
+                st.session_state.suggested_sections.add(lab)
+    st.session_state.read_only_by = None if holder == marker else holder
+    st.session_state.claimed_at = time.time()
+    # Marking time runs from opening the student to each interaction
+    st.session_state.active_at = time.time()
+    st.session_state.section_versions = {}
+    for section in (store.PRESENTATION, *lab_criteria):
+        load_section_state(section, *saved.get(section, (0, 0)))
+        st.session_state.pop(f"{section}_page", None)
+    st.session_state.current_student = student_id
+    st.session_state.student_picker = student_id
+
+
+def step_student(student_ids, offset):
+    position = student_ids.index(st.session_state.current_student) + offset
+    open_student(student_ids[max(0, min(position, len(student_ids) - 1))])
+
+
+def save_current_section(section):
+    # Autosave one section from its widget state
+    st.session_state.get("suggested_sections", set()).discard(section)
+    student_id = st.session_state.get("current_student")
+    if student_id is not None:
+        marker = st.session_state.marker_name.strip()
+        versions = st.session_state.section_versions
+        charge_time(section)
+        with pool.connection() as conn:
+            try:
+                versions[section] = store.save_section(
+                    conn, student_id, section, section_mask(section), versions[section], marker
+                )
+            except store.ConflictError:
+                load_section_state(section, *store.load_student(conn, student_id).get(section, (0, 0)))
+                st.session_state.notice = f"{section} was changed by another marker and has been reloaded."
+                st.rerun()
+            if time.time() - st.session_state.claimed_at > store.CLAIM_TTL / 2:
+                store.claim_student(conn, student_id, marker)
+                st.session_state.claimed_at = time.time()
+
+
+def on_criterion_change(section, fragment_key):
+    # Autosave just the section that changed before redrawing it; the first
+    # change to a student redraws the page so Undo is enabled
+    save_current_section(section)
+    if st.session_state.get("can_undo", True):
+        rerun_with_summary(fragment_key)
+    else:
+        st.rerun()
+
+
+def on_lab_submit(lab_name, next_student):
+    # Batched mode: a lab's ticks arrive together, are saved once and the
+    # next lab (or, after the last lab, the next student) is opened
+    save_current_section(lab_name)
+    labs = list(lab_criteria)
+    student_id = st.session_state.get("current_student")
+    if student_id is not None and (next_student or lab_name == labs[-1]):
+        finish_student()
+        with pool.connection() as conn:
+            student_ids = [student_id for student_id, _ in store.roster(conn)]
+        step_student(student_ids, 1)
+        st.session_state.lab_tab = st.session_state.timed_lab = labs[0]
+    elif lab_name != labs[-1]:
+        st.session_state.lab_tab = st.session_state.timed_lab = labs[labs.index(lab_name) + 1]
+    st.rerun()
+
+
+def reset_fields():
+    student_id = st.session_state.get("current_student")
+    if student_id is None:
+        st.session_state.clear()
+    else:
+        with pool.connection() as conn:
+            store.clear_student(conn, student_id, st.session_state.marker_name.strip())
+        open_student(student_id)
+
+
+def step_history(redo):
+    # Undo or redo the student's latest change and reload the sections it touched
+    student_id = st.session_state.current_student
+    with pool.connection() as conn:
+        step = history.redo if redo else history.undo
+        sections = step(conn, student_id, st.session_state.marker_name.strip())
+        saved = store.load_student(conn, student_id)
+    for section in sections:
+        st.session_state.get("suggested_sections", set()).discard(section)
+        if section in st.session_state.section_versions:
+            load_section_state(section, *saved.get(section, (0, 0)))
+    if not sections:
+        st.session_state.notice = "Nothing to redo." if redo else "Nothing to undo."
+
+
+def run_precheck():
+    # Scanning a large folder takes a while, so it runs in the background
+    # and precheck_status reports it when it is done
+    folder = submissions_dir()
+    st.session_state.precheck = (folder, precheck.start(folder, pool, rubric))
+
+
+def collect_precheck():
+    # Called before the widgets are drawn, since reopening the student sets theirs
+    folder, job = st.session_state.pop("precheck")
+    try:
+        results, checked, updated = job.result()
+    except OSError as exc:
+        st.session_state.notice = f"Pre-check failed: {exc}"
+        return
+    st.session_state.notice = (f"Checked {checked} new or changed of {len(results)} files; "
+                               f"pre-selected presentation flags for {len(updated)} students.")
+    st.session_state.indexing = similarity.start_indexing(folder, results)
+    if st.session_state.get("current_student") in updated:
+        open_student(st.session_state.current_student)
+
+
+def precheck_status():
+    _, job = st.session_state.get("precheck", (None, None))
+    indexing = st.session_state.get("indexing")
+    if job is not None and not job.done():
+        st.caption("⏳ Pre-checking submissions in the background…")
+    elif job is not None:
+        # The results are collected at the top of a full run
+        st.rerun()
+    elif indexing is not None and not indexing.done():
+        st.caption("⏳ Indexing submission text in the background…")
+    elif indexing is not None and indexing.exception() is not None:
+        st.error(f"Indexing failed: {indexing.exception()}")
+    elif indexing is not None:
+        indexed, flagged = indexing.result()
+        st.caption(f"Submission text indexed ({indexed} new files); missing criteria are "
+                   f"pre-ticked when an unmarked student is opened. {flagged} near-duplicate "
+                   "pairs flagged.")
+
+
+def background_busy():
+    return any(
+        job is not None and not job.done()
+        for job in (st.session_state.get("precheck", (None, None))[1], st.session_state.get("indexing"))
+    )
+
+
+def read_only():
+    return bool(st.session_state.get("read_only_by"))
+
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def build_csv_payload(export_key, _result, evaluation_date):
+    # One row needs no DataFrame; the csv module keeps pandas off the page load
+    out = io.StringIO()
+    writer = csv.writer(out, lineterminator="\n")
+    writer.writerow(csv_columns(rubric))
+    writer.writerow(csv_row(_result, evaluation_date))
+    return out.getvalue()
+
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def build_json_payload(export_key, _json_data):
+    return json.dumps(_json_data, indent=2)
+
+
+# MARKING SESSION
+if "precheck" in st.session_state and st.session_state.precheck[1].done():
+    collect_precheck()
+if "notice" in st.session_state:
+    st.toast(st.session_state.pop("notice"))
+
+def timing_panel():
+    rows = profiling.summary()
+    if not rows:
+        st.caption("No reruns recorded yet.")
+        return
+    st.markdown("\n".join([
+        "| Section | Runs | p50 ms | p95 ms | Widgets |",
+        "|---|--:|--:|--:|--:|",
+        *(f"| {name} | {count} | {p50:.1f} | {p95:.1f} | {widgets:g} |" for name, count, p50, p95, widgets in rows),
+    ]))
+    logging_to = f" · logged to {profiling.LOG_PATH}" if profiling.LOG_PATH else ""
+    st.caption(f"Last {len(profiling.records())} of up to {profiling.RUNS} reruns in all sessions{logging_to}")
+    download_col, clear_col = st.columns(2)
+    download_col.download_button("Download JSONL", data=profiling.dump_jsonl, file_name="timings.jsonl",
+                                 mime="application/x-ndjson", width="stretch")
+    clear_col.button("Clear", on_click=profiling.clear, width="stretch")
+
+
+with st.sidebar, profiling.section("sidebar"):
+    st.header("👥 Marking Session")
+    st.toggle("⚡ Batched marking", key="batched_mode",
+              help="Tick a lab's criteria without waiting for the page, then save them together. "
+                   "Tab and Space move between and tick criteria; Ctrl+Enter saves and opens the next lab, "
+                   "Ctrl+Shift+Enter saves and opens the next student.")
+    roster_file = st.file_uploader("Roster CSV (student_id, name)", type="csv")
+    if roster_file is not None and st.session_state.get("roster_file_id") != roster_file.file_id:
+        reader = csv.DictReader(io.StringIO(roster_file.getvalue().decode("utf-8-sig")))
+        with pool.connection() as conn:
+            store.load_roster(conn, [
+                (row["student_id"].strip(), (row.get("name") or "").strip())
+                for row in reader if (row.get("student_id") or "").strip()
+            ])
+        st.session_state.roster_file_id = roster_file.file_id
+
+    with pool.connection() as conn:
+        students = store.roster(conn)
+    if not students:
+        st.caption("Upload a roster to mark students one after another with autosave.")
+    elif not st.text_input("Your name", key="marker_name").strip():
+        st.info("Enter your name to start claiming students.")
+    else:
+        student_ids = [student_id for student_id, _ in students]
+        student_names = dict(students)
+        if st.session_state.get("current_student") not in student_names:
+            open_student(student_ids[0])
+
+        st.selectbox(
+            "Student",
+            student_ids,
+            key="student_picker",
+            format_func=lambda student_id: f"{student_id} {student_names[student_id]}".strip(),
+            on_change=lambda: open_student(st.session_state.student_picker)
+        )
+        position = student_ids.index(st.session_state.current_student)
+        prev_col, next_col = st.columns(2)
+        prev_col.button("⬅️ Previous", on_click=step_student, args=(student_ids, -1),
+                        disabled=position == 0, width="stretch")
+        next_col.button("Next ➡️", on_click=step_student, args=(student_ids, 1),
+                        disabled=position == len(student_ids) - 1, width="stretch")
+        st.caption(f"Student {position + 1} of {len(student_ids)} · changes are saved automatically")
+        with pool.connection() as conn:
+            marked = store.marked_at(conn, st.session_state.current_student) is not None
+        st.button("✅ Marked" if marked else "✅ Done with this student", on_click=finish_student,
+                  disabled=read_only(), width="stretch",
+                  help="Only students marked as done are exported; moving to another one does not mark them.")
+        if read_only():
+            st.warning(f"🔒 {st.session_state.current_student} is being marked by "
+                       f"{st.session_state.read_only_by}; view only.")
+        prefetch_pages([st.session_state.current_student, *student_ids[position + 1:position + 2]])
+        similar = similar_submissions(st.session_state.current_student)
+        if similar:
+            st.warning("👯 Similar submissions: " + ", ".join(
+                f"{other} ({similarity:.0%})" for other, similarity in similar
+            ))
+
+        with st.expander("🔎 Pre-check submissions"):
+            st.text_input("Submissions folder", value=os.environ.get("MARKING_SUBMISSIONS", ""),
+                          key="submissions_dir")
+            st.caption(f"Flags non-PDFs, files over {precheck.MAX_PAGES} pages and misnamed files "
+                       "for students not yet marked.")
+            st.button("Run pre-check", on_click=run_precheck, width="stretch",
+                      disabled=not st.session_state.submissions_dir.strip() or "precheck" in st.session_state)
+            # Polls while a background job runs, then stops
+            st.fragment(precheck_status, key="precheck_status", run_every=2 if background_busy() else None)()
+
+    if profiling.ENABLED:
+        with st.expander("⏱️ Section Timings"):
+            timing_panel()
+
 
 # MARKING SCHEME
-st.header("📊 Marking Scheme")
-col1, col2 = st.columns(2)
-
-with col1:
-    st.subheader("Presentation Marks")
-    st.write("• **Excellent:** 1.5")
-    st.write("• **Medium:** 0.8")
-    st.write("• **Bad:** 0.3")
-
-with col2:
-    st.subheader("Lab Marks (Each)")
-    st.write("• **Excellent:** 1.7")
-    st.write("• **Good:** 1.3")
-    st.write("• **Average:** 0.9")
-    st.write("• **Bad:** 0.5")
+with profiling.section("marking scheme"):
+    st.header("📊 Marking Scheme")
+    col1, col2 = st.columns(2)
+
+    with col1:
+        st.subheader("Presentation Marks")
+        st.markdown(scheme_text["presentation_marks"])
+
+    with col2:
+        st.subheader("Lab Marks (Each)")
+        st.markdown(scheme_text["lab_marks"])
 
 st.markdown("---")
 
 # PRESENTATION SECTION
 st.header("🎨 Presentation Evaluation")
 
-presentation_options = {
-    "excellent": "The overall presentation is excellent/perfect.",
-    "medium_signposts": "Some signposts are not clear, such as multi-level headings, indents, dot points, bolding, etc.",
-    "medium_font": "The use of font (spacing, margins, etc.) is not consistent across labs.",
-    "medium_grammar": "Many spelling and grammar mistakes.",
-    "medium_screenshots": "Some screenshots/pictures are not clear.",
-    "medium_formatting": "Some code, commands and/or variables are not well formatted to distinguish themselves from texts.",
-    "bad_not_pdf": "The submitted file is NOT a PDF.",
-    "bad_no_template": "The submitted file didn't follow the provided markdown file as its template.",
-    "bad_too_long": "The submitted file has more than 80 pages in total.",
-    "bad_filename": "The submitted file name does NOT follow the format of studentid_firstname_labs6_9.pdf",
-    "bad_structure": "The submitted file has a poorly/unstructured structure, e.g., no headings, blurring screenshots/pictures."
-}
 
-# Marking scheme for presentation
-presentation_marks = {
-    "Excellent": 1.5,
-    "Medium": 0.8,
-    "Bad": 0.3
-}
+@st.fragment(key="presentation")
+@profiling.timed("presentation")
+def presentation_section():
+    st.write("Select all applicable presentation criteria:")
+    presentation_selection = []
+    for key, description in presentation_options.items():
+        if st.checkbox(description, key=f"pres_{key}",
+                       on_change=on_criterion_change, args=(store.PRESENTATION, "presentation"),
+                       disabled=read_only()):
+            presentation_selection.append(key)
 
-st.write("Select all applicable presentation criteria:")
-presentation_selection = []
-for key, description in presentation_options.items():
-    if st.checkbox(description, key=f"pres_{key}"):
-        presentation_selection.append(key)
+    presentation_grade, presentation_mark = grade_presentation(presentation_selection, rubric)
+    st.session_state.presentation_result = {
+        "selection": presentation_selection,
+        "grade": presentation_grade,
+        "mark": presentation_mark,
+        "mask": presentation_mask(presentation_selection, rubric)
+    }
 
-# Calculate presentation grade
-def calculate_presentation_grade(selections):
-    if not selections:
-        return "Excellent"
-    
-    bad_criteria = [k for k in selections if k.startswith("bad_")]
-    if bad_criteria:
-        return "Bad"
-    
-    excellent_criteria = [k for k in selections if k == "excellent"]
-    if excellent_criteria and len(selections) == 1:
-        return "Excellent"
-    
-    medium_criteria = [k for k in selections if k.startswith("medium_")]
-    if medium_criteria:
-        return "Medium"
-    
-    return "No Valid Selection"
-
-presentation_grade = calculate_presentation_grade(presentation_selection)
-presentation_mark = presentation_marks.get(presentation_grade, 0)
-
-# Display grade and mark with color coding
-if presentation_grade == "Excellent":
-    st.success(f"**Presentation Grade: {presentation_grade} ({presentation_mark} marks)**")
-elif presentation_grade == "Medium":
-    st.warning(f"**Presentation Grade: {presentation_grade} ({presentation_mark} marks)**")
-elif presentation_grade == "Bad":
-    st.error(f"**Presentation Grade: {presentation_grade} ({presentation_mark} marks)**")
-else:
-    st.info(f"**Presentation Grade: {presentation_grade} ({presentation_mark} marks)**")
-
-# Generate and display presentation feedback immediately
-def generate_presentation_feedback(grade, selections):
-    if not selections:
-        return f"The presentation is {grade.lower()}."
-    
-    selected_descriptions = [presentation_options[sel] for sel in selections]
-    
-    if len(selected_descriptions) == 1:
-        return f"The presentation is {grade.lower()} because {selected_descriptions[0].lower()}"
-    elif len(selected_descriptions) == 2:
-        return f"The presentation is {grade.lower()} because {selected_descriptions[0].lower()} and {selected_descriptions[1].lower()}"
+    # Display grade and mark with color coding
+    if presentation_grade == "Excellent":
+        st.success(f"**Presentation Grade: {presentation_grade} ({presentation_mark} marks)**")
+    elif presentation_grade == "Medium":
+        st.warning(f"**Presentation Grade: {presentation_grade} ({presentation_mark} marks)**")
+    elif presentation_grade == "Bad":
+        st.error(f"**Presentation Grade: {presentation_grade} ({presentation_mark} marks)**")
     else:
-        descriptions_text = ", ".join(selected_descriptions[:-1]) + f", and {selected_descriptions[-1]}"
-        return f"The presentation is {grade.lower()} because {descriptions_text.lower()}"
+        st.info(f"**Presentation Grade: {presentation_grade} ({presentation_mark} marks)**")
 
-presentation_feedback = generate_presentation_feedback(presentation_grade, presentation_selection)
-st.info("**Presentation Feedback:**")
-st.write(presentation_feedback)
+    # Generate and display presentation feedback immediately
+    presentation_feedback_text = presentation_feedback(presentation_grade, presentation_mask(presentation_selection, rubric), rubric)
+    st.info("**Presentation Feedback:**")
+    st.write(presentation_feedback_text)
 
-# Copy button for presentation feedback
-if st.button("📋 Copy Presentation Feedback", key="copy_pres_main"):
-    st.code(presentation_feedback, language=None)
+    # Copy button for presentation feedback
+    if st.button("📋 Copy Presentation Feedback", key="copy_pres_main"):
+        st.code(presentation_feedback_text, language=None)
+
+
+presentation_section()
 
 st.markdown("---")
 
 # DESCRIPTION SECTION
 st.header("📝 Description Evaluation")
 
-# Lab criteria definitions
-lab_criteria = {
-    "Lab 1": {
-        "bad_criteria": [
-            "Evidence of a working environment is missing",
-            "Explanations of used commands in installing Linux packages are missing/insufficient",
-            "Explanations of used commands in testing the installed environment are missing",
-            "The code to tabulate the print-based output has not been completed",
-            "The code to tabulate the print-based output has little explanation"
-        ],
-        "bad_threshold": 4
-    },
-    "Lab 2": {
-        "bad_criteria": [
-            "The explanation of the commands used to create an ec2 instance using AWS CLI is too short",
-            "The code to create an ec2 instance has little explanation",
-            "The code to create an EC2 instance is missing",
-            "The instance name does NOT start with a student number",
-            "The instance type is not t3.micro",
-            "The code to Build and run an httpd container has little explanation",
-            "The explanation of the docker commands is too short",
-            "Evidence of getting 'Hello World!' is missing",
-            "Evidence of listing the created instance via the console is missing",
-            "Explanations of manual instance termination are missing"
-        ],
-        "bad_threshold": 8
-    },
-    "Lab 3": {
-        "bad_criteria": [
-            "Explanations of commands used to prepare files and directories are missing",
-            "The bucket name does not follow the format of student ID-cloudstorage",
-            "The code used to save to S3 is missing",
-            "The S3 bucket has an incorrect layout of objects",
-            "The code used to restore from S3 is missing",
-            "Explanations of code used to save to S3 are missing",
-            "Explanations of code used to restore from S3 are missing",
-            "The code used to write attributes of each file in the S3 bucket into the CloudFiles table is missing",
-            "Explanations of code used to write attributes of each file in the S3 bucket into the CloudFiles table are missing",
-            "The DynamoDB should be created locally (not on AWS)",
-            "Some retrieved attributes shown in the CloudFiles table are not correct"
-        ],
-        "bad_threshold": 9
-    },
-    "Lab 4": {
-        "bad_criteria": [
-            "The code used to apply a policy to restrict permission on bucket is missing",
-            "Explanations of commands used to apply a policy to restrict permission on bucket are missing",
-            "The template resource should be instantiated via your own S3 bucket",
-            "Screenshots/outputs for the policy check are missing",
-            "The code used to create a KMS key is missing",
-            "Explanations of code used to create a KMS key are missing",
-            "The code used to attach a policy to the created KMS key is missing",
-            "Explanations of code used to attach a policy to the created KMS key are missing",
-            "Screenshots/outputs for the key check are missing",
-            "The code used to use the KMS key is missing",
-            "Explanations of code used to use the KMS key are missing",
-            "The code used to use the pycryptodome for encryption/decryption is missing",
-            "Explanations of code used to use the pycryptodome for encryption/decryption are missing",
-            "The answer to the question is not valid"
-        ],
-        "bad_threshold": 12
-    },
-    "Lab 5": {
-        "bad_criteria": [
-            "The two EC2 instances must be created in two different availability zones",
-            "You should attach your evidence of creating 2 instances",
-            "The instance name does NOT start with a student number",
-            "The instance type is not t3.micro",
-            "The code used to create an application load balancer is missing",
-            "Explanations of code used to create an application load balancer are missing",
-            "Explanations of commands used to test the application load balancer are missing",
-            "The Apache web page does NOT show the correct instance name",
-            "Explanations of manual instance termination are missing"
-        ],
-        "bad_threshold": 7
-    },
-    "Lab 6": {
-        "bad_criteria": [
-            "No screenshot/description of creating an EC2 (NOTE: students can use script or console)",
-            "The EC2 instance type is not t3.micro",
-            "No screenshot/description of creating a directory with a path, and cd into the directory",
-            "The explanations of commands in installing python3 virtual environment packages are missing",
-            "The explanations of commands in setting a python3 virtual environment are missing",
-            "The explanations of commands in activating a python3 virtual environment are missing",
-            "No description of the file contents of /etc/nginx/sites-enabled/default",
-            "No screenshot/description of restarting nginx",
-            "No screenshot of accessing the instance's IP address after restarting the web server",
-            "No description of polls/views.py or /urls.py or lab/urls.py edited to set up django",
-            "No screenshot of accessing the specific URL after restarting the web server",
-            "No screenshot/description of creating an application load balancer (NOTE: students can use script or console)",
-            "No screenshot/description of health check (NOTE: Django server showing requests or AWS console showing healthy status is sufficient)",
-            "No screenshot/description of accessing the specific URL after health check",
-            "No screenshot/description of creating an AWS DynamoDB table (NOTE: students can use script or console)",
-            "No explanation of the given TEMPLATES section",
-            "No explanation of the given files.html",
-            "No explanation of the given views.py",
-            "No screenshot/description of running a Django application",
-            "No screenshot of accessing the web page (need to include the URL)",
-            "No screenshot/description of deleting the instance",
-            "No screenshot/description of deleting the load balancer",
-            "No screenshot/description of deleting the AWS DynamoDB table"
-        ],
-        "bad_threshold": 17
-    },
-    "Lab 7": {
-        "bad_criteria": [
-            "No screenshot/description of creating an EC2 instance (NOTE: students can use script or console)",
-            "The EC2 instance type is not t3.micro",
-            "No screenshot/description of installing fabric.",
-            "The explanation of the config file is not sufficient, e.g, what does Hostname mean? What does User mean?",
-            "The explanation of the fabric code that connects with the instance is not sufficient, e.g. what does Connection mean? What does c.run mean? What does uname-s mean?",
-            "In fabric for automation, no description of code in installing/setting/activating the Python 3 virtual environment",
-            "In fabric for automation, no description of code for installing/configuring/restarting nginx",
-            "In fabric for automation, no description of code in creating and setting up Django inside the created EC2 instance",
-            "No screenshot/description of the URL access in the end (Django, not nginx)",
-            "No screenshot/description of deleting the instance"
-        ],
-        "bad_threshold": 7
-    },
-    "Lab 8": {
-        "bad_criteria": [
-            "No explanation of the Dockerfile",
-            "No screenshot/description of testing the image",
-            "No explanation of the script that creates an ECR repository",
-            "No explanation of the script that gets the Docker token",
-            "No screenshot/description of explaining or running the output command",
-            "No explanation of the tagging or pushing commands",
-            "No screenshot/description of pushing the local Docker image onto ECR successfully",
-            "No explanation of the script that creates a task definition for an ECS task",
-            "No explanation of the script that creates an ECS service",
-            "No screenshot/description of creating the ECS service successfully",
-            "No explanation of the command that gets a public IP address",
-            "No explanation of the three installed libraries",
-            "No explanation of code in preparing a SageMaker session",
-            "No explanation of commands used in downloading or unzipping the dataset",
-            "No or incorrect answer to the first question (Answer: job, marital, education, default, housing, loan, contact, month, day_of_week, poutcome)",
-            "No or incorrect answer to the second question (Answer: age, duration, campaign, pdays, previous, emp.var.rate, cons.price.idx, cons.conf.idx, euribor3m, nr.employed)",
-            "The explanation of code in reading the dataset into Pandas data frame is missing",
-            "The explanation of code in processing the data is missing",
-            "The explanation of code in removing the economic features and duration is missing",
-            "The explanation of code in splitting the data is missing",
-            "The explanation of code in copying the file to the S3 bucket is missing",
-            "The explanation of code in setting up hyperparameter tuning is missing",
-            "The explanation of code in specifying the XGBoost algorithm is missing",
-            "No screenshot/description of launching hyperparameter tuning job",
-            "No screenshot of the success of completing the tuning job",
-            "No screenshot/description of deleting the S3 bucket",
-            "No screenshot/description of deleting the ECR repository",
-            "No screenshot/description of deleting the ECS service"
-        ],
-        "bad_threshold": 21
-    },
-    "Lab 9": {
-        "bad_criteria": [
-            "The code in detecting 4 different languages from text is missing",
-            "The explanation of the code in detecting 4 different languages from text is missing",
-            "The code in analyzing sentiment is missing",
-            "The explanation of the code in analyzing sentiment is missing",
-            "The code in detecting entities is missing",
-            "The explanation of the code in detecting entities is missing",
-            "No or incorrect answer to the question of describing what entities are",
-            "The code in detecting keyphrases is missing",
-            "The explanation of the code in detecting keyphrases is missing",
-            "No or incorrect answer to the question of describing what keyphrases are",
-            "The code in detecting syntaxes is missing",
-            "The explanation of the code in detecting syntaxes is missing",
-            "No or incorrect answer to the question of describing what syntaxes are",
-            "The code of creating a S3 bucket and adding 4 images to the S3 bucket is missing",
-            "The explanation of the code in label recognition is missing",
-            "The explanation of the code in image moderation is missing",
-            "The explanation of the code in facial analysis is missing",
-            "The explanation of the code in text extraction is missing"
-        ],
-        "bad_threshold": 13
+# Create tabs for each lab; the open tab is tracked so that time spent in
+# a lab is charged to it and batched mode can move on to the next lab
+batched = st.session_state.get("batched_mode", False)
+lab_tabs = st.tabs(list(lab_criteria), key="lab_tab", on_change=on_lab_tab_change)
+
+
+def lab_section(lab_name, active=None):
+    st.subheader(f"{lab_name} - Description Evaluation")
+    
+    # Missing criteria selection - use individual checkboxes
+    st.write(f"Select missing/insufficient criteria for {lab_name}:")
+    if lab_name in st.session_state.get("suggested_sections", ()):
+        st.caption("🔎 Pre-ticked where the submission text shows no evidence; review before moving on.")
+    # In batched mode the ticks stay in the browser until the form is
+    # submitted, so a lab costs one rerun however many criteria are ticked
+    if batched:
+        criteria_container = st.form(f"{lab_fragment_key(lab_name)}_form", enter_to_submit=False)
+        on_change = {}
+    else:
+        criteria_container = st.container()
+        on_change = {"on_change": on_criterion_change, "args": (lab_name, lab_fragment_key(lab_name))}
+    missing_criteria = []
+    with criteria_container:
+        for criterion_id, criterion in lab_criteria[lab_name]["bad_criteria"].items():
+            if st.checkbox(criterion, key=f"{lab_name}_{criterion_id}", disabled=read_only(), **on_change):
+                missing_criteria.append(criterion_id)
+        if batched:
+            # Shortcuts go to the open tab's buttons only
+            next_lab_col, next_student_col = st.columns(2)
+            next_lab_col.form_submit_button(
+                "Save & Next Lab", on_click=on_lab_submit, args=(lab_name, False), type="primary",
+                shortcut="Ctrl+Enter" if active else None, disabled=read_only(), width="stretch"
+            )
+            next_student_col.form_submit_button(
+                "Save & Next Student", on_click=on_lab_submit, args=(lab_name, True),
+                shortcut="Ctrl+Shift+Enter" if active else None, width="stretch",
+                disabled=read_only() or st.session_state.get("current_student") is None
+            )
+    
+    # Only the packed mask is kept; criterion text is looked up when rendering
+    lab_grade, lab_mark = grade_lab(lab_name, missing_criteria, rubric)
+    st.session_state.lab_results[lab_name] = {
+        "grade": lab_grade,
+        "mark": lab_mark,
+        "missing_count": len(missing_criteria),
+        "mask": lab_mask(lab_name, missing_criteria, rubric)
     }
-}
+    
+    # Display grade with color coding and marks
+    if lab_grade == "Excellent":
+        st.success(f"**{lab_name} Grade: {lab_grade} ({lab_mark} marks)**")
+    elif lab_grade == "Good":
+        st.info(f"**{lab_name} Grade: {lab_grade} ({lab_mark} marks)**")
+    elif lab_grade == "Average":
+        st.warning(f"**{lab_name} Grade: {lab_grade} ({lab_mark} marks)**")
+    else:
+        st.error(f"**{lab_name} Grade: {lab_grade} ({lab_mark} marks)**")
+    
+    # Generate and display lab feedback immediately
+    lab_feedback_text = lab_feedback(lab_name, lab_grade, st.session_state.lab_results[lab_name]["mask"], rubric)
+    st.info(f"**{lab_name} Feedback:**")
+    st.write(lab_feedback_text)
+    
+    # Copy button for this lab's feedback
+    if st.button(f"📋 Copy {lab_name} Feedback", key=f"copy_{lab_name}"):
+        st.code(lab_feedback_text, language=None)
 
-# Marking scheme for labs
-lab_marks = {
-    "Lab 1": {"Excellent": 1.7, "Good": 1.3, "Average": 0.9, "Bad": 0.5},
-    "Lab 2": {"Excellent": 1.7, "Good": 1.3, "Average": 0.9, "Bad": 0.5},
-    "Lab 3": {"Excellent": 1.7, "Good": 1.3, "Average": 0.9, "Bad": 0.5},
-    "Lab 4": {"Excellent": 1.7, "Good": 1.3, "Average": 0.9, "Bad": 0.5},
-    "Lab 5": {"Excellent": 1.7, "Good": 1.3, "Average": 0.9, "Bad": 0.5},
-    "Lab 6": {"Excellent": 1.7, "Good": 1.3, "Average": 0.9, "Bad": 0.5},
-    "Lab 7": {"Excellent": 1.7, "Good": 1.3, "Average": 0.9, "Bad": 0.5},
-    "Lab 8": {"Excellent": 2.55, "Good": 1.95, "Average": 1.35, "Bad": 0.75},
-    "Lab 9": {"Excellent": 2.55, "Good": 1.95, "Average": 1.35, "Bad": 0.75}
-}
 
-# Create tabs for each lab
-lab_tabs = st.tabs(["Lab 1", "Lab 2", "Lab 3", "Lab 4", "Lab 5", "Lab 6", "Lab 7", "Lab 8", "Lab 9"])
+# Seconds to wait for a page that has not been prefetched yet
+PAGE_WAIT = 10
+
 
-lab_grades = {}
-lab_feedback = {}
+def page_viewer(lab_name, submission, active=None):
+    if active is False:
+        return
+    if not pages.AVAILABLE:
+        st.caption("📄 Install PyMuPDF (`pip install pymupdf`) to see the submission's pages here.")
+        return
+    path, sha256, page_total = submission
+    number = st.number_input(f"Page of {page_total}", min_value=1, max_value=max(page_total, 1),
+                             key=f"{lab_name}_page")
+    try:
+        image = get_page_cache(submissions_dir()).get(path, sha256, number - 1, timeout=PAGE_WAIT)
+    except Exception as exc:
+        st.error(f"Page {number} of {os.path.basename(path)} could not be rendered: {exc}")
+        return
+    if image is None:
+        st.caption(f"⏳ Page {number} is still rendering; come back to it in a moment.")
+    else:
+        st.image(image, width="stretch")
 
-for i, (lab_name, tab) in enumerate(zip(lab_criteria.keys(), lab_tabs)):
+for lab_name, tab in zip(lab_criteria.keys(), lab_tabs):
     with tab:
-        st.subheader(f"{lab_name} - Description Evaluation")
-        
-        # Missing criteria selection - use individual checkboxes
-        st.write(f"Select missing/insufficient criteria for {lab_name}:")
-        missing_criteria = []
-        for criterion in lab_criteria[lab_name]["bad_criteria"]:
-            if st.checkbox(criterion, key=f"{lab_name}_{criterion}"):
-                missing_criteria.append(criterion)
-        
-        # Calculate grade for this lab based on the specific thresholds
-        def calculate_lab_grade(missing_count, bad_threshold, lab_name):
-            if missing_count == 0:
-                return "Excellent"
-            elif missing_count >= bad_threshold:
-                return "Bad"
-            else:
-                # Lab-specific grading logic
-                if lab_name == "Lab 1":
-                    if missing_count <= 2:
-                        return "Good"
-                    else:
-                        return "Average"
-                elif lab_name in ["Lab 2", "Lab 3", "Lab 4", "Lab 5"]:
-                    if missing_count <= 4:
-                        return "Good"
-                    else:
-                        return "Average"
-                elif lab_name == "Lab 6":
-                    if missing_count <= 0:
-                        return "Excellent"
-                    elif missing_count <= 10:
-                        return "Good"
-                    elif missing_count <= 16:
-                        return "Average"
-                    else:
-                        return "Bad"
-                elif lab_name == "Lab 7":
-                    if missing_count <= 0:
-                        return "Excellent"
-                    elif missing_count <= 3:
-                        return "Good"
-                    elif missing_count <= 6:
-                        return "Average"
-                    else:
-                        return "Bad"
-                elif lab_name == "Lab 8":
-                    if missing_count <= 0:
-                        return "Excellent"
-                    elif missing_count <= 10:
-                        return "Good"
-                    elif missing_count <= 20:
-                        return "Average"
-                    else:
-                        return "Bad"
-                elif lab_name == "Lab 9":
-                    if missing_count <= 0:
-                        return "Excellent"
-                    elif missing_count <= 8:
-                        return "Good"
-                    elif missing_count <= 12:
-                        return "Average"
-                    else:
-                        return "Bad"
-        
-        missing_count = len(missing_criteria)
-        lab_grade = calculate_lab_grade(
-            missing_count, 
-            lab_criteria[lab_name]["bad_threshold"],
-            lab_name
-        )
-        
-        lab_grades[lab_name] = lab_grade
-        lab_feedback[lab_name] = {
-            "missing_criteria": missing_criteria,
-            "missing_count": missing_count
-        }
-        
-        lab_mark = lab_marks.get(lab_name, {}).get(lab_grade, 0) if isinstance(lab_marks.get(lab_name, {}), dict) else lab_marks.get(lab_grade, 0)
-        
-        # Display grade with color coding and marks
-        if lab_grade == "Excellent":
-            st.success(f"**{lab_name} Grade: {lab_grade} ({lab_mark} marks)**")
-        elif lab_grade == "Good":
-            st.info(f"**{lab_name} Grade: {lab_grade} ({lab_mark} marks)**")
-        elif lab_grade == "Average":
-            st.warning(f"**{lab_name} Grade: {lab_grade} ({lab_mark} marks)**")
+        submission = submission_pdf(st.session_state.get("current_student")) if tab.open is not False else None
+        if submission is None:
+            st.fragment(profiling.timed(lab_name)(lab_section), key=lab_fragment_key(lab_name))(lab_name, tab.open)
         else:
-            st.error(f"**{lab_name} Grade: {lab_grade} ({lab_mark} marks)**")
-        
-        # Generate and display lab feedback immediately
-        def generate_lab_feedback(lab_name, grade, lab_data):
-            if not lab_data["missing_criteria"]:
-                return f"The description is {grade.lower()}."
-            
-            missing_items = lab_data["missing_criteria"]
-            
-            if len(missing_items) == 1:
-                return f"The description is {grade.lower()} because {missing_items[0].lower()}."
-            elif len(missing_items) == 2:
-                return f"The description is {grade.lower()} because {missing_items[0].lower()} and {missing_items[1].lower()}."
-            else:
-                items_text = ", ".join(missing_items[:-1]) + f", and {missing_items[-1]}"
-                return f"The description is {grade.lower()} because {items_text.lower()}."
-        
-        lab_feedback_text = generate_lab_feedback(lab_name, lab_grade, lab_feedback[lab_name])
-        st.info(f"**{lab_name} Feedback:**")
-        st.write(lab_feedback_text)
-        
-        # Copy button for this lab's feedback
-        if st.button(f"📋 Copy {lab_name} Feedback", key=f"copy_{lab_name}"):
-            st.code(lab_feedback_text, language=None)
+            criteria_col, pages_col = st.columns([3, 2])
+            with criteria_col:
+                st.fragment(profiling.timed(lab_name)(lab_section), key=lab_fragment_key(lab_name))(lab_name, tab.open)
+            with pages_col:
+                st.fragment(profiling.timed(f"{lab_name} pages")(page_viewer),
+                            key=f"{lab_fragment_key(lab_name)}_pages")(lab_name, submission, tab.open)
 
 st.markdown("---")
 
 # SUMMARY SECTION
 st.header("📊 Summary & Feedback")
 
-col1, col2, col3 = st.columns(3)
 
-with col1:
-    st.subheader("Overall Grades & Marks")
-    st.write(f"**Presentation:** {presentation_grade} ({presentation_mark})")
-    
-    total_marks = presentation_mark
-    for lab, grade in lab_grades.items():
-        lab_mark = lab_marks.get(lab, {}).get(grade, 0) if isinstance(lab_marks.get(lab, {}), dict) else lab_marks.get(grade, 0)
-        total_marks += lab_mark
-        color_map = {
-            "Excellent": "🟢",
-            "Good": "🔵", 
-            "Average": "🟡",
-            "Bad": "🔴"
+@st.fragment(key="summary")
+@profiling.timed("summary")
+def summary_section():
+    # Built from the results cached by the presentation and lab sections
+    presentation_result = st.session_state.presentation_result
+    presentation_selection = presentation_result["selection"]
+    presentation_grade = presentation_result["grade"]
+    presentation_mark = presentation_result["mark"]
+    lab_results = {lab: st.session_state.lab_results[lab] for lab in lab_criteria}
+    lab_grades = {lab: lab_result["grade"] for lab, lab_result in lab_results.items()}
+    lab_awarded_marks = {lab: lab_result["mark"] for lab, lab_result in lab_results.items()}
+    lab_masks = {lab: lab_result["mask"] for lab, lab_result in lab_results.items()}
+    lab_details = {
+        lab: {
+            "mask": lab_result["mask"],
+            "missing_criteria": mask_criteria(lab, lab_result["mask"], rubric),
+            "missing_count": lab_result["missing_count"]
         }
-        icon = color_map.get(grade, "⚪")
-        st.write(f"**{lab}:** {icon} {grade} ({lab_mark})")
-    
-    st.markdown("---")
-    # Update total to reflect different marks for labs 8-9
-    max_total = 1.5 + (7 * 1.7) + (2 * 2.55)  # 1.5 for presentation + 7 labs at 1.7 each + 2 labs at 2.55 each
-    st.write(f"**TOTAL MARKS: {total_marks}/{max_total}**")
-
-with col2:
-    st.subheader("Quick Stats")
-    if lab_grades:
-        grade_counts = {}
-        for grade in lab_grades.values():
-            grade_counts[grade] = grade_counts.get(grade, 0) + 1
-        
-        for grade, count in grade_counts.items():
-            st.write(f"{grade}: {count} lab(s)")
-
-with col3:
-    st.subheader("Mark Breakdown")
-    st.write(f"Presentation: {presentation_mark}")
-    for lab, grade in lab_grades.items():
-        lab_mark = lab_marks.get(lab, {}).get(grade, 0) if isinstance(lab_marks.get(lab, {}), dict) else lab_marks.get(grade, 0)
-        st.write(f"{lab}: {lab_mark}")
-
-# Generate detailed feedback
-st.subheader("Generated Feedback")
-
-def generate_presentation_feedback(grade, selections):
-    if not selections:
-        return f"The presentation is {grade.lower()}."
-    
-    selected_descriptions = [presentation_options[sel] for sel in selections]
-    
-    if len(selected_descriptions) == 1:
-        return f"The presentation is {grade.lower()} because {selected_descriptions[0].lower()}"
-    elif len(selected_descriptions) == 2:
-        return f"The presentation is {grade.lower()} because {selected_descriptions[0].lower()} and {selected_descriptions[1].lower()}"
-    else:
-        descriptions_text = ", ".join(selected_descriptions[:-1]) + f", and {selected_descriptions[-1]}"
-        return f"The presentation is {grade.lower()} because {descriptions_text.lower()}"
-
-def generate_lab_feedback(lab_name, grade, lab_data):
-    if not lab_data["missing_criteria"]:
-        return f"The description is {grade.lower()}."
-    
-    missing_items = lab_data["missing_criteria"]
-    
-    if len(missing_items) == 1:
-        return f"The description is {grade.lower()} because {missing_items[0].lower()}."
-    elif len(missing_items) == 2:
-        return f"The description is {grade.lower()} because {missing_items[0].lower()} and {missing_items[1].lower()}."
-    else:
-        items_text = ", ".join(missing_items[:-1]) + f", and {missing_items[-1]}"
-        return f"The description is {grade.lower()} because {items_text.lower()}"
-
-feedback_text = f"**Evaluation Date:** {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n"
-
-# Add total marks at the top
-total_marks = presentation_mark
-for lab, grade in lab_grades.items():
-    lab_mark = lab_marks.get(lab, {}).get(grade, 0) if isinstance(lab_marks.get(lab, {}), dict) else lab_marks.get(grade, 0)
-    total_marks += lab_mark
-
-max_total = 1.5 + (7 * 1.7) + (2 * 2.55)  # 1.5 for presentation + 7 labs at 1.7 each + 2 labs at 2.55 each
-feedback_text += f"**TOTAL MARKS: {total_marks}/{max_total}**\n\n"
-
-# Presentation feedback
-feedback_text += "**PRESENTATION EVALUATION:**\n"
-presentation_feedback = generate_presentation_feedback(presentation_grade, presentation_selection)
-feedback_text += f"{presentation_feedback} ({presentation_mark} marks)\n\n"
-
-# Lab feedback
-feedback_text += "**DESCRIPTION EVALUATION:**\n"
-for lab_name, grade in lab_grades.items():
-    lab_data = lab_feedback[lab_name]
-    lab_feedback_text = generate_lab_feedback(lab_name, grade, lab_data)
-    lab_mark = lab_marks.get(lab_name, {}).get(grade, 0) if isinstance(lab_marks.get(lab_name, {}), dict) else lab_marks.get(grade, 0)
-    feedback_text += f"\n{lab_name}: {lab_feedback_text} ({lab_mark} marks)\n"
-
-st.text_area("Detailed Feedback", feedback_text, height=400)
-
-# Add individual copy buttons for each section
-col1, col2, col3 = st.columns(3)
-with col1:
-    presentation_feedback_only = f"{generate_presentation_feedback(presentation_grade, presentation_selection)} ({presentation_mark} marks)"
-    if st.button("📋 Copy Presentation Feedback"):
-        st.code(presentation_feedback_only, language=None)
-
-with col2:
-    description_feedback_only = ""
-    for lab_name, grade in lab_grades.items():
-        lab_data = lab_feedback[lab_name]
-        lab_feedback_text = generate_lab_feedback(lab_name, grade, lab_data)
-        lab_mark = lab_marks.get(lab_name, {}).get(grade, 0) if isinstance(lab_marks.get(lab_name, {}), dict) else lab_marks.get(grade, 0)
-        description_feedback_only += f"{lab_name}: {lab_feedback_text} ({lab_mark} marks)\n"
-    
-    if st.button("📋 Copy Description Feedback"):
-        st.code(description_feedback_only, language=None)
-
-with col3:
-    if st.button("📋 Copy Complete Feedback"):
-        st.code(feedback_text, language=None)
-
-# Export options
-st.subheader("Export Options")
-col1, col2 = st.columns(2)
-
-with col1:
-    # Prepare data for CSV export
-    csv_data = {
-        "Presentation_Grade": [presentation_grade],
-        "Presentation_Mark": [presentation_mark],
-        "Lab1_Grade": [lab_grades.get("Lab 1", "")],
-        "Lab1_Mark": [lab_marks.get("Lab 1", {}).get(lab_grades.get("Lab 1", ""), 0)],
-        "Lab2_Grade": [lab_grades.get("Lab 2", "")],
-        "Lab2_Mark": [lab_marks.get("Lab 2", {}).get(lab_grades.get("Lab 2", ""), 0)],
-        "Lab3_Grade": [lab_grades.get("Lab 3", "")],
-        "Lab3_Mark": [lab_marks.get("Lab 3", {}).get(lab_grades.get("Lab 3", ""), 0)],
-        "Lab4_Grade": [lab_grades.get("Lab 4", "")],
-        "Lab4_Mark": [lab_marks.get("Lab 4", {}).get(lab_grades.get("Lab 4", ""), 0)],
-        "Lab5_Grade": [lab_grades.get("Lab 5", "")],
-        "Lab5_Mark": [lab_marks.get("Lab 5", {}).get(lab_grades.get("Lab 5", ""), 0)],
-        "Lab6_Grade": [lab_grades.get("Lab 6", "")],
-        "Lab6_Mark": [lab_marks.get("Lab 6", {}).get(lab_grades.get("Lab 6", ""), 0)],
-        "Lab7_Grade": [lab_grades.get("Lab 7", "")],
-        "Lab7_Mark": [lab_marks.get("Lab 7", {}).get(lab_grades.get("Lab 7", ""), 0)],
-        "Lab8_Grade": [lab_grades.get("Lab 8", "")],
-        "Lab8_Mark": [lab_marks.get("Lab 8", {}).get(lab_grades.get("Lab 8", ""), 0)],
-        "Lab9_Grade": [lab_grades.get("Lab 9", "")],
-        "Lab9_Mark": [lab_marks.get("Lab 9", {}).get(lab_grades.get("Lab 9", ""), 0)],
-        "Total_Marks": [total_marks],
-        "Evaluation_Date": [datetime.now().strftime('%Y-%m-%d %H:%M:%S')]
+        for lab, lab_result in lab_results.items()
     }
+
+    total_marks = sum(lab_awarded_marks.values(), presentation_mark)
+    max_total = rubric.max_total
+
+    # Stamp the evaluation once per selection state so the feedback and
+    # exports stay identical across reruns until a criterion changes
+    selection_key = (rubric.digest, presentation_result["mask"]) + tuple(lab_masks[lab] for lab in lab_criteria)
+    if st.session_state.get("evaluated_for") != selection_key:
+        st.session_state.evaluated_for = selection_key
+        st.session_state.evaluated_at = datetime.now()
+    evaluated_at = st.session_state.evaluated_at
+
+    col1, col2, col3 = st.columns(3)
+
+    with col1:
+        st.subheader("Overall Grades & Marks")
+        st.write(f"**Presentation:** {presentation_grade} ({presentation_mark})")
     
-    df = pd.DataFrame(csv_data)
-    csv = df.to_csv(index=False)
+        for lab, grade in lab_grades.items():
+            lab_mark = lab_awarded_marks[lab]
+            color_map = {
+                "Excellent": "🟢",
+                "Good": "🔵", 
+                "Average": "🟡",
+                "Bad": "🔴"
+            }
+            icon = color_map.get(grade, "⚪")
+            st.write(f"**{lab}:** {icon} {grade} ({lab_mark})")
     
-    st.download_button(
-        label="Download CSV",
-        data=csv,
-        file_name=f"marking_results_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-        mime="text/csv"
-    )
+        st.markdown("---")
+        st.write(f"**TOTAL MARKS: {total_marks}/{max_total}**")
 
-with col2:
-    # JSON export
-    json_data = {
-        "presentation": {
-            "grade": presentation_grade,
-            "mark": presentation_mark,
-            "selected_issues": presentation_selection
-        },
-        "labs": lab_feedback,
+    with col2:
+        st.subheader("Quick Stats")
+        if lab_grades:
+            grade_counts = {}
+            for grade in lab_grades.values():
+                grade_counts[grade] = grade_counts.get(grade, 0) + 1
+        
+            for grade, count in grade_counts.items():
+                st.write(f"{grade}: {count} lab(s)")
+
+    with col3:
+        st.subheader("Mark Breakdown")
+        st.write(f"Presentation: {presentation_mark}")
+        for lab, grade in lab_grades.items():
+            lab_mark = lab_awarded_marks[lab]
+            st.write(f"{lab}: {lab_mark}")
+
+    # Generate detailed feedback
+    st.subheader("Generated Feedback")
+
+    # Assembled from memoized per-section feedback, so unchanged labs are cache hits
+    result = {
+        "presentation_grade": presentation_grade,
+        "presentation_mark": presentation_mark,
         "lab_grades": lab_grades,
-        "lab_marks": {lab: lab_marks.get(lab, {}).get(grade, 0) for lab, grade in lab_grades.items()},
+        "lab_marks": lab_awarded_marks,
         "total_marks": total_marks,
-        "max_marks": max_total,
-        "evaluation_date": datetime.now().isoformat(),
-        "feedback": feedback_text
+        "max_total": max_total
     }
-    
+    with profiling.section("feedback"):
+        feedback_text = feedback_document(
+            result, presentation_result["mask"], lab_masks, evaluated_at.strftime('%Y-%m-%d %H:%M:%S'), rubric
+        )
+
+    st.text_area("Detailed Feedback", feedback_text, height=400)
+
+    # Add individual copy buttons for each section
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        presentation_feedback_only = presentation_summary(result, presentation_result["mask"], rubric)
+        if st.button("📋 Copy Presentation Feedback"):
+            st.code(presentation_feedback_only, language=None)
+
+    with col2:
+        description_feedback_only = "".join(f"{line}\n" for line in lab_summaries(result, lab_masks, rubric))
+
+        if st.button("📋 Copy Description Feedback"):
+            st.code(description_feedback_only, language=None)
+
+    with col3:
+        if st.button("📋 Copy Complete Feedback"):
+            st.code(feedback_text, language=None)
+
+    # Export options
+    st.subheader("Export Options")
+    col1, col2 = st.columns(2)
+
+    # Payloads are only built when a download is clicked, and cached per
+    # selection state so repeated downloads reuse them.
+    export_key = (selection_key, evaluated_at.isoformat())
+
+    @profiling.timed("csv export")
+    def csv_payload():
+        return build_csv_payload(export_key, result, evaluated_at.strftime('%Y-%m-%d %H:%M:%S'))
+
+    @profiling.timed("json export")
+    def json_payload():
+        json_data = {
+            "presentation": {
+                "grade": presentation_grade,
+                "mark": presentation_mark,
+                "mask": presentation_result["mask"],
+                "selected_issues": presentation_selection
+            },
+            "labs": lab_details,
+            "lab_grades": lab_grades,
+            "lab_marks": lab_awarded_marks,
+            "total_marks": total_marks,
+            "max_marks": max_total,
+            "evaluation_date": evaluated_at.isoformat(),
+            "feedback": feedback_text
+        }
+        return build_json_payload(export_key, json_data)
+
+    with col1:
+        st.download_button(
+            label="Download CSV",
+            data=csv_payload,
+            file_name=f"marking_results_{evaluated_at.strftime('%Y%m%d_%H%M%S')}.csv",
+            mime="text/csv"
+        )
+
+    with col2:
+        st.download_button(
+            label="Download JSON",
+            data=json_payload,
+            file_name=f"marking_results_{evaluated_at.strftime('%Y%m%d_%H%M%S')}.json",
+            mime="application/json"
+        )
+
+    if st.session_state.get("current_student") is not None:
+        # Tables load pandas, so closed panels are not rendered at all
+        history_panel = st.expander("🕘 Change History", key="history_panel", on_change="rerun")
+        with history_panel:
+            if history_panel.open:
+                change_history()
+
+
+def change_history():
+    with pool.connection() as conn:
+        events = history.recent_events(conn, st.session_state.current_student)
+    rows = []
+    for _, section, flips, mask, marker, at, kind in events:
+        for bit, on in history.toggles(flips, mask):
+            criterion_id = history.criterion_name(section, bit, rubric)
+            if section == store.PRESENTATION:
+                section_name, label = "Presentation", presentation_options.get(criterion_id, criterion_id)
+            else:
+                section_name = section
+                label = lab_criteria.get(section, {}).get("bad_criteria", {}).get(criterion_id, criterion_id)
+            rows.append({"Time": datetime.fromtimestamp(at).strftime("%H:%M:%S"), "Marker": marker,
+                         "Section": section_name, "Change": f"{'+' if on else '−'} {label}", "Kind": kind})
+    if not rows:
+        st.caption("No changes yet.")
+        return
+    st.dataframe(rows, hide_index=True, height=240)
+
+
+summary_section()
+
+# Reset, undo and redo
+reset_col, undo_col, redo_col = st.columns(3)
+reset_col.button("🔄 Reset All Fields", on_click=reset_fields, disabled=read_only())
+if st.session_state.get("current_student") is not None:
+    with pool.connection() as conn:
+        st.session_state.can_undo = history.can_undo(conn, st.session_state.current_student)
+        can_redo = history.can_redo(conn, st.session_state.current_student)
+    undo_col.button("↩️ Undo", on_click=step_history, args=(False,),
+                    disabled=read_only() or not st.session_state.can_undo, shortcut="Ctrl+Z")
+    redo_col.button("↪️ Redo", on_click=step_history, args=(True,), disabled=read_only() or not can_redo,
+                    shortcut="Ctrl+Shift+Z")
+
+
+@st.fragment(key="cohort")
+@profiling.timed("cohort")
+def cohort_section():
+    import pandas as pd
+
+    # Read from counters the database keeps up to date on every save, so
+    # this costs the same however many students have been marked
+    with pool.connection() as conn:
+        distribution = analytics.grade_distribution(conn)
+        histogram = analytics.total_histogram(conn)
+        markers = analytics.marker_means(conn)
+    if not histogram:
+        st.caption("Nothing has been marked yet.")
+        return
+
+    marked = sum(students for _, students in histogram)
+    mean_total = sum(total * students for total, students in histogram) / marked
+    col1, col2 = st.columns(2)
+    col1.metric("Students Marked", marked)
+    col2.metric("Mean Total", f"{mean_total:.2f}/{rubric.max_total}")
+
+    st.subheader("Grade Distribution")
+    grades = pd.DataFrame(distribution, columns=["Section", "Grade", "Students"])
+    grades = grades.pivot(index="Section", columns="Grade", values="Students")
+    grades = grades.reindex(
+        index=[section for section in (store.PRESENTATION, *lab_criteria) if section in grades.index],
+        columns=[grade for grade in ("Excellent", "Good", "Medium", "Average", "Bad") if grade in grades.columns]
+    ).fillna(0).astype(int).rename(index={store.PRESENTATION: "Presentation"})
+    st.dataframe(grades)
+
+    st.subheader("Total Marks")
+    st.bar_chart(pd.DataFrame(histogram, columns=["Total", "Students"]).set_index("Total"))
+
+    if markers:
+        st.subheader("Per-Marker Means")
+        st.dataframe(pd.DataFrame(markers, columns=["Marker", "Labs Marked", "Mean Lab Mark"]).round(2),
+                     hide_index=True)
+
+    st.subheader("Most Ticked Criteria")
+    lab_name = st.selectbox("Lab", list(lab_criteria), key="cohort_lab")
+    criteria = lab_criteria[lab_name]["bad_criteria"]
+    criterion_ids = rubric.criterion_ids[lab_name]
+    with pool.connection() as conn:
+        top = analytics.top_criteria(conn, lab_name)
+    if not top:
+        st.caption(f"No criteria ticked for {lab_name} yet.")
+        return
+    for bit, students in top:
+        st.write(f"• {criteria[criterion_ids[bit]]} ({students} students)")
+    bit = st.selectbox("Students missing", [bit for bit, _ in top], key="cohort_criterion",
+                       format_func=lambda bit: criteria[criterion_ids[bit]])
+    with pool.connection() as conn:
+        student_ids = analytics.criterion_students(conn, lab_name, bit)
+    st.dataframe(pd.DataFrame({"Student": student_ids}), hide_index=True, height=200)
+
+
+EXPORT_FILES = {
+    "csv": ("cohort_results.csv", "text/csv"),
+    "parquet": ("cohort_results.parquet", "application/vnd.apache.parquet"),
+    "zip": ("cohort_feedback.zip", "application/zip"),
+}
+
+
+@profiling.timed("cohort export file")
+def build_cohort_export(export_format):
+    import cohort_export
+
+    # Written a chunk at a time to a temporary file when the download is clicked
+    out = tempfile.TemporaryFile()
+    with pool.connection() as conn:
+        cohort_export.write(conn, export_format, out, rubric)
+    out.seek(0)
+    return out
+
+
+@st.fragment(key="cohort_export")
+@profiling.timed("cohort export")
+def cohort_export_section():
+    import cohort_export
+
+    st.subheader("Export Cohort")
+    formats = [f for f in cohort_export.FORMATS if f != "parquet" or cohort_export.pq is not None]
+    export_format = st.selectbox(
+        "Format", formats, key="cohort_export_format",
+        format_func={"csv": "CSV", "parquet": "Parquet", "zip": "ZIP of feedback files"}.get
+    )
+    file_name, mime = EXPORT_FILES[export_format]
     st.download_button(
-        label="Download JSON",
-        data=json.dumps(json_data, indent=2),
-        file_name=f"marking_results_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
-        mime="application/json"
+        label="Download Cohort Export",
+        data=lambda: build_cohort_export(export_format),
+        file_name=file_name,
+        mime=mime
     )
 
-# Reset button
-if st.button("🔄 Reset All Fields"):
-    st.session_state.clear()
-    st.rerun()
+
+cohort_panel = st.expander("📈 Cohort Analytics", key="cohort_panel", on_change="rerun")
+with cohort_panel:
+    if cohort_panel.open:
+        cohort_section()
+        cohort_export_section()
+
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def load_gradebook(data):
+    import gradebook
+
+    # Parsed once per uploaded file, not on every rerun
+    return gradebook.read_gradebook(data)
+
+
+@st.fragment(key="gradebook")
+@profiling.timed("gradebook")
+def gradebook_section():
+    import gradebook
+
+    upload = st.file_uploader("Gradebook downloaded from the LMS", type=["csv", "txt", "xls"], key="gradebook_file")
+    if upload is None:
+        st.caption("Upload the LMS gradebook to fill in totals, lab marks and feedback by student ID.")
+        return
+    try:
+        frame, layout = load_gradebook(upload.getvalue())
+    except ValueError as exc:
+        st.error(f"Could not read the gradebook: {exc}")
+        return
+    columns = list(frame.columns)
+    try:
+        id_index = columns.index(gradebook.find_id_column(frame))
+    except ValueError:
+        id_index = 0
+    id_column = st.selectbox("Student ID column", columns, index=id_index, key="gradebook_id_column")
+    sources = ["Total_Marks", "Feedback"] + [f"{lab_column(lab)}_Mark" for lab in lab_criteria]
+    targets = {}
+    for source in st.multiselect("Fill in", sources, default=["Total_Marks"], key="gradebook_sources"):
+        targets[source] = st.selectbox(f"{source} →", columns, key=f"gradebook_target_{source}",
+                                       index=columns.index(source) if source in columns else 0)
+
+    if st.button("Merge Marks", disabled=not targets):
+        with pool.connection() as conn:
+            results = gradebook.marked_results(conn, rubric)
+        merged, report = gradebook.merge(frame, id_column, results, targets)
+        st.session_state.gradebook_merge = (upload.file_id, gradebook.gradebook_bytes(merged, layout), report)
+    merge = st.session_state.get("gradebook_merge")
+    if merge is None or merge[0] != upload.file_id:
+        return
+    _, data, report = merge
+    st.success(f"Filled in {report['matched']} of {len(frame)} gradebook rows.")
+    problems = [
+        {"Problem": label, "Student": student_id}
+        for key, label in (("duplicated", "Duplicated in gradebook"), ("not_marked", "Not marked"),
+                           ("not_in_gradebook", "Marked but not in gradebook"))
+        for student_id in report[key]
+    ]
+    if problems:
+        st.warning(f"{len(problems)} students could not be matched; their rows are unchanged.")
+        st.dataframe(problems, hide_index=True, height=200)
+    st.download_button(
+        label="Download Gradebook",
+        data=data,
+        file_name=f"merged_{upload.name}",
+        mime="text/csv"
+    )
+
+
+gradebook_panel = st.expander("📤 LMS Gradebook", key="gradebook_panel", on_change="rerun")
+with gradebook_panel:
+    if gradebook_panel.open:
+        gradebook_section()
+
+# Labs need this many timed submissions before an estimate is shown
+MIN_TIMED = 5
+
+
+def time_estimates():
+    # Measured from the markers' interactions, see store.record_time
+    with pool.connection() as conn:
+        times = analytics.section_times(conn)
+        throughput = analytics.marker_throughput(conn)
+    lines = [
+        "**Time Estimates** (median active time per submission, last 200 marked):",
+        "",
+        "| Section | Per submission | Timed | Hours so far |",
+        "|---|--:|--:|--:|",
+    ]
+    for section in (store.PRESENTATION, *lab_criteria):
+        median, timed, total = times.get(section, (0, 0, 0))
+        estimate = f"~{median / 60:.1f} min" if timed >= MIN_TIMED else "not enough data"
+        lines.append(f"| {'Presentation' if section == store.PRESENTATION else section} | {estimate} | "
+                     f"{timed} | {total / 3600:.1f} |")
+    if throughput:
+        lines += ["", "**Marker Throughput:**"]
+        lines += [
+            f"- {marker}: {students / (seconds / 3600):.1f} submissions/hour ({students} students)"
+            for marker, students, seconds in throughput if seconds > 0
+        ]
+    st.markdown("\n".join(lines))
+
 
 # Instructions
-with st.expander("📖 Instructions"):
-    st.markdown(f"""
-    **How to use this marking tool:**
-    
-    1. **Presentation Evaluation**: Select all applicable presentation issues using checkboxes
-    2. **Description Evaluation**: For each lab:
-       - Check if descriptions are excellent (sufficient and clear)
-       - Mark any missing/insufficient criteria using checkboxes
-    3. **Review Summary**: Check the generated grades, marks, and total score
-    4. **Copy Feedback**: Use the copy buttons to get specific feedback text
-    5. **Export**: Download results as CSV/JSON if needed
-    
-    **Marking Scheme:**
-    - **Presentation**: Excellent (1.5) → Medium (0.8) → Bad (0.3)
-    - **Labs 1-7**: Excellent (1.7) → Good (1.3) → Average (0.9) → Bad (0.5)
-    - **Labs 8-9**: Excellent (2.55) → Good (1.95) → Average (1.35) → Bad (0.75)
-    - **Total**: 18.5 marks (1.5 + 7×1.7 + 2×2.55)
-    
-    **Grading Logic:**
-    - **Presentation**: Excellent (no issues) → Medium (some issues) → Bad (major issues)
-    - **Labs 1-5**: Follow original thresholds
-    - **Lab 6**: Excellent (0-2 missing) → Good (3-10) → Average (11-16) → Bad (>16)
-    - **Lab 7**: Excellent (0-1 missing) → Good (2-3) → Average (4-6) → Bad (>6)
-    - **Lab 8**: Excellent (0-2 missing) → Good (3-10) → Average (11-20) → Bad (>20)
-    - **Lab 9**: Excellent (0-2 missing) → Good (3-8) → Average (9-12) → Bad (>12)
-    
-    **Time Estimates:**
-    - Lab 1: ~1 min/submission
-    - Lab 2: ~1.5 min/submission  
-    - Lab 3: ~1.5 min/submission
-    - Lab 4: ~1.5 min/submission
-    - Lab 5: ~1.5 min/submission
-    - Lab 6: ~2 min/submission
-    - Lab 7: ~1.5 min/submission
-    - Lab 8: ~2 min/submission
-    - Lab 9: ~1.5 min/submission
-    """)
+instructions_panel = st.expander("📖 Instructions", key="instructions_panel", on_change="rerun")
+with instructions_panel:
+    if instructions_panel.open:
+        st.markdown(scheme_text["instructions"])
+        time_estimates()
+
+profiling.finish_run()
@@ -0,0 +1,220 @@
+"""Page images of submissions for the marking UI's viewer.
+
+Pages are rendered by PyMuPDF (``pip install pymupdf``) to JPEGs ``WIDTH``
+pixels wide, one page per task in a pool of worker processes, and cached
+twice: in memory, as an LRU of up to ``MEMORY_BYTES`` shared by every session
+of the server, and on disk next to the submissions
+(``.pages/<width>/<sha>-<page>.jpg``), where the least recently used images
+are deleted once the folder passes ``DISK_BYTES``. The UI prefetches every
+page of the student being marked and of the next one, so flipping pages or
+moving on to the next student finds them already rendered.
+
+    python pages.py submissions/ 12345
+"""
+
+import argparse
+import importlib.util
+import os
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, wait
+
+import precheck
+
+# PyMuPDF is only imported by the render workers; finding it costs the app
+# nothing at start-up
+AVAILABLE = importlib.util.find_spec("pymupdf") is not None
+
+CACHE_DIR = ".pages"
+WIDTH = 900
+JPEG_QUALITY = 70
+MEMORY_BYTES = 64 * 1024 * 1024
+DISK_BYTES = 1024 * 1024 * 1024
+WORKERS = 2
+
+
+def student_file(folder, student_id):
+    """``(path, sha256, pages)`` of a student's PDF submission, or ``None``."""
+    cache = precheck.load_cache(os.path.join(folder, precheck.CACHE_NAME))
+    for name, known in sorted(cache["files"].items()):
+        content = cache["content"].get(known["sha256"], {})
+        if precheck.student_id_for(name) == student_id and content.get("is_pdf"):
+            return os.path.join(folder, name), known["sha256"], content.get("pages") or 0
+    return None
+
+
+def render_page(path, number, width=WIDTH):
+    """JPEG bytes of page ``number`` (from 0), scaled to ``width`` pixels."""
+    import pymupdf
+
+    with pymupdf.open(path) as document:
+        page = document.load_page(number)
+        zoom = width / page.rect.width
+        pixmap = page.get_pixmap(matrix=pymupdf.Matrix(zoom, zoom), alpha=False)
+        return pixmap.tobytes("jpeg", jpg_quality=JPEG_QUALITY)
+
+
+def page_count(path):
+    import pymupdf
+
+    with pymupdf.open(path) as document:
+        return document.page_count
+
+
+def _render_to_file(path, number, width, image_path):
+    # Runs in a worker process
+    data = render_page(path, number, width)
+    with open(f"{image_path}.{os.getpid()}.tmp", "wb") as f:
+        f.write(data)
+    os.replace(f"{image_path}.{os.getpid()}.tmp", image_path)
+    return data
+
+
+class PageCache:
+    """Rendered pages of one submissions folder."""
+
+    def __init__(self, folder, width=WIDTH, memory_bytes=MEMORY_BYTES, disk_bytes=DISK_BYTES, workers=WORKERS):
+        self.dir = os.path.join(folder, CACHE_DIR, str(width))
+        os.makedirs(self.dir, exist_ok=True)
+        self.width = width
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        # Reentrant: a render that is already done calls back on the scheduling thread
+        self._lock = threading.RLock()
+        # (sha256, page) -> JPEG bytes, least recently used first
+        self._memory = OrderedDict()
+        self._memory_size = 0
+        self._pending = {}
+        self._on_disk = {}
+        for entry in os.scandir(self.dir):
+            if entry.name.endswith(".jpg"):
+                sha256, _, number = entry.name[:-4].rpartition("-")
+                self._on_disk[(sha256, int(number))] = entry.stat().st_size
+        self._disk_size = sum(self._on_disk.values())
+        self._executor = ProcessPoolExecutor(max_workers=workers)
+
+    def _image_path(self, key):
+        return os.path.join(self.dir, f"{key[0]}-{key[1]}.jpg")
+
+    def _remember(self, key, data):
+        # Caller holds the lock
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return
+        self._memory[key] = data
+        self._memory_size += len(data)
+        while self._memory_size > self.memory_bytes and len(self._memory) > 1:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_size -= len(evicted)
+
+    def _trim_disk(self):
+        # Caller holds the lock; reads touch the files, so mtime orders them by use
+        if self._disk_size <= self.disk_bytes:
+            return
+        files = []
+        for key in self._on_disk:
+            try:
+                files.append((os.stat(self._image_path(key)).st_mtime_ns, key))
+            except OSError:
+                files.append((0, key))
+        for _, key in sorted(files):
+            if self._disk_size <= self.disk_bytes * 0.9:
+                break
+            self._disk_size -= self._on_disk.pop(key)
+            try:
+                os.remove(self._image_path(key))
+            except OSError:
+                pass
+
+    def _rendered(self, key, future):
+        with self._lock:
+            self._pending.pop(key, None)
+            if future.exception() is not None:
+                return
+            data = future.result()
+            self._remember(key, data)
+            self._disk_size += len(data) - self._on_disk.get(key, 0)
+            self._on_disk[key] = len(data)
+            self._trim_disk()
+
+    def _schedule(self, path, key):
+        # Caller holds the lock
+        future = self._pending.get(key)
+        if future is None:
+            future = self._executor.submit(_render_to_file, path, key[1], self.width, self._image_path(key))
+            self._pending[key] = future
+            future.add_done_callback(lambda done: self._rendered(key, done))
+        return future
+
+    def get(self, path, sha256, number, timeout=None):
+        """JPEG bytes of a page, rendering it if needed.
+
+        Waits up to ``timeout`` seconds for a render and returns ``None`` if it
+        is not done by then. Render errors are raised.
+        """
+        key = (sha256, number)
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key]
+            on_disk = key in self._on_disk
+        if on_disk:
+            image_path = self._image_path(key)
+            try:
+                with open(image_path, "rb") as f:
+                    data = f.read()
+                os.utime(image_path)
+            except OSError:
+                pass
+            else:
+                with self._lock:
+                    self._remember(key, data)
+                return data
+        with self._lock:
+            future = self._schedule(path, key)
+        if not wait([future], timeout).done:
+            return None
+        return future.result()
+
+    def close(self):
+        self._executor.shutdown()
+
+    def prefetch(self, path, sha256, pages):
+        """Queue renders of the first ``pages`` pages that are not cached yet."""
+        with self._lock:
+            for number in range(pages):
+                key = (sha256, number)
+                if key not in self._memory and key not in self._on_disk:
+                    self._schedule(path, key)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render a student's submission pages into the page cache.")
+    parser.add_argument("folder", help="folder of submitted files")
+    parser.add_argument("student_id")
+    parser.add_argument("--width", type=int, default=WIDTH, help=f"image width in pixels (default: {WIDTH})")
+    args = parser.parse_args(argv)
+
+    if not AVAILABLE:
+        print("pages: rendering needs PyMuPDF (pip install pymupdf)", file=sys.stderr)
+        return 1
+    precheck.scan(args.folder)
+    submission = student_file(args.folder, args.student_id)
+    if submission is None:
+        print(f"pages: no PDF submission for {args.student_id}", file=sys.stderr)
+        return 1
+    path, sha256, pages = submission
+    pages = pages or page_count(path)
+    cache = PageCache(args.folder, args.width)
+    try:
+        for number in range(pages):
+            cache.get(path, sha256, number)
+    finally:
+        cache.close()
+    print(f"Rendered {pages} pages of {os.path.basename(path)}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
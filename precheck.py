@@ -0,0 +1,237 @@
+"""Mechanical pre-check of a folder of submissions.
+
+Three presentation criteria can be decided without reading the work:
+``bad_not_pdf`` (sniffed from the file's magic bytes, not its extension),
+``bad_too_long`` (page count over ``MAX_PAGES``) and ``bad_filename``. Files
+are checked in a process pool and the results are cached on disk by content
+hash, with a (size, mtime) fast path, so re-running over a folder only reads
+new or changed files.
+
+Pages are counted from the page tree without parsing the PDF: the largest
+``/Count`` of a ``/Type /Pages`` node, falling back to counting ``/Type /Page``
+objects, and looking inside compressed object streams when the page tree is
+not stored in the clear.
+
+    python precheck.py submissions/ [--db marking_results.db]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import zlib
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import store
+from grading import RUBRIC, presentation_mask
+
+MAX_PAGES = 80
+FILENAME_PATTERN = re.compile(r"^(?P<student_id>\d+)_(?P<first_name>[A-Za-z][A-Za-z'-]*)_labs6_9\.pdf$", re.IGNORECASE)
+CACHE_NAME = ".precheck-cache.json"
+# Bump when the checks change so stale cache entries are recomputed
+CACHE_VERSION = 1
+
+_PAGES_NODE = re.compile(rb"<<(?:(?!<<|>>).)*?/Type\s*/Pages\b(?:(?!<<|>>).)*>>", re.DOTALL)
+_COUNT = re.compile(rb"/Count\s+(\d+)")
+_PAGE_LEAF = re.compile(rb"/Type\s*/Page(?![A-Za-z])")
+_OBJECT_STREAM = re.compile(rb"/Type\s*/ObjStm\b.*?stream\r?\n", re.DOTALL)
+
+_background = ThreadPoolExecutor(max_workers=1)
+
+
+def is_pdf(head):
+    # Readers accept the header anywhere in the first 1024 bytes
+    return b"%PDF-" in head[:1024]
+
+
+def _page_count(data):
+    counts = [int(n) for node in _PAGES_NODE.findall(data) for n in _COUNT.findall(node)]
+    if counts:
+        return max(counts)
+    return len(_PAGE_LEAF.findall(data))
+
+
+def count_pages(data):
+    """Number of pages in PDF bytes, or ``None`` if no page tree is found."""
+    pages = _page_count(data)
+    if not pages:
+        # PDF 1.5+ files may keep the page tree in compressed object streams
+        inflated = []
+        for match in _OBJECT_STREAM.finditer(data):
+            end = data.find(b"endstream", match.end())
+            try:
+                inflated.append(zlib.decompress(data[match.end():end]))
+            except zlib.error:
+                continue
+        pages = _page_count(b"\n".join(inflated))
+    return pages or None
+
+
+def check_file(path):
+    """Content checks for one file; runs in a worker process."""
+    with open(path, "rb") as f:
+        data = f.read()
+    pdf = is_pdf(data)
+    return {
+        "sha256": hashlib.sha256(data).hexdigest(),
+        "is_pdf": pdf,
+        "pages": count_pages(data) if pdf else None,
+    }
+
+
+def student_id_for(file_name):
+    match = FILENAME_PATTERN.match(file_name) or re.match(r"(?P<student_id>\d+)", file_name)
+    return match["student_id"] if match else None
+
+
+def flags_for(file_name, content):
+    flags = []
+    if not content["is_pdf"]:
+        flags.append("bad_not_pdf")
+    elif (content["pages"] or 0) > MAX_PAGES:
+        flags.append("bad_too_long")
+    if not FILENAME_PATTERN.match(file_name):
+        flags.append("bad_filename")
+    return flags
+
+
+def load_cache(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {"version": CACHE_VERSION, "files": {}, "content": {}}
+    if cache.get("version") != CACHE_VERSION:
+        return {"version": CACHE_VERSION, "files": {}, "content": {}}
+    return cache
+
+
+def _save_cache(path, cache):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(cache, f)
+    os.replace(tmp, path)
+
+
+def scan(folder, cache_path=None, workers=None):
+    """Pre-check every file in ``folder``.
+
+    Returns ``(results, checked)``: one result dict per file, sorted by file
+    name, and the number of files whose contents had to be read.
+    """
+    cache_path = cache_path or os.path.join(folder, CACHE_NAME)
+    cache = load_cache(cache_path)
+    entries = [entry for entry in os.scandir(folder) if entry.is_file() and not entry.name.startswith(".")]
+
+    stale = []
+    for entry in entries:
+        stat = entry.stat()
+        known = cache["files"].get(entry.name)
+        if known is None or known["size"] != stat.st_size or known["mtime_ns"] != stat.st_mtime_ns:
+            stale.append(entry)
+    if stale:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            checked = executor.map(check_file, [entry.path for entry in stale], chunksize=8)
+            for entry, content in zip(stale, checked):
+                stat = entry.stat()
+                sha256 = content.pop("sha256")
+                cache["files"][entry.name] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": sha256}
+                cache["content"][sha256] = content
+    # Forget files that have left the folder
+    names = {entry.name for entry in entries}
+    gone = set(cache["files"]) - names
+    for name in gone:
+        del cache["files"][name]
+    live = {known["sha256"] for known in cache["files"].values()}
+    cache["content"] = {sha256: content for sha256, content in cache["content"].items() if sha256 in live}
+    if stale or gone:
+        _save_cache(cache_path, cache)
+
+    results = []
+    for name in sorted(names):
+        content = cache["content"][cache["files"][name]["sha256"]]
+        results.append({
+            "file": name,
+            "sha256": cache["files"][name]["sha256"],
+            "student_id": student_id_for(name),
+            "is_pdf": content["is_pdf"],
+            "pages": content["pages"],
+            "flags": flags_for(name, content),
+        })
+    return results, len(stale)
+
+
+def student_flags(results):
+    """Presentation flags per student, from their best submitted file.
+
+    A student who sent a correct PDF alongside other files is not flagged for
+    the extras; one with no clean file gets the flags of the file with fewest.
+    """
+    best = {}
+    for result in results:
+        student_id = result["student_id"]
+        if student_id is None:
+            continue
+        if student_id not in best or len(result["flags"]) < len(best[student_id]):
+            best[student_id] = result["flags"]
+    return best
+
+
+def apply_to_store(conn, results, rubric=RUBRIC, marker="precheck"):
+    """Pre-select presentation flags for rostered students not yet marked.
+
+    Returns the ids of the students that were updated. Students already
+    marked, and presentation sections a marker has saved, are left alone.
+    """
+    rostered = {student_id for student_id, _ in store.roster(conn)}
+    marked = set(store.marked_students(conn))
+    updated = []
+    for student_id, flags in student_flags(results).items():
+        if not flags or student_id not in rostered or student_id in marked:
+            continue
+        try:
+            store.save_section(conn, student_id, store.PRESENTATION, presentation_mask(flags, rubric), 0, marker)
+        except store.ConflictError:
+            continue
+        updated.append(student_id)
+    return updated
+
+
+def _scan_and_apply(folder, pool, rubric):
+    results, checked = scan(folder)
+    with pool.connection() as conn:
+        updated = apply_to_store(conn, results, rubric)
+    return results, checked, updated
+
+
+def start(folder, pool, rubric=RUBRIC):
+    """Pre-check a folder and pre-select flags in a background thread.
+
+    Returns a ``Future`` of ``(results, files checked, students updated)``.
+    """
+    return _background.submit(_scan_and_apply, folder, pool, rubric)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pre-check a folder of submissions.")
+    parser.add_argument("folder", help="folder of submitted files")
+    parser.add_argument("--db", help="marking database to pre-select presentation flags in")
+    parser.add_argument("--workers", type=int, help="worker processes (default: one per CPU)")
+    args = parser.parse_args(argv)
+
+    results, checked = scan(args.folder, workers=args.workers)
+    for result in results:
+        pages = "-" if result["pages"] is None else result["pages"]
+        print(f"{result['file']}\t{result['student_id'] or '?'}\t{pages}\t{','.join(result['flags'])}")
+    print(f"Checked {checked} of {len(results)} files", file=sys.stderr)
+    if args.db:
+        conn = store.connect(args.db)
+        updated = apply_to_store(conn, results)
+        print(f"Pre-selected presentation flags for {len(updated)} students", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
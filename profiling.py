@@ -0,0 +1,174 @@
+"""Opt-in timing of the marking UI's sections.
+
+Set ``MARKING_PROFILE=1`` to time every rerun of the script. Each rerun
+becomes one record: how long each section took and how many widgets it
+created. The last ``RUNS`` records of the server process, from every session,
+are kept in a ring buffer for the sidebar's timing panel (p50/p95 per
+section). Set ``MARKING_PROFILE_LOG=runs.jsonl`` as well to append every
+record to that file as a JSON line.
+
+Sections can nest (feedback is part of the summary). A fragment rerun is a
+record of its own, of kind ``fragment``; downloads are built when clicked,
+outside any rerun, and are recorded as kind ``download``.
+
+Disabled, ``timed`` returns the function unchanged and ``section`` a shared
+no-op context manager.
+"""
+
+import json
+import os
+import statistics
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+ENABLED = os.environ.get("MARKING_PROFILE", "").strip() not in ("", "0")
+LOG_PATH = os.environ.get("MARKING_PROFILE_LOG", "").strip()
+RUNS = 1000
+
+_records = deque(maxlen=RUNS)
+_lock = threading.Lock()
+# The records in progress on this thread: ``run`` for a full rerun and
+# ``standalone`` for a fragment rerun or a download
+_local = threading.local()
+_DISABLED = nullcontext()
+
+
+def _widget_count():
+    # Streamlit has no public count of a run's widgets; read the run
+    # context's and do without if that ever moves
+    try:
+        return len(get_script_run_ctx(suppress_warning=True).shared.widget_ids_this_run.snapshot())
+    except AttributeError:
+        return 0
+
+
+def _new_record(kind):
+    ctx = get_script_run_ctx(suppress_warning=True)
+    return {
+        "at": time.time(),
+        "session": ctx.session_id if ctx is not None else None,
+        "kind": kind,
+        "total_ms": 0.0,
+        "widgets": 0,
+        "sections": {},
+        "section_widgets": {},
+        "_start": time.perf_counter(),
+    }
+
+
+def _save(record):
+    record["total_ms"] = (time.perf_counter() - record.pop("_start")) * 1000
+    line = json.dumps(record) if LOG_PATH else None
+    with _lock:
+        _records.append(record)
+        if line is not None:
+            with open(LOG_PATH, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+
+def start_run():
+    """Call at the top of the script."""
+    if ENABLED:
+        # A run cut short by st.rerun or st.stop is dropped
+        _local.run = _new_record("full")
+
+
+def finish_run():
+    """Call at the end of the script."""
+    if not ENABLED:
+        return
+    record = getattr(_local, "run", None)
+    _local.run = None
+    if record is not None:
+        record["widgets"] = _widget_count()
+        _save(record)
+
+
+@contextmanager
+def _timed_section(name):
+    ctx = get_script_run_ctx(suppress_warning=True)
+    record = getattr(_local, "standalone", None)
+    if record is None and not (ctx is not None and ctx.fragment_ids_this_run):
+        record = getattr(_local, "run", None)
+    standalone = record is None
+    if standalone:
+        record = _local.standalone = _new_record("download" if ctx is None else "fragment")
+    widgets = _widget_count()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = (time.perf_counter() - start) * 1000
+        created = _widget_count() - widgets
+        record["sections"][name] = record["sections"].get(name, 0.0) + elapsed
+        record["section_widgets"][name] = record["section_widgets"].get(name, 0) + created
+        if standalone:
+            _local.standalone = None
+            record["widgets"] = created
+            _save(record)
+
+
+def section(name):
+    """Context manager timing a block of the script as section ``name``."""
+    return _timed_section(name) if ENABLED else _DISABLED
+
+
+def timed(name):
+    """Decorator timing every call of a function as section ``name``."""
+    def decorate(func):
+        if not ENABLED:
+            return func
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with _timed_section(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def records():
+    with _lock:
+        return list(_records)
+
+
+def clear():
+    with _lock:
+        _records.clear()
+
+
+def _percentile(values, share):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+def summary(kind=None):
+    """``[(name, count, p50 ms, p95 ms, median widgets)]``, slowest p95 first.
+
+    Besides the sections, ``rerun`` covers whole full reruns.
+    """
+    durations, widgets = {}, {}
+    for record in records():
+        if kind is not None and record["kind"] != kind:
+            continue
+        if record["kind"] == "full":
+            durations.setdefault("rerun", []).append(record["total_ms"])
+            widgets.setdefault("rerun", []).append(record["widgets"])
+        for name, ms in record["sections"].items():
+            durations.setdefault(name, []).append(ms)
+            widgets.setdefault(name, []).append(record["section_widgets"][name])
+    rows = [
+        (name, len(values), statistics.median(values), _percentile(values, 0.95), statistics.median(widgets[name]))
+        for name, values in durations.items()
+    ]
+    return sorted(rows, key=lambda row: -row[3])
+
+
+def dump_jsonl():
+    """The ring buffer as JSON lines, oldest first."""
+    return "".join(json.dumps(record) + "\n" for record in records())
@@ -0,0 +1,73 @@
+"""What-if regrade of everyone already marked.
+
+Grades are never stored, only the criteria masks, so a changed cut-off or
+mark can be applied to the whole cohort after the fact. Only the sections
+whose grading changed are recomputed, with the vectorized grader in
+``cohort.py``.
+
+    python regrade.py --db marking_results.db --set "Lab 6.good_max=9" --set "Lab 6.Good=1.2"
+    python regrade.py --db marking_results.db --rubric next_term.json
+"""
+
+import argparse
+import sys
+
+import store
+from cohort import masks_from_store, regrade, what_if
+from grading import LAB_GRADES, RUBRIC, compile_rubric
+
+
+def parse_change(text, rubric=RUBRIC):
+    """Turn ``"Lab 6.good_max=9"`` or ``"Lab 6.Good=1.2"`` into a change dict."""
+    target, _, value = text.partition("=")
+    section, _, field = target.rpartition(".")
+    if not value or (section not in rubric.lab_criteria and section != "Presentation"):
+        raise ValueError(f"cannot parse {text!r}; expected e.g. 'Lab 6.good_max=9' or 'Presentation.Medium=1'")
+    if field in ("good_max", "bad_threshold") and section != "Presentation":
+        return {section: {field: int(value)}}
+    grades = rubric.presentation_marks if section == "Presentation" else LAB_GRADES
+    if field not in grades:
+        raise ValueError(f"unknown field {field!r} for {section}")
+    if section == "Presentation":
+        return {section: {field: float(value)}}
+    return {section: {"marks": {field: float(value)}}}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Regrade the marked cohort under a changed rubric.")
+    parser.add_argument("--db", default="marking_results.db", help="marking database")
+    parser.add_argument("--rubric", help="new rubric file to compare against the current one")
+    parser.add_argument("--set", action="append", default=[], metavar="SECTION.FIELD=VALUE",
+                        help="change a cut-off or mark, e.g. 'Lab 6.good_max=9' (repeatable)")
+    parser.add_argument("-o", "--output", help="write the students whose totals moved to this CSV")
+    args = parser.parse_args(argv)
+
+    try:
+        new = compile_rubric(args.rubric) if args.rubric else RUBRIC
+        changes = {}
+        for text in args.set:
+            for section, change in parse_change(text).items():
+                merged = changes.setdefault(section, {})
+                # Only labs have a "marks" dict; presentation marks are the change itself
+                marks = change.pop("marks", None)
+                merged.update(change)
+                if marks is not None:
+                    merged.setdefault("marks", {}).update(marks)
+        if changes:
+            new = what_if(new, changes)
+    except ValueError as exc:
+        print(f"regrade: {exc}", file=sys.stderr)
+        return 1
+
+    masks = masks_from_store(store.connect(args.db))
+    _, moved = regrade(masks, RUBRIC, new)
+    if args.output:
+        moved.to_csv(args.output)
+    else:
+        print(moved.to_string() if len(moved) else "No totals moved.")
+    print(f"{len(moved)} of {len(masks)} students' totals moved", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
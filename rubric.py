@@ -0,0 +1,66 @@
+"""Rubric tables for the lab submission marking tool.
+
+The tables live in ``rubric.json`` (or the file named by the
+``MARKING_RUBRIC`` environment variable) so a new term's rubric is a data
+edit rather than a code change. They are kept separate from the Streamlit
+script so the grading rules can be imported by scripts and batch jobs
+without starting the UI.
+
+The file holds four tables:
+
+- ``presentation_options``: presentation key -> criterion text. Keys starting
+  with ``medium_`` or ``bad_`` select those grades.
+- ``presentation_marks``: presentation grade -> mark.
+- ``lab_criteria``: lab -> ``bad_criteria``, ``good_max`` and
+  ``bad_threshold``. A lab is Good with at most ``good_max`` missing
+  criteria and Bad from ``bad_threshold`` missing criteria upwards; anything
+  in between is Average.
+- ``lab_marks``: lab -> grade -> mark.
+
+Criteria are keyed by short IDs that are saved in place of the text: the
+text can be reworded freely, but IDs must never be renamed or reused and new
+criteria go at the end, since a criterion's position is its bit in the saved
+masks.
+"""
+
+import functools
+import json
+import os
+
+RUBRIC_PATH = os.environ.get("MARKING_RUBRIC", os.path.join(os.path.dirname(os.path.abspath(__file__)), "rubric.json"))
+
+TABLES = ("presentation_options", "presentation_marks", "lab_criteria", "lab_marks")
+
+
+def check_rubric(tables):
+    for name in TABLES:
+        if not isinstance(tables.get(name), dict) or not tables[name]:
+            raise ValueError(f"rubric is missing the {name} table")
+    for lab, spec in tables["lab_criteria"].items():
+        if lab not in tables["lab_marks"]:
+            raise ValueError(f"no marks for {lab}")
+        if not isinstance(spec.get("bad_criteria"), dict):
+            raise ValueError(f"{lab}: bad_criteria must map criterion IDs to text")
+        if not 0 <= spec.get("good_max", -1) < spec.get("bad_threshold", -1):
+            raise ValueError(f"{lab}: need 0 <= good_max < bad_threshold")
+
+
+def load_rubric(path=RUBRIC_PATH):
+    """Read and check a rubric file, returning its four tables as a dict."""
+    with open(path, encoding="utf-8") as f:
+        tables = json.load(f)
+    check_rubric(tables)
+    return tables
+
+
+@functools.cache
+def _default_tables():
+    return load_rubric()
+
+
+def __getattr__(name):
+    # The default file is read on first use of a table, so RUBRIC_PATH and
+    # load_rubric can be imported to report a broken file
+    if name in TABLES:
+        return _default_tables()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
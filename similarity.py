@@ -0,0 +1,247 @@
+"""Flag near-duplicate submissions from their extracted text.
+
+Each submission's text (extracted once by ``evidence.py`` into
+``.evidence/<sha>.v2.txt``) is cut into overlapping five-word shingles and
+summarized by a MinHash signature: for each of 128 hash functions, the
+smallest hash of any shingle. Two signatures agree in a position with
+probability equal to the Jaccard similarity of the shingle sets, so the share
+of equal positions estimates it. Signatures are computed in a process pool
+and cached next to the text (``.evidence/<sha>.minhash.json``), so a late
+submission costs one new signature.
+
+Rather than comparing every pair, signatures are cut into 32 bands of 4
+values and only submissions that share a band are compared. A pair with
+similarity 0.6 shares a band with probability 0.99, one with 0.3 only 0.23.
+Files with identical content are always flagged. Flags are saved per student
+in ``.evidence/similar.json`` for the UI.
+
+    python similarity.py submissions/ [--threshold 0.6]
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import zlib
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import combinations
+
+import evidence
+import precheck
+
+SHINGLE_WORDS = 5
+NUM_HASHES = 128
+BANDS = 32
+THRESHOLD = 0.6
+# Texts with fewer shingles (e.g. scanned PDFs without a text layer) are
+# not compared; their signatures say nothing about the work
+MIN_SHINGLES = 50
+FLAGS_NAME = "similar.json"
+# Bump when shingling or hashing changes; signatures are then recomputed
+SIGNATURE_VERSION = 1
+
+_WORD = re.compile(r"[a-z0-9]+")
+_PRIME = 4294967291  # largest prime below 2**32, so hashes fit in 32 bits
+_random = random.Random(SIGNATURE_VERSION)
+_A = [_random.randrange(1, 2 ** 31) for _ in range(NUM_HASHES)]
+_B = [_random.randrange(0, 2 ** 31) for _ in range(NUM_HASHES)]
+
+_background = ThreadPoolExecutor(max_workers=1)
+
+
+def shingle_hashes(text):
+    words = _WORD.findall(text.lower())
+    return {
+        zlib.crc32(" ".join(words[i:i + SHINGLE_WORDS]).encode())
+        for i in range(len(words) - SHINGLE_WORDS + 1)
+    }
+
+
+def minhash(hashes, chunk_size=4096):
+    """The MinHash signature of a set of 32-bit shingle hashes."""
+    # Only the workers computing signatures need numpy
+    import numpy as np
+
+    a = np.array(_A, dtype=np.uint64)[:, None]
+    b = np.array(_B, dtype=np.uint64)[:, None]
+    values = np.fromiter(hashes, dtype=np.uint64, count=len(hashes))
+    signature = np.full(NUM_HASHES, _PRIME, dtype=np.uint64)
+    for start in range(0, len(values), chunk_size):
+        # a * x + b < 2**64 as a, b < 2**31 and x < 2**32
+        permuted = (a * values[start:start + chunk_size] + b) % np.uint64(_PRIME)
+        np.minimum(signature, permuted.min(axis=1), out=signature)
+    return signature.tolist()
+
+
+def _signature_path(cache_dir, sha256):
+    return os.path.join(cache_dir, f"{sha256}.minhash.json")
+
+
+def _sign_file(cache_dir, sha256):
+    # Runs in a worker process
+    with open(evidence.text_path(cache_dir, sha256), encoding="utf-8") as f:
+        hashes = shingle_hashes(f.read())
+    signature = minhash(hashes) if len(hashes) >= MIN_SHINGLES else None
+    path = _signature_path(cache_dir, sha256)
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        json.dump({"version": SIGNATURE_VERSION, "text_version": evidence.TEXT_VERSION, "signature": signature}, f)
+    os.replace(f"{path}.tmp", path)
+    return signature
+
+
+def load_signature(cache_dir, sha256):
+    """``(True, signature or None)`` if cached, else ``(False, None)``."""
+    try:
+        with open(_signature_path(cache_dir, sha256), encoding="utf-8") as f:
+            record = json.load(f)
+    except (OSError, ValueError):
+        return False, None
+    if record.get("version") != SIGNATURE_VERSION or record.get("text_version") != evidence.TEXT_VERSION:
+        return False, None
+    return True, record["signature"]
+
+
+def sign_folder(folder, results, workers=None):
+    """Signatures of every PDF in ``results``, computing only the missing ones.
+
+    Returns ``({sha256: signature}, computed)``; texts too short to compare,
+    and files ``evidence.index_folder`` has not extracted yet, are left out.
+    """
+    cache_dir = os.path.join(folder, evidence.CACHE_DIR)
+    signatures, todo = {}, []
+    for sha256 in {result["sha256"] for result in results if result["is_pdf"]}:
+        cached, signature = load_signature(cache_dir, sha256)
+        if not cached:
+            if os.path.exists(evidence.text_path(cache_dir, sha256)):
+                todo.append(sha256)
+        elif signature is not None:
+            signatures[sha256] = signature
+    if todo:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for sha256, signature in zip(todo, executor.map(_sign_file, [cache_dir] * len(todo), todo, chunksize=4)):
+                if signature is not None:
+                    signatures[sha256] = signature
+    return signatures, len(todo)
+
+
+def candidate_pairs(signatures, bands=BANDS):
+    """Pairs of keys whose signatures are equal in at least one band."""
+    rows = NUM_HASHES // bands
+    buckets = {}
+    for key, signature in signatures.items():
+        for band in range(bands):
+            buckets.setdefault((band, tuple(signature[band * rows:(band + 1) * rows])), []).append(key)
+    pairs = set()
+    for keys in buckets.values():
+        if len(keys) > 1:
+            pairs.update(combinations(sorted(keys), 2))
+    return pairs
+
+
+def estimate(a, b):
+    """Estimated Jaccard similarity of the texts behind two signatures."""
+    return sum(x == y for x, y in zip(a, b)) / len(a)
+
+
+def near_duplicates(signatures, threshold=THRESHOLD):
+    """``(key_a, key_b, similarity)`` for pairs at or above ``threshold``,
+    most similar first."""
+    pairs = []
+    for a, b in candidate_pairs(signatures):
+        similarity = estimate(signatures[a], signatures[b])
+        if similarity >= threshold:
+            pairs.append((a, b, similarity))
+    return sorted(pairs, key=lambda pair: -pair[2])
+
+
+def _label(result):
+    return result["student_id"] or result["file"]
+
+
+def find_similar(folder, results=None, threshold=THRESHOLD, workers=None):
+    """Flag near-duplicate submissions in an indexed folder and save the flags.
+
+    Returns ``(file_a, file_b, similarity)`` for every flagged pair of files
+    of different students.
+    """
+    if results is None:
+        results, _ = precheck.scan(folder, workers=workers)
+    signatures, _ = sign_folder(folder, results, workers)
+    files = {}
+    for result in results:
+        if result["is_pdf"]:
+            files.setdefault(result["sha256"], []).append(result)
+    pairs, flags = [], {}
+
+    def flag(result_a, result_b, similarity):
+        a, b = _label(result_a), _label(result_b)
+        if a == b:
+            return
+        pairs.append((result_a["file"], result_b["file"], similarity))
+        flags.setdefault(a, []).append((b, similarity))
+        flags.setdefault(b, []).append((a, similarity))
+
+    for sha_a, sha_b, similarity in near_duplicates(signatures, threshold):
+        for result_a in files[sha_a]:
+            for result_b in files[sha_b]:
+                flag(result_a, result_b, similarity)
+    for same in files.values():
+        for result_a, result_b in combinations(same, 2):
+            flag(result_a, result_b, 1.0)
+    for others in flags.values():
+        others.sort(key=lambda other: -other[1])
+
+    path = flags_path(folder)
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        json.dump({"threshold": threshold, "flags": flags}, f)
+    os.replace(f"{path}.tmp", path)
+    return sorted(pairs, key=lambda pair: -pair[2])
+
+
+def _index_and_compare(folder, results):
+    indexed = evidence.index_folder(folder, results)
+    return indexed, len(find_similar(folder, results))
+
+
+def start_indexing(folder, results=None):
+    """Index a folder and flag near-duplicates in a background thread.
+
+    Returns a ``Future`` of ``(files indexed, pairs flagged)``.
+    """
+    return _background.submit(_index_and_compare, folder, results)
+
+
+def flags_path(folder):
+    return os.path.join(folder, evidence.CACHE_DIR, FLAGS_NAME)
+
+
+def load_flags(path):
+    """``{student: [(other student, similarity)]}`` saved by ``find_similar``."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)["flags"]
+    except (OSError, ValueError, KeyError):
+        return {}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Flag near-duplicate submissions from their text.")
+    parser.add_argument("folder", help="folder of submitted files")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD,
+                        help=f"estimated similarity to flag (default: {THRESHOLD})")
+    parser.add_argument("--workers", type=int, help="worker processes (default: one per CPU)")
+    args = parser.parse_args(argv)
+
+    results, _ = precheck.scan(args.folder, workers=args.workers)
+    evidence.index_folder(args.folder, results, args.workers)
+    pairs = find_similar(args.folder, results, args.threshold, args.workers)
+    for file_a, file_b, similarity in pairs:
+        print(f"{file_a}\t{file_b}\t{similarity:.2f}")
+    print(f"Flagged {len(pairs)} pairs among {sum(r['is_pdf'] for r in results)} PDFs", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,299 @@
+"""SQLite store for per-student marking state.
+
+Each student has one row per section ("presentation" or a lab name) holding
+the packed selection bitmask, so a click rewrites a single small row and
+opening a student is one primary-key range query. The database runs in WAL
+mode so autosaves never block readers.
+
+A student counts as marked once a marker has finished with them
+(``mark_student``), which is what exports select on; saved sections alone
+may be pre-fills from the pre-check.
+
+Several markers can share one database. A marker claims a student before
+editing, and every section row carries a version number: a save only
+succeeds if the row is still at the version the marker loaded, otherwise
+``ConflictError`` is raised and the caller reloads the section.
+
+Every write is also appended to the ``events`` log by triggers: the bits it
+flipped and the mask it left, with the marker and time (see ``history.py``
+for undo, redo and "as of" queries over it).
+
+How long markers actively spend on each section is kept in ``marking_time``
+(see ``record_time`` and ``analytics.section_times``).
+"""
+
+import queue
+import sqlite3
+import time
+from contextlib import contextmanager
+
+PRESENTATION = "presentation"
+
+# Writers that pre-fill sections for a marker to review rather than mark
+SYSTEM_MARKERS = ("precheck",)
+
+# Claims lapse if a marker goes quiet for this long (seconds)
+CLAIM_TTL = 30 * 60
+# Longer pauses between interactions count as this long (seconds)
+IDLE_GAP = 5 * 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS students (
+    student_id TEXT PRIMARY KEY,
+    name TEXT NOT NULL DEFAULT '',
+    position INTEGER NOT NULL,
+    marked_at REAL,
+    marked_by TEXT
+);
+CREATE INDEX IF NOT EXISTS students_position ON students (position);
+
+CREATE TABLE IF NOT EXISTS selections (
+    student_id TEXT NOT NULL,
+    section TEXT NOT NULL,
+    mask INTEGER NOT NULL,
+    updated_at REAL NOT NULL,
+    version INTEGER NOT NULL DEFAULT 1,
+    marker TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (student_id, section)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS claims (
+    student_id TEXT PRIMARY KEY,
+    marker TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+
+-- Active marking time, one row per student, section and marker; see record_time
+CREATE TABLE IF NOT EXISTS marking_time (
+    student_id TEXT NOT NULL,
+    section TEXT NOT NULL,
+    marker TEXT NOT NULL,
+    seconds REAL NOT NULL,
+    interactions INTEGER NOT NULL,
+    first_at REAL NOT NULL,
+    last_at REAL NOT NULL,
+    PRIMARY KEY (student_id, section, marker)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS marking_time_recent ON marking_time (section, last_at);
+"""
+
+# Append-only, filled by triggers so every writer is logged, and clustered by
+# student so one student's history is a single range of the table. ``seq``
+# orders all events (from ``event_counter``, which also records the last
+# compaction cut-off); ``change`` groups the events of
+# one write (the seq of its first event), and undo and redo events name the
+# change they revert in ``undoes``. ``event_context`` holds the change, marker,
+# kind and time for the writes of a ``change()`` transaction.
+EVENTS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    student_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    change INTEGER NOT NULL,
+    section TEXT NOT NULL,
+    flips INTEGER NOT NULL,
+    mask INTEGER NOT NULL,
+    marker TEXT NOT NULL,
+    at REAL NOT NULL,
+    kind TEXT NOT NULL DEFAULT 'edit',
+    undoes INTEGER,
+    PRIMARY KEY (student_id, seq)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS events_undoes ON events (undoes) WHERE undoes IS NOT NULL;
+
+CREATE TABLE IF NOT EXISTS event_counter (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    seq INTEGER NOT NULL,
+    compacted_before REAL NOT NULL
+);
+INSERT OR IGNORE INTO event_counter VALUES (0, 0, 0);
+CREATE TABLE IF NOT EXISTS event_context (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    change INTEGER NOT NULL,
+    marker TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    undoes INTEGER,
+    at REAL NOT NULL
+);
+"""
+
+_LOG = """
+    UPDATE event_counter SET seq = seq + 1;
+    INSERT INTO events SELECT
+        {r}.student_id, n.seq, COALESCE(c.change, n.seq), {r}.section, ({old} | {new}) - ({old} & {new}), {new},
+        COALESCE(c.marker, {r}.marker), {at}, COALESCE(c.kind, 'edit'), c.undoes
+    FROM event_counter n LEFT JOIN event_context c;
+"""
+
+EVENT_TRIGGERS = f"""
+CREATE TRIGGER IF NOT EXISTS selections_logged_insert AFTER INSERT ON selections WHEN NEW.mask != 0 BEGIN
+{_LOG.format(r="NEW", old="0", new="NEW.mask", at="NEW.updated_at")}
+END;
+CREATE TRIGGER IF NOT EXISTS selections_logged_update AFTER UPDATE OF mask ON selections
+WHEN NEW.mask != OLD.mask BEGIN
+{_LOG.format(r="NEW", old="OLD.mask", new="NEW.mask", at="NEW.updated_at")}
+END;
+CREATE TRIGGER IF NOT EXISTS selections_logged_delete AFTER DELETE ON selections WHEN OLD.mask != 0 BEGIN
+{_LOG.format(r="OLD", old="OLD.mask", new="0", at="COALESCE(c.at, (julianday('now') - 2440587.5) * 86400.0)")}
+END;
+"""
+
+
+class ConflictError(Exception):
+    """A section was changed by someone else since it was loaded."""
+
+
+def connect(path):
+    conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA + EVENTS_SCHEMA + EVENT_TRIGGERS)
+    return conn
+
+
+class ConnectionPool:
+    """A fixed number of connections shared by all sessions of the app."""
+
+    def __init__(self, path, size=8):
+        self.path = path
+        self._idle = queue.LifoQueue()
+        # Connections are opened on first use
+        for _ in range(size):
+            self._idle.put(None)
+
+    @contextmanager
+    def connection(self):
+        conn = self._idle.get()
+        try:
+            if conn is None:
+                conn = connect(self.path)
+            yield conn
+        finally:
+            if conn is not None and conn.in_transaction:
+                conn.rollback()
+            self._idle.put(conn)
+
+
+def load_roster(conn, rows):
+    """Add or update students from ``(student_id, name)`` pairs, keeping their order."""
+    with conn:
+        conn.execute("BEGIN")
+        start = conn.execute("SELECT COALESCE(MAX(position) + 1, 0) FROM students").fetchone()[0]
+        conn.executemany(
+            "INSERT INTO students (student_id, name, position) VALUES (?, ?, ?) "
+            "ON CONFLICT (student_id) DO UPDATE SET name = excluded.name",
+            [(student_id, name, start + i) for i, (student_id, name) in enumerate(rows)],
+        )
+
+
+def roster(conn):
+    return conn.execute("SELECT student_id, name FROM students ORDER BY position").fetchall()
+
+
+def mark_student(conn, student_id, marker):
+    """Record that ``marker`` has finished marking a student, even if nothing
+    was ticked (every section Excellent)."""
+    conn.execute("UPDATE students SET marked_at = ?, marked_by = ? WHERE student_id = ?",
+                 (time.time(), marker, student_id))
+
+
+def marked_students(conn):
+    """Ids of the students a marker has finished, in roster order."""
+    return [row[0] for row in conn.execute(
+        "SELECT student_id FROM students WHERE marked_at IS NOT NULL ORDER BY position"
+    )]
+
+
+def marked_at(conn, student_id):
+    row = conn.execute("SELECT marked_at FROM students WHERE student_id = ?", (student_id,)).fetchone()
+    return row[0] if row else None
+
+
+def load_student(conn, student_id):
+    """Return ``{section: (mask, version)}`` for everything saved for a student."""
+    rows = conn.execute(
+        "SELECT section, mask, version FROM selections WHERE student_id = ?", (student_id,)
+    ).fetchall()
+    return {section: (mask, version) for section, mask, version in rows}
+
+
+def save_section(conn, student_id, section, mask, version, marker=""):
+    """Save a section last loaded at ``version`` (0 if never saved).
+
+    Returns the new version, or raises ``ConflictError`` if the row has moved on.
+    """
+    now = time.time()
+    if version == 0:
+        cursor = conn.execute(
+            "INSERT INTO selections (student_id, section, mask, updated_at, version, marker) "
+            "VALUES (?, ?, ?, ?, 1, ?) ON CONFLICT (student_id, section) DO NOTHING",
+            (student_id, section, mask, now, marker),
+        )
+    else:
+        cursor = conn.execute(
+            "UPDATE selections SET mask = ?, updated_at = ?, version = version + 1, marker = ? "
+            "WHERE student_id = ? AND section = ? AND version = ?",
+            (mask, now, marker, student_id, section, version),
+        )
+    if cursor.rowcount != 1:
+        raise ConflictError(f"{section} of {student_id} was changed by another marker")
+    return version + 1
+
+
+def record_time(conn, student_id, section, marker, seconds, at):
+    """Add ``seconds`` of work on a section, from an interaction at ``at``.
+
+    Callers pass the time since the marker's previous interaction with the
+    student (a tick, a tab switch, or opening it), capped at ``IDLE_GAP``.
+    """
+    conn.execute(
+        "INSERT INTO marking_time VALUES (?, ?, ?, ?, 1, ?, ?) ON CONFLICT DO UPDATE SET "
+        "seconds = seconds + excluded.seconds, interactions = interactions + 1, last_at = excluded.last_at",
+        (student_id, section, marker, min(seconds, IDLE_GAP), at, at),
+    )
+
+
+def marked_selections(conn):
+    """Every saved ``(student_id, section, mask)`` of the marked students,
+    for cohort-wide work."""
+    return conn.execute(
+        "SELECT s.student_id, section, mask FROM selections s JOIN students USING (student_id) "
+        "WHERE marked_at IS NOT NULL"
+    ).fetchall()
+
+
+@contextmanager
+def change(conn, marker="", kind="edit", undoes=None):
+    """A transaction whose writes are logged as one change (one undo step)."""
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute(
+            "INSERT INTO event_context SELECT 0, seq + 1, ?, ?, ?, ? FROM event_counter",
+            (marker, kind, undoes, time.time()),
+        )
+        try:
+            yield conn
+        finally:
+            conn.execute("DELETE FROM event_context")
+
+
+def clear_student(conn, student_id, marker=""):
+    with change(conn, marker):
+        conn.execute("DELETE FROM selections WHERE student_id = ?", (student_id,))
+
+
+def claim_student(conn, student_id, marker, ttl=CLAIM_TTL):
+    """Claim (or renew the claim on) a student; return whoever holds the claim."""
+    now = time.time()
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute(
+            "INSERT INTO claims (student_id, marker, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT (student_id) DO UPDATE SET marker = excluded.marker, expires_at = excluded.expires_at "
+            "WHERE claims.marker = excluded.marker OR claims.expires_at < ?",
+            (student_id, marker, now + ttl, now),
+        )
+        return conn.execute("SELECT marker FROM claims WHERE student_id = ?", (student_id,)).fetchone()[0]
+
+
+def release_student(conn, student_id, marker):
+    conn.execute("DELETE FROM claims WHERE student_id = ? AND marker = ?", (student_id, marker))
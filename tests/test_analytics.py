@@ -0,0 +1,85 @@
+"""Cohort analytics read from the store's counters."""
+
+import analytics
+import precheck
+import store
+from grading import RUBRIC, lab_mask, presentation_mask
+
+COUNTERS = {"grade_counts": "students", "criterion_counts": "students", "criterion_students": "1",
+            "student_totals": "1", "total_counts": "students", "marker_counts": "sections"}
+
+
+def counters(conn):
+    # Counts the triggers have taken back to zero are left for the next save
+    return {table: sorted(conn.execute(f"SELECT * FROM {table} WHERE {count} > 0"))
+            for table, count in COUNTERS.items()}
+
+
+def rebuilt(conn):
+    conn.execute("DELETE FROM analytics_meta WHERE name = 'rubric'")
+    assert analytics.install(conn, RUBRIC)
+    return counters(conn)
+
+
+def test_marker_means_leave_out_pre_fills(tmp_path):
+    conn = store.connect(str(tmp_path / "marking.db"))
+    analytics.install(conn, RUBRIC)
+    store.load_roster(conn, [("1", "Ann"), ("2", "Bo")])
+    store.save_section(conn, "1", store.PRESENTATION, presentation_mask(["bad_filename"]), 0, "precheck")
+    store.save_section(conn, "2", "Lab 6", 0, 0, "ann")
+    store.mark_student(conn, "1", "bo")
+    store.mark_student(conn, "2", "ann")
+
+    assert [row[:2] for row in analytics.marker_means(conn)] == [("ann", 1)]
+
+
+def test_only_marked_students_are_counted(tmp_path):
+    conn = store.connect(str(tmp_path / "marking.db"))
+    analytics.install(conn, RUBRIC)
+    store.load_roster(conn, [("1001", "Ann"), ("1002", "Bo"), ("1003", "Cy")])
+    # The pre-check flags two students before anyone is marked
+    results = [{"file": f"{student_id}_report.pdf", "student_id": student_id, "flags": ["bad_filename"]}
+               for student_id in ("1001", "1002")]
+    assert precheck.apply_to_store(conn, results) == ["1001", "1002"]
+    assert analytics.total_histogram(conn) == []
+    assert analytics.grade_distribution(conn) == []
+
+    # 1001 is finished as pre-filled, 1003 with nothing ticked, 1002 not yet
+    store.mark_student(conn, "1001", "ann")
+    store.mark_student(conn, "1003", "ann")
+    bad = RUBRIC.max_total - RUBRIC.presentation_marks["Excellent"] + RUBRIC.presentation_marks["Bad"]
+    assert analytics.total_histogram(conn) == [(bad, 1), (RUBRIC.max_total, 1)]
+    distribution = {(section, grade): n for section, grade, n in analytics.grade_distribution(conn)}
+    assert distribution[store.PRESENTATION, "Bad"] == 1
+    assert distribution[store.PRESENTATION, "Excellent"] == 1
+    assert distribution["Lab 6", "Excellent"] == 2
+    assert analytics.marker_means(conn) == []
+
+    # Later saves on marked students are counted as they happen
+    store.save_section(conn, "1003", "Lab 6", lab_mask("Lab 6", ["instance_type"]), 0, "ann")
+    store.save_section(conn, "1002", "Lab 6", lab_mask("Lab 6", ["instance_type"]), 0, "ann")
+    assert analytics.criterion_students(conn, "Lab 6", RUBRIC.criterion_bits["Lab 6"]["instance_type"]) == ["1003"]
+    assert [row[:2] for row in analytics.marker_means(conn)] == [("ann", 1)]
+    assert counters(conn) == rebuilt(conn)
+
+    # As is withdrawing a mark
+    conn.execute("UPDATE students SET marked_at = NULL WHERE student_id = '1003'")
+    assert analytics.total_histogram(conn) == [(bad, 1)]
+    assert counters(conn) == rebuilt(conn)
+
+
+def test_section_times_are_medians_of_capped_active_time(tmp_path):
+    conn = store.connect(str(tmp_path / "marking.db"))
+    for i, seconds in enumerate((30, 60, 90, 120)):
+        store.record_time(conn, str(i), "Lab 6", "ann", seconds, at=i)
+    # A second interaction adds to the same submission; a long pause counts as IDLE_GAP
+    store.record_time(conn, "3", "Lab 6", "ann", 10 * store.IDLE_GAP, at=10)
+    store.record_time(conn, "0", "Lab 7", "bo", 45, at=11)
+
+    assert analytics.section_times(conn) == {
+        "Lab 6": (75.0, 4, 300 + store.IDLE_GAP),
+        "Lab 7": (45.0, 1, 45.0),
+    }
+    # Only the most recently marked submissions set the median
+    assert analytics.section_times(conn, window=2)["Lab 6"] == ((120 + store.IDLE_GAP + 90) / 2, 2, 300 + store.IDLE_GAP)
+    assert analytics.marker_throughput(conn) == [("ann", 4, 300 + store.IDLE_GAP), ("bo", 1, 45.0)]
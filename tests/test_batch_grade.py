@@ -0,0 +1,67 @@
+"""Grading a cohort from a file of selections."""
+
+import io
+
+import pandas as pd
+import pytest
+
+import batch_grade
+from grading import RUBRIC, grade_submission
+
+
+def test_csv_cells_accept_ids_text_and_either_lab_column():
+    text = RUBRIC.lab_criteria["Lab 2"]["bad_criteria"]["ec2_code"]
+    f = io.StringIO(
+        "student_id,presentation,Lab 1,Lab2\n"
+        f"7,medium_font; medium_grammar,env_evidence,{text};cli_explanation\n"
+    )
+    [(line_no, student_id, presentation, labs)] = batch_grade.read_csv(f)
+
+    assert (line_no, student_id, presentation) == (2, "7", ["medium_font", "medium_grammar"])
+    assert labs["Lab 1"] == ["env_evidence"]
+    assert batch_grade.check_selection(presentation, labs)["Lab 2"] == ["ec2_code", "cli_explanation"]
+
+
+def test_jsonl_skips_blank_lines():
+    f = io.StringIO('{"student_id": 7, "labs": {"Lab 1": ["env_evidence"]}}\n\n'
+                    '{"student_id": "8", "presentation": ["medium_font"]}\n')
+    assert list(batch_grade.read_jsonl(f)) == [
+        (1, "7", [], {"Lab 1": ["env_evidence"]}),
+        (3, "8", ["medium_font"], {}),
+    ]
+
+
+@pytest.mark.parametrize("presentation, labs, message", [
+    (["no_such_key"], {}, "unknown presentation key"),
+    (["medium_font", "medium_font"], {}, "duplicate presentation key"),
+    ([], {"Lab 99": []}, "unknown lab"),
+    ([], {"Lab 1": ["no_such_criterion"]}, "unknown criterion for Lab 1"),
+    # The same criterion by ID and by its text
+    ([], {"Lab 1": ["env_evidence", RUBRIC.lab_criteria["Lab 1"]["bad_criteria"]["env_evidence"]]},
+     "duplicate criterion for Lab 1"),
+])
+def test_bad_selections_are_rejected(presentation, labs, message):
+    with pytest.raises(ValueError, match=message):
+        batch_grade.check_selection(presentation, labs)
+
+
+def test_gradebook_round_trip(tmp_path, capsys):
+    src, out = tmp_path / "selections.jsonl", tmp_path / "gradebook.csv"
+    src.write_text('{"student_id": "7", "presentation": ["medium_font"], "labs": {"Lab 1": ["env_evidence"]}}\n'
+                   '{"student_id": "8"}\n', encoding="utf-8")
+
+    assert batch_grade.main([str(src), "-o", str(out), "--chunk-size", "1"]) == 0
+    gradebook = pd.read_csv(out, dtype={"student_id": str}).set_index("student_id")
+    assert list(gradebook.index) == ["7", "8"]
+    expected = grade_submission(["medium_font"], {"Lab 1": ["env_evidence"]})
+    assert gradebook.loc["7", "Total_Marks"] == pytest.approx(expected["total_marks"])
+    assert gradebook.loc["8", "Total_Marks"] == pytest.approx(RUBRIC.max_total)
+    assert "Graded 2 submissions" in capsys.readouterr().err
+
+
+def test_a_bad_line_is_reported_by_number(tmp_path, capsys):
+    src = tmp_path / "selections.csv"
+    src.write_text("student_id,presentation\n7,\n8,no_such_key\n", encoding="utf-8")
+
+    assert batch_grade.main([str(src), "-o", str(tmp_path / "gradebook.csv")]) == 1
+    assert "line 3: unknown presentation key" in capsys.readouterr().err
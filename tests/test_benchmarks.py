@@ -0,0 +1,27 @@
+"""The benchmark suite's JSON results and comparisons."""
+
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+SUITE = str(Path(__file__).resolve().parent.parent / "benchmarks" / "suite.py")
+
+
+def run_suite(*args):
+    return subprocess.run([sys.executable, SUITE, *args], capture_output=True, text=True, check=True).stdout
+
+
+def test_microbenchmarks_are_written_and_compared(tmp_path):
+    base, new = str(tmp_path / "base.json"), str(tmp_path / "new.json")
+    for path in (base, new):
+        run_suite("--skip-app", "--sizes", "10", "--repeat", "1", "-o", path)
+
+    with open(new, encoding="utf-8") as f:
+        results = json.load(f)
+    assert set(results["environment"]) >= {"commit", "python", "streamlit"}
+    assert set(results["results"]["micro"]["10"]) == {"grade_submission", "grade_cohort", "feedback_document",
+                                                      "csv_export"}
+    lines = run_suite("--compare", base, new).splitlines()
+    assert lines[0].startswith("base ")
+    assert any(line.startswith("micro.10.grade_cohort.total_ms ") for line in lines[1:])
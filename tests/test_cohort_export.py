@@ -0,0 +1,49 @@
+"""Which students the cohort export includes."""
+
+import io
+import json
+import zipfile
+
+import cohort_export
+import store
+from grading import compile_rubric
+from rubric import RUBRIC_PATH
+
+
+def test_exports_marked_students_only(tmp_path):
+    conn = store.connect(str(tmp_path / "marking.db"))
+    store.load_roster(conn, [("1", "Ann"), ("2", "Bo"), ("3", "Cy")])
+    # 1 was finished with nothing ticked, 2 only has a pre-check flag, 3 was marked
+    store.mark_student(conn, "1", "ann")
+    store.save_section(conn, "2", store.PRESENTATION, 1 << 6, 0, "precheck")
+    store.save_section(conn, "3", "Lab 1", 0b11, 0, "ann")
+    store.mark_student(conn, "3", "ann")
+
+    exported = [student_id for chunk in cohort_export.iter_marked(conn) for student_id, _, _ in chunk]
+    assert exported == ["1", "3"]
+
+    out = io.BytesIO()
+    cohort_export.write(conn, "csv", out)
+    rows = out.getvalue().decode().splitlines()
+    assert len(rows) == 3
+    assert rows[1].startswith("1,") and ",Excellent,1.5," in rows[1]
+
+
+def test_feedback_zip_uses_the_rubric_it_is_given(tmp_path):
+    # As after the app reloads an edited rubric file
+    with open(RUBRIC_PATH, encoding="utf-8") as f:
+        tables = json.load(f)
+    tables["presentation_marks"]["Excellent"] = 2.0
+    edited = tmp_path / "rubric.json"
+    edited.write_text(json.dumps(tables), encoding="utf-8")
+    rubric = compile_rubric(str(edited))
+
+    conn = store.connect(str(tmp_path / "marking.db"))
+    store.load_roster(conn, [("1", "Ann")])
+    store.mark_student(conn, "1", "ann")
+    out = io.BytesIO()
+    cohort_export.write(conn, "zip", out, rubric)
+    with zipfile.ZipFile(out) as archive:
+        text = archive.read("1_feedback.md").decode()
+    assert f"**TOTAL MARKS: {rubric.max_total}/{rubric.max_total}**" in text
+    assert "(2.0 marks)" in text
@@ -0,0 +1,50 @@
+"""Suggesting missing lab criteria from submission text."""
+
+import pymupdf
+import pytest
+
+import evidence
+import precheck
+from grading import RUBRIC
+
+# Evidence for three of Lab 6's criteria, padded to a realistic length
+REPORT = [
+    "Lab 6 report. The EC2 instance was launched as a t3.micro in the default VPC.",
+    "Nginx was configured through a file in sites-enabled and then we ran sudo service nginx restart.",
+    "The Django project routes requests in urls.py to the views that list the uploaded files.",
+] + [f"Paragraph {i} describes the deployment steps that were followed in the lab session." for i in range(8)]
+
+
+def write_pdf(path, lines):
+    document = pymupdf.open()
+    page = document.new_page()
+    for i, line in enumerate(lines):
+        page.insert_text((40, 60 + 16 * i), line, fontsize=9)
+    document.save(path)
+
+
+@pytest.fixture
+def folder(tmp_path):
+    write_pdf(str(tmp_path / "1001_Ann_labs6_9.pdf"), REPORT)
+    results, _ = precheck.scan(str(tmp_path), workers=1)
+    evidence.index_folder(str(tmp_path), results, workers=1)
+    return str(tmp_path)
+
+
+def test_text_is_extracted_from_a_real_pdf(tmp_path):
+    write_pdf(str(tmp_path / "report.pdf"), REPORT[:1])
+    assert "t3.micro" in evidence.extract_text(str(tmp_path / "report.pdf"))
+
+
+def test_suggestions_from_a_real_pdf(folder):
+    masks = evidence.suggested_masks(evidence.student_index(folder, "1001"), evidence.load_rules())
+    missing = {bit for bit in range(len(RUBRIC.criterion_ids["Lab 6"])) if masks["Lab 6"] >> bit & 1}
+
+    assert {RUBRIC.criterion_ids["Lab 6"][bit] for bit in missing} == {
+        "dynamodb_create", "views_explanation", "files_html_explanation",
+    }
+
+
+def test_near_empty_text_suggests_nothing():
+    index = evidence.build_index("Lab 6 screenshots attached")
+    assert evidence.suggested_masks(index, evidence.load_rules()) == {}
@@ -0,0 +1,58 @@
+"""Feedback text, memoized per lab, grade and criteria mask."""
+
+import json
+
+from feedback import feedback_document, lab_feedback, presentation_feedback
+from grading import RUBRIC, compile_rubric, grade_submission, lab_mask, presentation_mask
+from rubric import RUBRIC_PATH
+
+
+def phrase(lab, criterion_id, rubric=RUBRIC):
+    return rubric.lab_criteria[lab]["bad_criteria"][criterion_id].lower()
+
+
+def test_reasons_are_joined_in_rubric_order():
+    a, b, c = RUBRIC.criterion_ids["Lab 2"][:3]
+    assert lab_feedback("Lab 2", "Excellent", 0) == "The description is excellent."
+    assert lab_feedback("Lab 2", "Good", lab_mask("Lab 2", [a])) == f"The description is good because {phrase('Lab 2', a)}."
+    assert lab_feedback("Lab 2", "Good", lab_mask("Lab 2", [b, a])) == \
+        f"The description is good because {phrase('Lab 2', a)} and {phrase('Lab 2', b)}."
+    assert lab_feedback("Lab 2", "Good", lab_mask("Lab 2", [c, b, a])) == \
+        f"The description is good because {phrase('Lab 2', a)}, {phrase('Lab 2', b)}, and {phrase('Lab 2', c)}."
+    assert presentation_feedback("Medium", presentation_mask(["medium_font"])).startswith(
+        "The presentation is medium because ")
+
+
+def test_an_unchanged_lab_is_a_cache_hit():
+    mask = lab_mask("Lab 6", RUBRIC.criterion_ids["Lab 6"][:2])
+    first = lab_feedback("Lab 6", "Good", mask)
+    hits = lab_feedback.cache_info().hits
+    assert lab_feedback("Lab 6", "Good", mask) is first
+    assert lab_feedback.cache_info().hits == hits + 1
+
+
+def test_reworded_criteria_are_not_served_from_the_cache(tmp_path):
+    criterion_id = RUBRIC.criterion_ids["Lab 6"][0]
+    mask = lab_mask("Lab 6", [criterion_id])
+    lab_feedback("Lab 6", "Good", mask)
+    with open(RUBRIC_PATH, encoding="utf-8") as f:
+        tables = json.load(f)
+    tables["lab_criteria"]["Lab 6"]["bad_criteria"][criterion_id] = "Reworded criterion"
+    edited = tmp_path / "rubric.json"
+    edited.write_text(json.dumps(tables), encoding="utf-8")
+
+    assert lab_feedback("Lab 6", "Good", mask, compile_rubric(str(edited))) == \
+        "The description is good because reworded criterion."
+
+
+def test_feedback_document_lists_every_lab():
+    missing = {"Lab 6": list(RUBRIC.criterion_ids["Lab 6"][:2])}
+    result = grade_submission(["medium_font"], missing)
+    text = feedback_document(result, presentation_mask(["medium_font"]),
+                             {"Lab 6": lab_mask("Lab 6", missing["Lab 6"])}, "2026-10-17 12:00:00")
+
+    assert text.startswith("**Evaluation Date:** 2026-10-17 12:00:00\n\n")
+    assert f"**TOTAL MARKS: {result['total_marks']}/{result['max_total']}**" in text
+    for lab in RUBRIC.labs:
+        assert f"\n{lab}: The description is " in text
+    assert lab_feedback("Lab 6", "Good", lab_mask("Lab 6", missing["Lab 6"])) in text
@@ -0,0 +1,22 @@
+"""Merging marks into an LMS gradebook."""
+
+import pandas as pd
+
+import gradebook
+import store
+from grading import RUBRIC
+
+
+def test_untouched_student_is_merged_at_full_marks(tmp_path):
+    conn = store.connect(str(tmp_path / "marking.db"))
+    store.load_roster(conn, [("1001", "Ann"), ("1002", "Bo")])
+    # 1001 was opened and left with nothing ticked; nobody has finished 1002
+    store.mark_student(conn, "1001", "ann")
+
+    book = pd.DataFrame({"Student ID": ["1001", "1002"], "Total": ["", ""]})
+    merged, report = gradebook.merge(book, "Student ID", gradebook.marked_results(conn), {"Total_Marks": "Total"})
+
+    assert merged.loc[0, "Total"] == f"{RUBRIC.max_total:g}"
+    assert merged.loc[1, "Total"] == ""
+    assert report["matched"] == 1
+    assert report["not_marked"] == ["1002"]
@@ -0,0 +1,118 @@
+"""The grading engine against the marking tool's original rules."""
+
+import json
+import random
+
+import pytest
+
+from cohort import encode_cohort, grade_cohort
+from exports import lab_column
+from grading import (RUBRIC, compile_rubric, grade_lab, grade_submission, lab_mask, mask_criteria,
+                     mask_presentation, presentation_mask)
+from rubric import RUBRIC_PATH, lab_criteria, presentation_options
+
+
+def calculate_lab_grade(missing_count, bad_threshold, lab_name):
+    # The if/elif ladder the tool graded labs with before the engine
+    if missing_count == 0:
+        return "Excellent"
+    elif missing_count >= bad_threshold:
+        return "Bad"
+    else:
+        if lab_name == "Lab 1":
+            if missing_count <= 2:
+                return "Good"
+            else:
+                return "Average"
+        elif lab_name in ["Lab 2", "Lab 3", "Lab 4", "Lab 5"]:
+            if missing_count <= 4:
+                return "Good"
+            else:
+                return "Average"
+        elif lab_name == "Lab 6":
+            if missing_count <= 10:
+                return "Good"
+            elif missing_count <= 16:
+                return "Average"
+            else:
+                return "Bad"
+        elif lab_name == "Lab 7":
+            if missing_count <= 3:
+                return "Good"
+            elif missing_count <= 6:
+                return "Average"
+            else:
+                return "Bad"
+        elif lab_name == "Lab 8":
+            if missing_count <= 10:
+                return "Good"
+            elif missing_count <= 20:
+                return "Average"
+            else:
+                return "Bad"
+        elif lab_name == "Lab 9":
+            if missing_count <= 8:
+                return "Good"
+            elif missing_count <= 12:
+                return "Average"
+            else:
+                return "Bad"
+
+
+@pytest.mark.parametrize("lab", list(lab_criteria))
+def test_grade_lab_matches_ladder_for_every_count(lab):
+    criteria = list(lab_criteria[lab]["bad_criteria"])
+    for count in range(len(criteria) + 1):
+        grade, _ = grade_lab(lab, criteria[:count])
+        assert grade == calculate_lab_grade(count, lab_criteria[lab]["bad_threshold"], lab), count
+
+
+def test_grade_cohort_matches_grade_submission():
+    rng = random.Random(0)
+    keys = list(presentation_options)
+    presentation, labs = [], {lab: [] for lab in lab_criteria}
+    for _ in range(2000):
+        # Vary how much is ticked so every grade band is reached
+        rate = rng.random()
+        presentation.append([key for key in keys if rng.random() < rate / 4])
+        for lab, spec in lab_criteria.items():
+            labs[lab].append([c for c in spec["bad_criteria"] if rng.random() < rate])
+
+    graded = grade_cohort(encode_cohort(presentation, labs))
+    for i, row in enumerate(graded.itertuples(index=False)):
+        result = grade_submission(presentation[i], {lab: labs[lab][i] for lab in lab_criteria})
+        row = row._asdict()
+        assert row["Presentation_Grade"] == result["presentation_grade"]
+        assert row["Presentation_Mark"] == pytest.approx(result["presentation_mark"])
+        for lab in lab_criteria:
+            assert row[f"{lab_column(lab)}_Grade"] == result["lab_grades"][lab]
+            assert row[f"{lab_column(lab)}_Mark"] == pytest.approx(result["lab_marks"][lab])
+        assert row["Total_Marks"] == pytest.approx(result["total_marks"])
+
+
+@pytest.mark.parametrize("lab", list(lab_criteria))
+def test_masks_round_trip_to_criterion_ids(lab):
+    criteria = list(lab_criteria[lab]["bad_criteria"])
+    rng = random.Random(lab)
+    for _ in range(50):
+        missing = rng.sample(criteria, rng.randint(0, len(criteria)))
+        # In rubric order, whatever order they were ticked in
+        assert mask_criteria(lab, lab_mask(lab, missing)) == [c for c in criteria if c in missing]
+    keys = ["medium_font", "bad_filename"]
+    assert mask_presentation(presentation_mask(keys)) == [key for key in presentation_options if key in keys]
+
+
+def test_rewording_criteria_keeps_saved_masks(tmp_path):
+    with open(RUBRIC_PATH, encoding="utf-8") as f:
+        tables = json.load(f)
+    for spec in tables["lab_criteria"].values():
+        spec["bad_criteria"] = {criterion_id: f"{text} (reworded)" for criterion_id, text in spec["bad_criteria"].items()}
+    edited = tmp_path / "rubric.json"
+    edited.write_text(json.dumps(tables), encoding="utf-8")
+    reworded = compile_rubric(str(edited))
+
+    assert reworded.digest != RUBRIC.digest
+    for lab in RUBRIC.labs:
+        missing = list(lab_criteria[lab]["bad_criteria"])[::2]
+        assert lab_mask(lab, missing, reworded) == lab_mask(lab, missing)
+        assert grade_lab(lab, missing, reworded) == grade_lab(lab, missing)
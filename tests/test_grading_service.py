@@ -0,0 +1,44 @@
+"""Request handling of the grading HTTP service."""
+
+import http.client
+import json
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+from grading import RUBRIC
+from grading_service import GradingHandler
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), GradingHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.mark.parametrize("length", ["abc", "-1", "1_0", " "])
+def test_invalid_content_length_is_rejected(server, length):
+    conn = http.client.HTTPConnection(*server.server_address, timeout=5)
+    conn.putrequest("POST", "/grade")
+    conn.putheader("Content-Length", length)
+    conn.endheaders()
+    response = conn.getresponse()
+    assert response.status == 400
+    assert "Content-Length" in json.loads(response.read())["error"]
+    conn.close()
+
+
+def test_valid_request_is_graded(server):
+    conn = http.client.HTTPConnection(*server.server_address, timeout=5)
+    conn.request("POST", "/grade", body=json.dumps({"presentation": [], "labs": {}}))
+    response = conn.getresponse()
+    assert response.status == 200, response.read()
+    result = json.loads(response.read())
+    assert result["total_marks"] == result["max_total"] == RUBRIC.max_total
+    conn.close()
@@ -0,0 +1,21 @@
+"""Compacting the event log."""
+
+import time
+
+import history
+import store
+
+
+def test_compaction_waits_for_enough_old_events(tmp_path):
+    conn = store.connect(str(tmp_path / "marking.db"))
+    store.load_roster(conn, [("1", "Ann")])
+    version = 0
+    for mask in (1, 3, 1, 0):
+        version = store.save_section(conn, "1", "Lab 6", mask, version, "ann")
+    later = time.time() + (history.KEEP_DAYS + 1) * 24 * 60 * 60
+
+    assert history.compact_if_due(conn, min_events=5, now=later) == 0
+    assert history.compact_if_due(conn, min_events=4, now=later) == 3
+    # What compaction keeps does not count towards the next one
+    assert history.compact_if_due(conn, min_events=1, now=later) == 0
+    assert not history.can_undo(conn, "1")
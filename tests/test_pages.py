@@ -0,0 +1,61 @@
+"""Rendering and caching submission pages for the viewer."""
+
+import os
+
+import pymupdf
+import pytest
+
+import pages
+import precheck
+
+
+@pytest.fixture
+def pdf(tmp_path):
+    document = pymupdf.open()
+    for number in range(3):
+        document.new_page().insert_text((40, 60), f"Page {number + 1}")
+    path = str(tmp_path / "1001_Ann_labs6_9.pdf")
+    document.save(path)
+    precheck.scan(str(tmp_path), workers=1)
+    return path
+
+
+@pytest.fixture
+def cache(tmp_path, pdf):
+    cache = pages.PageCache(str(tmp_path), width=200, workers=1)
+    yield cache
+    cache.close()
+
+
+def test_a_student_file_is_found_from_the_precheck_cache(tmp_path, pdf):
+    path, sha256, count = pages.student_file(str(tmp_path), "1001")
+    assert (path, count) == (pdf, 3)
+    assert pages.student_file(str(tmp_path), "1002") is None
+
+
+def test_pages_are_rendered_once_and_kept_on_disk(tmp_path, pdf, cache):
+    _, sha256, _ = pages.student_file(str(tmp_path), "1001")
+    data = cache.get(pdf, sha256, 1, timeout=60)
+    assert data.startswith(b"\xff\xd8")
+    assert cache.get(pdf, sha256, 1) is data
+    assert os.listdir(cache.dir) == [f"{sha256}-1.jpg"]
+
+    # A new cache, e.g. after a restart, reads it back instead of rendering
+    reopened = pages.PageCache(str(tmp_path), width=200, workers=1)
+    try:
+        assert reopened.get(pdf, sha256, 1, timeout=0) == data
+    finally:
+        reopened.close()
+
+
+def test_the_caches_stay_within_their_budgets(tmp_path, pdf):
+    _, sha256, _ = pages.student_file(str(tmp_path), "1001")
+    small = pages.PageCache(str(tmp_path), width=200, memory_bytes=1, disk_bytes=1, workers=1)
+    small.prefetch(pdf, sha256, 3)
+    for number in range(3):
+        small.get(pdf, sha256, number, timeout=60)
+    # Waits for the renders to be filed
+    small.close()
+
+    assert len(small._memory) == 1
+    assert len(os.listdir(small.dir)) <= 1
@@ -0,0 +1,58 @@
+"""Pre-selecting presentation flags from a scanned folder."""
+
+import json
+
+import precheck
+import store
+from grading import compile_rubric, presentation_mask
+from rubric import RUBRIC_PATH
+
+
+def result(file_name, is_pdf=True, pages=10):
+    content = {"is_pdf": is_pdf, "pages": pages}
+    return {"file": file_name, "student_id": precheck.student_id_for(file_name),
+            "flags": precheck.flags_for(file_name, content)}
+
+
+def test_flags_are_decided_per_student(tmp_path):
+    conn = store.connect(str(tmp_path / "marking.db"))
+    store.load_roster(conn, [("1001", "Ann"), ("1002", "Bo")])
+    results = [
+        # A correct PDF plus a stray notes file
+        result("1001_Ann_labs6_9.pdf"),
+        result("1001_notes.txt", is_pdf=False),
+        # Only a misnamed Word document and a misnamed PDF
+        result("1002_report.docx", is_pdf=False),
+        result("1002_report.pdf"),
+    ]
+
+    assert precheck.apply_to_store(conn, results) == ["1002"]
+    assert store.load_student(conn, "1001") == {}
+    mask, _ = store.load_student(conn, "1002")[store.PRESENTATION]
+    assert mask == presentation_mask(["bad_filename"])
+
+
+def test_flags_are_packed_with_the_given_rubric(tmp_path):
+    # An edited rubric file that lists the presentation options in a new order
+    with open(RUBRIC_PATH, encoding="utf-8") as f:
+        tables = json.load(f)
+    tables["presentation_options"] = dict(reversed(tables["presentation_options"].items()))
+    edited = tmp_path / "rubric.json"
+    edited.write_text(json.dumps(tables), encoding="utf-8")
+    rubric = compile_rubric(str(edited))
+
+    conn = store.connect(str(tmp_path / "marking.db"))
+    store.load_roster(conn, [("1002", "Bo")])
+    precheck.apply_to_store(conn, [result("1002_report.pdf")], rubric)
+    mask, _ = store.load_student(conn, "1002")[store.PRESENTATION]
+    assert mask == presentation_mask(["bad_filename"], rubric) != presentation_mask(["bad_filename"])
+
+
+def test_marked_students_are_left_alone(tmp_path):
+    conn = store.connect(str(tmp_path / "marking.db"))
+    store.load_roster(conn, [("1001", "Ann")])
+    # Finished with the presentation untouched, so it has no saved row
+    store.mark_student(conn, "1001", "ann")
+
+    assert precheck.apply_to_store(conn, [result("1001_report.pdf")]) == []
+    assert store.load_student(conn, "1001") == {}
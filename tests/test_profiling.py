@@ -0,0 +1,63 @@
+"""Opt-in section timing."""
+
+import json
+
+import pytest
+
+import profiling
+
+
+@pytest.fixture
+def enabled(monkeypatch, tmp_path):
+    monkeypatch.setattr(profiling, "ENABLED", True)
+    monkeypatch.setattr(profiling, "LOG_PATH", str(tmp_path / "runs.jsonl"))
+    profiling.clear()
+    yield tmp_path / "runs.jsonl"
+    profiling.clear()
+
+
+def test_disabled_timing_costs_nothing(monkeypatch):
+    def work():
+        pass
+
+    monkeypatch.setattr(profiling, "ENABLED", False)
+    assert profiling.timed("work")(work) is work
+    assert profiling.section("a") is profiling.section("b")
+
+
+def test_a_run_records_its_sections(enabled):
+    @profiling.timed("summary")
+    def summary():
+        with profiling.section("feedback"):
+            pass
+
+    profiling.start_run()
+    with profiling.section("presentation"):
+        pass
+    summary()
+    summary()
+    profiling.finish_run()
+
+    [record] = profiling.records()
+    assert record["kind"] == "full"
+    assert set(record["sections"]) == {"presentation", "summary", "feedback"}
+    # Nested sections are part of the enclosing one
+    assert record["sections"]["feedback"] <= record["sections"]["summary"] <= record["total_ms"]
+    rows = {row[0]: row for row in profiling.summary()}
+    assert set(rows) == {"rerun", "presentation", "summary", "feedback"}
+    assert rows["summary"][1] == 1
+    with open(enabled, encoding="utf-8") as f:
+        assert [json.loads(line)["kind"] for line in f] == ["full"]
+
+
+def test_a_download_outside_a_run_is_a_record_of_its_own(enabled):
+    with profiling.section("csv export"):
+        pass
+    profiling.start_run()
+    # A run cut short by st.rerun is dropped
+    profiling.start_run()
+    profiling.finish_run()
+
+    assert [record["kind"] for record in profiling.records()] == ["download", "full"]
+    assert [row[0] for row in profiling.summary("download")] == ["csv export"]
+    assert profiling.dump_jsonl().count("\n") == 2
@@ -0,0 +1,103 @@
+"""Regrading the marked cohort from the command line."""
+
+import json
+import random
+
+import pandas as pd
+import pytest
+
+import cohort
+import regrade
+import store
+from grading import RUBRIC, lab_mask, presentation_mask
+from rubric import RUBRIC_PATH
+
+
+def marked_cohort(path):
+    conn = store.connect(path)
+    store.load_roster(conn, [("1", "Ann"), ("2", "Bo")])
+    store.save_section(conn, "1", store.PRESENTATION, presentation_mask(["medium_font"]), 0, "ann")
+    store.mark_student(conn, "1", "ann")
+    store.mark_student(conn, "2", "ann")
+    return conn
+
+
+def test_presentation_marks_can_be_regraded(tmp_path):
+    db, out = str(tmp_path / "marking.db"), str(tmp_path / "moved.csv")
+    marked_cohort(db)
+
+    assert regrade.main(["--db", db, "--set", "Presentation.Medium=1", "-o", out]) == 0
+    moved = pd.read_csv(out, dtype={"student_id": str}).set_index("student_id")
+    assert list(moved.index) == ["1"]
+    assert moved.loc["1", "Change"] == 0.2
+
+
+def test_only_marked_students_are_regraded(tmp_path):
+    conn = marked_cohort(str(tmp_path / "marking.db"))
+    store.load_roster(conn, [("3", "Cy")])
+    # A pre-check flag alone does not make a student marked
+    store.save_section(conn, "3", store.PRESENTATION, presentation_mask(["bad_filename"]), 0, "precheck")
+
+    assert list(cohort.masks_from_store(conn).index) == ["1", "2"]
+
+
+def random_cohort(n=200):
+    rng = random.Random(13)
+    presentation = [rng.sample(RUBRIC.presentation_keys[1:], rng.randint(0, 2)) for _ in range(n)]
+    labs = {lab: [rng.sample(RUBRIC.criterion_ids[lab], rng.randint(0, len(RUBRIC.criterion_ids[lab])))
+                  for _ in range(n)] for lab in ("Lab 2", "Lab 6")}
+    return cohort.encode_cohort(presentation, labs)
+
+
+def test_regrade_matches_grading_from_scratch():
+    masks = random_cohort()
+    changes = {"Lab 6": {"good_max": 12, "marks": {"Bad": 0.1}}, "Presentation": {"Medium": 1.0}}
+    new = cohort.what_if(RUBRIC, changes)
+
+    regraded, moved = cohort.regrade(masks, RUBRIC, new)
+    pd.testing.assert_frame_equal(regraded, cohort.grade_cohort(masks, new))
+    old = cohort.grade_cohort(masks, RUBRIC)
+    assert list(moved.index) == list(old.index[(regraded["Total_Marks"] - old["Total_Marks"]).round(6) != 0])
+    # The rubric the change was made to is left as it was
+    assert RUBRIC.lab_criteria["Lab 6"]["good_max"] == 10 and RUBRIC.presentation_marks["Medium"] == 0.8
+    assert cohort.changed_sections(RUBRIC, new) == (["Lab 6"], True)
+
+
+def test_an_unchanged_rubric_moves_nobody():
+    masks = random_cohort()
+    regraded, moved = cohort.regrade(masks, RUBRIC, cohort.what_if(RUBRIC, {}))
+    assert moved.empty
+    pd.testing.assert_frame_equal(regraded, cohort.grade_cohort(masks))
+
+
+@pytest.mark.parametrize("text, change", [
+    ("Lab 6.good_max=9", {"Lab 6": {"good_max": 9}}),
+    ("Lab 6.Good=1.2", {"Lab 6": {"marks": {"Good": 1.2}}}),
+    ("Presentation.Bad=0", {"Presentation": {"Bad": 0.0}}),
+])
+def test_changes_are_parsed(text, change):
+    assert regrade.parse_change(text) == change
+
+
+@pytest.mark.parametrize("text", ["Lab 6.good_max", "Lab 99.Good=1", "Lab 6.Medium=1", "Presentation.good_max=1"])
+def test_bad_changes_are_rejected(text):
+    with pytest.raises(ValueError):
+        regrade.parse_change(text)
+
+
+def test_a_new_rubric_file_can_be_compared(tmp_path, capsys):
+    db, out = str(tmp_path / "marking.db"), str(tmp_path / "moved.csv")
+    conn = marked_cohort(db)
+    store.save_section(conn, "2", "Lab 6", lab_mask("Lab 6", RUBRIC.criterion_ids["Lab 6"][:11]), 0, "ann")
+    with open(RUBRIC_PATH, encoding="utf-8") as f:
+        tables = json.load(f)
+    tables["lab_criteria"]["Lab 6"]["good_max"] = 11
+    edited = tmp_path / "rubric.json"
+    edited.write_text(json.dumps(tables), encoding="utf-8")
+
+    assert regrade.main(["--db", db, "--rubric", str(edited), "-o", out]) == 0
+    moved = pd.read_csv(out, dtype={"student_id": str}).set_index("student_id")
+    good, average = RUBRIC.lab_marks["Lab 6"]["Good"], RUBRIC.lab_marks["Lab 6"]["Average"]
+    assert list(moved.index) == ["2"]
+    assert moved.loc["2", "Change"] == pytest.approx(good - average)
+    assert "1 of 2 students' totals moved" in capsys.readouterr().err
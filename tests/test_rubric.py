@@ -0,0 +1,44 @@
+"""Checking rubric files before they are compiled."""
+
+import copy
+import json
+
+import pytest
+
+import rubric
+from grading import RUBRIC, compile_rubric
+
+
+@pytest.fixture
+def tables():
+    with open(rubric.RUBRIC_PATH, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_the_shipped_rubric_is_valid(tables):
+    rubric.check_rubric(tables)
+    assert compile_rubric().digest == RUBRIC.digest
+
+
+@pytest.mark.parametrize("edit, message", [
+    (lambda t: t.pop("lab_marks"), "missing the lab_marks table"),
+    (lambda t: t.update(presentation_marks={}), "missing the presentation_marks table"),
+    (lambda t: t.update(lab_criteria=["Lab 1"]), "missing the lab_criteria table"),
+    (lambda t: t["lab_marks"].pop("Lab 6"), "no marks for Lab 6"),
+    (lambda t: t["lab_criteria"]["Lab 6"].update(bad_criteria=["instance_type"]), "bad_criteria must map"),
+    (lambda t: t["lab_criteria"]["Lab 6"].update(good_max=17), "need 0 <= good_max < bad_threshold"),
+    (lambda t: t["lab_criteria"]["Lab 6"].pop("bad_threshold"), "need 0 <= good_max < bad_threshold"),
+    (lambda t: t["lab_criteria"]["Lab 6"].update(good_max=-1), "need 0 <= good_max < bad_threshold"),
+])
+def test_invalid_tables_are_rejected(tables, edit, message):
+    edited = copy.deepcopy(tables)
+    edit(edited)
+    with pytest.raises(ValueError, match=message):
+        rubric.check_rubric(edited)
+
+
+def test_a_file_that_is_not_json_is_rejected(tmp_path):
+    path = tmp_path / "rubric.json"
+    path.write_text("{not json", encoding="utf-8")
+    with pytest.raises(ValueError):
+        rubric.load_rubric(str(path))
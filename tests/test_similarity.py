@@ -0,0 +1,60 @@
+"""Flagging near-duplicate submissions from their text."""
+
+import random
+
+import pymupdf
+
+import evidence
+import precheck
+import similarity
+
+VOCABULARY = ["instance", "bucket", "lambda", "deploy", "server", "region", "policy", "table", "query", "route",
+              "cache", "queue", "image", "volume", "subnet", "gateway", "metric", "alarm", "script", "build"]
+
+
+def essay(seed, words=300):
+    rng = random.Random(seed)
+    return [rng.choice(VOCABULARY) for _ in range(words)]
+
+
+def write_pdf(path, words, fontsize=9):
+    document = pymupdf.open()
+    page = document.new_page()
+    for i in range(0, len(words), 10):
+        page.insert_text((40, 40 + 14 * i // 10), " ".join(words[i:i + 10]), fontsize=fontsize)
+    document.save(path)
+
+
+def test_a_lightly_edited_copy_is_a_near_duplicate():
+    original = essay(1)
+    edited = list(original)
+    for i in range(0, len(edited), 60):
+        edited[i] = "edited"
+    signatures = {
+        name: similarity.minhash(similarity.shingle_hashes(" ".join(words)))
+        for name, words in (("original", original), ("edited", edited), ("other", essay(2)))
+    }
+
+    [(a, b, estimate)] = similarity.near_duplicates(signatures)
+    assert (a, b) == ("edited", "original")
+    assert estimate >= similarity.THRESHOLD
+
+
+def test_short_texts_are_not_compared(tmp_path):
+    original = essay(1)
+    write_pdf(str(tmp_path / "1001_Ann_labs6_9.pdf"), original)
+    write_pdf(str(tmp_path / "1002_Bo_labs6_9.pdf"), original[:-1] + ["edited"])
+    write_pdf(str(tmp_path / "1003_Cy_labs6_9.pdf"), essay(2))
+    # Two different files with the same text, far too short to say anything about the work
+    cover = ["screenshots", "attached", "for", "lab", "six", "as", "asked"]
+    write_pdf(str(tmp_path / "1004_Di_labs6_9.pdf"), cover)
+    write_pdf(str(tmp_path / "1005_Ed_labs6_9.pdf"), cover, fontsize=12)
+    results, _ = precheck.scan(str(tmp_path), workers=1)
+    evidence.index_folder(str(tmp_path), results, workers=1)
+
+    pairs = similarity.find_similar(str(tmp_path), results, workers=1)
+    assert [{a, b} for a, b, _ in pairs] == [{"1001_Ann_labs6_9.pdf", "1002_Bo_labs6_9.pdf"}]
+    signatures, _ = similarity.sign_folder(str(tmp_path), results, workers=1)
+    assert len(signatures) == 3
+    flags = similarity.load_flags(similarity.flags_path(str(tmp_path)))
+    assert set(flags) == {"1001", "1002"}
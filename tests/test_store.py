@@ -0,0 +1,59 @@
+"""Claims, versioned saves and the roster in the shared store."""
+
+import pytest
+
+import store
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = store.connect(str(tmp_path / "marking.db"))
+    store.load_roster(conn, [("1", "Ann"), ("2", "Bo")])
+    yield conn
+    conn.close()
+
+
+def test_a_stale_save_is_a_conflict(tmp_path, conn):
+    other = store.connect(str(tmp_path / "marking.db"))
+    assert store.save_section(conn, "1", "Lab 6", 1, 0, "ann") == 1
+    # Both saves start from nothing saved; the second loses
+    with pytest.raises(store.ConflictError):
+        store.save_section(other, "1", "Lab 6", 2, 0, "bo")
+    assert store.save_section(conn, "1", "Lab 6", 3, 1, "ann") == 2
+    with pytest.raises(store.ConflictError):
+        store.save_section(other, "1", "Lab 6", 2, 1, "bo")
+
+    assert store.load_student(other, "1") == {"Lab 6": (3, 2)}
+
+
+def test_claims_are_held_renewed_and_released(conn):
+    assert store.claim_student(conn, "1", "ann") == "ann"
+    assert store.claim_student(conn, "1", "bo") == "ann"
+    assert store.claim_student(conn, "1", "ann") == "ann"
+    # Only the holder can release a claim
+    store.release_student(conn, "1", "bo")
+    assert store.claim_student(conn, "1", "bo") == "ann"
+    store.release_student(conn, "1", "ann")
+    assert store.claim_student(conn, "1", "bo") == "bo"
+
+
+def test_a_lapsed_claim_can_be_taken(conn):
+    assert store.claim_student(conn, "1", "ann", ttl=-1) == "ann"
+    assert store.claim_student(conn, "1", "bo") == "bo"
+
+
+def test_reloading_the_roster_keeps_the_order(conn):
+    store.load_roster(conn, [("3", "Cy"), ("1", "Annie")])
+    assert store.roster(conn) == [("1", "Annie"), ("2", "Bo"), ("3", "Cy")]
+
+
+def test_the_pool_rolls_back_what_a_session_left_open(tmp_path):
+    pool = store.ConnectionPool(str(tmp_path / "marking.db"), size=1)
+    with pytest.raises(RuntimeError):
+        with pool.connection() as conn:
+            conn.execute("BEGIN")
+            conn.execute("INSERT INTO students (student_id, position) VALUES ('1', 0)")
+            raise RuntimeError
+    with pool.connection() as conn:
+        assert not conn.in_transaction
+        assert store.roster(conn) == []